@@ -0,0 +1,144 @@
+import os
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+from dotenv import load_dotenv
+from model_scheduler import model_scheduler
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Share of a class's limits at which it starts degrading (e.g. shorter chat answers)
+ADMISSION_DEGRADE_AT = float(os.getenv("ADMISSION_DEGRADE_AT", "0.6"))
+
+
+@dataclass
+class AdmissionPolicy:
+    """Load limits for one call class"""
+    max_inflight: int           # admitted and not finished (queued for the model or running)
+    max_queue_wait_ms: int      # shed once the oldest queued call has waited this long
+    degraded_max_tokens: Optional[int] = None
+
+
+# Same classes as the model scheduler; queue-wait limits sit below its deadlines
+# so new work is turned away before it would only time out in the queue
+ADMISSION_POLICIES: Dict[str, AdmissionPolicy] = {
+    "inline": AdmissionPolicy(
+        int(os.getenv("ADMISSION_INLINE_MAX_INFLIGHT", "48")),
+        int(os.getenv("ADMISSION_INLINE_MAX_QUEUE_WAIT_MS", "100")),
+    ),
+    "menu": AdmissionPolicy(
+        int(os.getenv("ADMISSION_MENU_MAX_INFLIGHT", "24")),
+        int(os.getenv("ADMISSION_MENU_MAX_QUEUE_WAIT_MS", "750")),
+    ),
+    "chat": AdmissionPolicy(
+        int(os.getenv("ADMISSION_CHAT_MAX_INFLIGHT", "18")),
+        int(os.getenv("ADMISSION_CHAT_MAX_QUEUE_WAIT_MS", "8000")),
+        int(os.getenv("ADMISSION_CHAT_DEGRADED_MAX_TOKENS", "512")),
+    ),
+    "file": AdmissionPolicy(
+        int(os.getenv("ADMISSION_FILE_MAX_INFLIGHT", "6")),
+        int(os.getenv("ADMISSION_FILE_MAX_QUEUE_WAIT_MS", "20000")),
+    ),
+}
+
+
+class AdmissionRejected(Exception):
+    """The call class is overloaded; the request was shed without queueing."""
+
+    def __init__(self, call_class: str, reason: str):
+        super().__init__(f"Service overloaded for '{call_class}' requests: {reason}")
+        self.call_class = call_class
+        self.reason = reason
+
+
+@dataclass
+class AdmissionTicket:
+    call_class: str
+    pressure: float   # max of in-flight and queue-wait utilisation at admission (1.0 = limit)
+    degraded: bool
+    max_tokens: Optional[int] = None  # set when degraded: cap the answer length
+
+
+@dataclass
+class _ClassStats:
+    inflight: int = 0
+    admitted: int = 0
+    degraded: int = 0
+    shed: int = 0
+
+
+class AdmissionController:
+    """
+    Load shedding in front of the model scheduler.
+
+    Each call class has a cap on in-flight requests and on how long the oldest
+    queued model call has been waiting. A request arriving when either is at
+    its limit is rejected immediately instead of joining a queue it would only
+    time out in: failing a few requests fast keeps latency sane for the rest.
+    Between ADMISSION_DEGRADE_AT and the limit, requests are admitted degraded
+    (chat gets a smaller max_tokens so slots turn over faster).
+    """
+
+    def __init__(self, policies: Dict[str, AdmissionPolicy] = ADMISSION_POLICIES, degrade_at: float = ADMISSION_DEGRADE_AT):
+        self.policies = policies
+        self.degrade_at = degrade_at
+        self._stats: Dict[str, _ClassStats] = {name: _ClassStats() for name in policies}
+
+    def pressure(self, call_class: str) -> float:
+        policy = self.policies[call_class]
+        inflight = self._stats[call_class].inflight / max(1, policy.max_inflight)
+        waiting = model_scheduler.oldest_wait_ms(call_class) / max(1, policy.max_queue_wait_ms)
+        return max(inflight, waiting)
+
+    @contextmanager
+    def admit(self, call_class: str) -> Iterator[AdmissionTicket]:
+        """`with admission.admit("chat") as ticket: ...`; raises AdmissionRejected when shedding."""
+        policy = self.policies[call_class]
+        stats = self._stats[call_class]
+        pressure = self.pressure(call_class)
+        if pressure >= 1.0:
+            stats.shed += 1
+            if stats.inflight >= policy.max_inflight:
+                reason = f"{stats.inflight} requests in flight"
+            else:
+                reason = f"queue wait above {policy.max_queue_wait_ms}ms"
+            logger.info(f"Shed {call_class} request: {reason}")
+            raise AdmissionRejected(call_class, reason)
+
+        degraded = pressure >= self.degrade_at and policy.degraded_max_tokens is not None
+        ticket = AdmissionTicket(
+            call_class, pressure, degraded, policy.degraded_max_tokens if degraded else None
+        )
+        stats.inflight += 1
+        stats.admitted += 1
+        if degraded:
+            stats.degraded += 1
+        try:
+            yield ticket
+        finally:
+            stats.inflight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "degrade_at": self.degrade_at,
+            "classes": {
+                name: {
+                    "max_inflight": self.policies[name].max_inflight,
+                    "max_queue_wait_ms": self.policies[name].max_queue_wait_ms,
+                    "inflight": s.inflight,
+                    "oldest_queue_wait_ms": round(model_scheduler.oldest_wait_ms(name), 1),
+                    "queue_wait_ms_avg": round(model_scheduler.queue_wait_ms(name), 1),
+                    "pressure": round(self.pressure(name), 3),
+                    "admitted": s.admitted,
+                    "degraded": s.degraded,
+                    "shed": s.shed,
+                }
+                for name, s in self._stats.items()
+            },
+        }
+
+
+# Global singleton
+admission = AdmissionController()
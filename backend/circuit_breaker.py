@@ -0,0 +1,140 @@
+import os
+import time
+import random
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_BASE_BACKOFF_SECONDS = float(os.getenv("BREAKER_BASE_BACKOFF_SECONDS", "5"))
+BREAKER_MAX_BACKOFF_SECONDS = float(os.getenv("BREAKER_MAX_BACKOFF_SECONDS", "120"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for one upstream provider.
+
+    Closed: calls flow; outcomes are kept for the last BREAKER_WINDOW_SECONDS.
+    Once the window holds at least BREAKER_MIN_CALLS and the failure share
+    reaches BREAKER_FAILURE_RATE the breaker opens and calls are refused.
+    After a jittered backoff a single probe is let through (half-open): success
+    closes the breaker, failure re-opens it with the backoff doubled (capped).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = BREAKER_WINDOW_SECONDS,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        base_backoff: float = BREAKER_BASE_BACKOFF_SECONDS,
+        max_backoff: float = BREAKER_MAX_BACKOFF_SECONDS,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.state = CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._backoff = base_backoff
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._opened_count = 0
+        self._rejected = 0
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        # Full jitter in [backoff/2, backoff] so instances don't probe in lockstep
+        delay = random.uniform(self._backoff / 2, self._backoff)
+        self.state = OPEN
+        self._open_until = now + delay
+        self._probe_in_flight = False
+        self._opened_count += 1
+        logger.warning(f"⚠️ Circuit for '{self.name}' opened for {delay:.1f}s")
+
+    @property
+    def available(self) -> bool:
+        """Would a call be let through now? (does not claim the half-open probe)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() >= self._open_until
+        return not self._probe_in_flight
+
+    def allow(self) -> bool:
+        """Claim permission for one call; call record_success/record_failure afterwards."""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == OPEN and now >= self._open_until:
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self._rejected += 1
+        return False
+
+    def release(self) -> None:
+        """The permitted call ended without a verdict (e.g. cancelled); free the probe slot."""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            logger.info(f"✅ Circuit for '{self.name}' closed after successful probe")
+            self.state = CLOSED
+            self._outcomes.clear()
+            self._backoff = self.base_backoff
+            self._probe_in_flight = False
+            return
+        self._outcomes.append((now, True))
+        self._trim(now)
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self._outcomes.append((now, False))
+        self._trim(now)
+        calls = len(self._outcomes)
+        if calls >= self.min_calls:
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if failures / calls >= self.failure_rate:
+                self._open(now)
+
+    def get_state(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._trim(now)
+        calls = len(self._outcomes)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_failure_rate": round(failures / calls, 3) if calls else 0.0,
+            "retry_in_seconds": round(max(0.0, self._open_until - now), 1) if self.state == OPEN else 0.0,
+            "backoff_seconds": round(self._backoff, 1),
+            "times_opened": self._opened_count,
+            "rejected_calls": self._rejected,
+        }
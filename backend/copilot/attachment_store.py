@@ -0,0 +1,206 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+from redis_client import redis_client
+from database.connection import db_client
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Local cache only: the text is kept in Redis (shared) and persisted to Postgres
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "./attachments")
+ATTACHMENT_MAX_CHARS = int(os.getenv("ATTACHMENT_MAX_CHARS", "50000"))
+ATTACHMENT_MEMORY_CACHE_ITEMS = int(os.getenv("ATTACHMENT_MEMORY_CACHE_ITEMS", "64"))
+
+# What a session stores instead of the attachment text
+_REFERENCE_RE = re.compile(r"^\[Attachment: (?P<name>.*)\]\n@attachment:(?P<hash>[0-9a-f]{64})$")
+
+
+class AttachmentStore:
+    """
+    Content-addressed store for extracted attachment text.
+
+    Uploads are keyed by the sha256 of their bytes, so the same file uploaded
+    to many sessions is extracted and stored once. Sessions keep only a short
+    reference message (a system message written by the server) that is
+    resolved when the prompt or history is assembled.
+
+    The text lives in Redis next to the live sessions (any host can read it)
+    and is written to Postgres (public.attachments) in the same transaction
+    as the messages that reference it. Memory and ATTACHMENT_DIR are per-host
+    caches in front of both.
+    """
+
+    def __init__(self, root: str = ATTACHMENT_DIR):
+        self.root = root
+        self._memory: "OrderedDict[str, str]" = OrderedDict()  # hash -> text, LRU
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._hits = 0
+        self._extractions = 0
+
+    # Keys & references
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def reference(name: str, content_hash: str) -> str:
+        return f"[Attachment: {name}]\n@attachment:{content_hash}"
+
+    @staticmethod
+    def parse_reference(content: str) -> Optional[Tuple[str, str]]:
+        """(name, hash) if `content` is an attachment reference."""
+        m = _REFERENCE_RE.match(content or "")
+        return (m.group("name"), m.group("hash")) if m else None
+
+    # Storage
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}.txt")
+
+    @staticmethod
+    def _redis_key(content_hash: str) -> str:
+        return f"attachment:{content_hash}"
+
+    def _read_cached(self, content_hash: str) -> Optional[str]:
+        try:
+            with open(self._path(content_hash), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_cached(self, content_hash: str, text: str) -> None:
+        path = self._path(content_hash)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)  # atomic: readers never see partial text
+        except OSError as e:
+            logger.warning(f"Attachment cache write failed for {content_hash[:12]}: {e}")
+
+    def _remember(self, content_hash: str, text: str) -> None:
+        self._memory[content_hash] = text
+        self._memory.move_to_end(content_hash)
+        while len(self._memory) > ATTACHMENT_MEMORY_CACHE_ITEMS:
+            self._memory.popitem(last=False)
+
+    async def get_text(self, content_hash: str) -> Optional[str]:
+        """Memory, then the local cache, then Redis, then Postgres."""
+        text = self._memory.get(content_hash)
+        if text is not None:
+            self._memory.move_to_end(content_hash)
+            return text
+        text = await asyncio.to_thread(self._read_cached, content_hash)
+        if text is None and redis_client.is_connected:
+            text = await redis_client.get(self._redis_key(content_hash))
+        if text is None and db_client.is_connected:
+            text = await db_client.get_attachment_text(content_hash)
+            if text is not None and redis_client.is_connected:
+                await redis_client.set_with_expiry(self._redis_key(content_hash), text, redis_client.chat_ttl)
+        if text is None:
+            return None
+        await asyncio.to_thread(self._write_cached, content_hash, text)
+        self._remember(content_hash, text)
+        return text
+
+    async def put_text(self, content_hash: str, text: str) -> None:
+        # Shared copy first: the reference may be read (or persisted) by another host
+        if redis_client.is_connected:
+            await redis_client.set_with_expiry(self._redis_key(content_hash), text, redis_client.chat_ttl)
+        await asyncio.to_thread(self._write_cached, content_hash, text)
+        self._remember(content_hash, text)
+
+    async def texts_for(self, messages: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+        """sha256 -> text of the attachments referenced by `messages`, for persisting them together."""
+        texts: Dict[str, str] = {}
+        for m in messages:
+            ref = self.parse_reference(m.get("content")) if m.get("role") == "system" else None
+            if ref is None or ref[1] in texts:
+                continue
+            text = await self.get_text(ref[1])
+            if text is None:
+                logger.warning(f"Attachment {ref[1][:12]} ({ref[0]}) not found while persisting")
+                continue
+            texts[ref[1]] = text
+        return texts
+
+    async def get_or_extract(self, data: bytes, extract: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """
+        (hash, text) for uploaded bytes; `extract` runs only if this content was
+        never seen, and concurrent uploads of the same content share one run.
+        Failed extractions ("[Error ...") are returned but not stored.
+        """
+        content_hash = self.content_hash(data)
+        text = await self.get_text(content_hash)
+        if text is not None:
+            self._hits += 1
+            await self.put_text(content_hash, text)  # refresh the shared copy for this new reference
+            return content_hash, text
+
+        pending = self._inflight.get(content_hash)
+        if pending is not None:
+            return content_hash, await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[content_hash] = future
+        try:
+            self._extractions += 1
+            text = ((await extract()) or "")[:ATTACHMENT_MAX_CHARS]
+            if text and not text.startswith("[Error"):
+                await self.put_text(content_hash, text)
+            future.set_result(text)
+            return content_hash, text
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved: waiters (if any) re-raise it themselves
+            raise
+        finally:
+            self._inflight.pop(content_hash, None)
+
+    async def store_text(self, text: str) -> str:
+        """Store already-extracted text (inline uploads); returns its hash."""
+        text = text[:ATTACHMENT_MAX_CHARS]
+        content_hash = self.content_hash(text.encode("utf-8"))
+        await self.put_text(content_hash, text)
+        return content_hash
+
+    async def resolve(self, role: str, content: str) -> str:
+        """
+        Expand an attachment reference to the full message; other content is
+        returned as is. Only system messages (written by the server) are
+        expanded, so typing a reference into a user message reads nothing.
+        """
+        ref = self.parse_reference(content) if role == "system" else None
+        if ref is None:
+            return content
+        name, content_hash = ref
+        text = await self.get_text(content_hash)
+        if text is None:
+            logger.warning(f"Attachment {content_hash[:12]} ({name}) is no longer stored")
+            text = "[Attachment content is no longer available]"
+        return f"[Attachment: {name}]\n{text}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "extractions": self._extractions,
+            "dedup_hits": self._hits,
+            "memory_cached": len(self._memory),
+            "inflight": len(self._inflight),
+        }
+
+
+# Global singleton
+attachment_store = AttachmentStore()
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body, Query
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body, Query, WebSocket, WebSocketDisconnect, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from database.schema import (
     ChatRequest, ChatResponse,
     CodeCompletionRequest, CodeCompletionResponse,
@@ -6,11 +8,25 @@ from database.schema import (
     StartChatRequest, LoadChatRequest, CloseChatRequest, ChatHistoryItem, ChatSession,
     BulkSessionOperation, SessionStatus, SessionInfo,
     HealthCheckResponse, AppConfig,
+    DocumentOpenRequest, DocumentChangeRequest, DocumentCloseRequest, DocumentSyncResponse,
+    WorkspaceSyncRequest, WorkspaceSyncResponse,
+    WorkspaceBlobUploadRequest, WorkspaceBlobUploadResponse,
+    ChatSearchHit, ChatSearchResponse, ChatSessionHistoryResponse,
 )
-from .copilot_service import ChatService, code_completion_service, FileService
-from model import ai_model
+from .copilot_service import ChatService, code_completion_service, FileService, project_watcher
+from .workspace_store import workspace_store
+from .attachment_store import attachment_store
+from .document_mirror import document_mirror, DocumentSyncError
+from model_registry import ai_model, NoProviderAvailable
+from model_scheduler import model_scheduler, SchedulerRejected
+from rate_limiter import rate_limiter, RateLimitDecision
+from admission import admission, AdmissionRejected
 from redis_client import redis_client
+from message_codec import message_codec
+from session_persister import session_persister
 from database.connection import db_client
+import os
+import asyncio
 import logging
 import datetime
 from typing import List, Optional
@@ -24,15 +40,39 @@ logger = logging.getLogger(__name__)
 chat_router = APIRouter(prefix="/api/v1", tags=["Chat"])
 code_router = APIRouter(prefix="/api/v1", tags=["Code Completion"])
 health_router = APIRouter(prefix="/api/v1", tags=["Health"])
+workspace_router = APIRouter(prefix="/api/v1", tags=["Workspace"])
 
 # App configuration
 app_config = AppConfig()
 
+# Concurrent completions allowed per WebSocket connection
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT_COMPLETIONS", "8"))
+
 def generate_session_id():
     timestamp = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
     unique_id = str(uuid.uuid4())
     return f"{timestamp}-{unique_id}"
 
+async def enforce_rate_limit(
+    user_id: str, route_class: str, response: Optional[Response] = None, cost: int = 1
+) -> RateLimitDecision:
+    """Spend `cost` tokens from the user's bucket; 429 with Retry-After when it is empty."""
+    decision = await rate_limiter.check(user_id, route_class, cost)
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for {route_class} requests, retry in {decision.retry_after:.1f}s",
+            headers=decision.headers(),
+        )
+    if response is not None:
+        response.headers.update(decision.headers())
+    return decision
+
+def count_attachments(files: Optional[List[UploadFile]], inline_files: Optional[str]) -> int:
+    if files:
+        return sum(1 for f in files if f and getattr(f, "filename", None))
+    return 1 if inline_files else 0
+
 # # A) JSON route (no files) — Content-Type: application/json
 # @chat_router.post("/chat", response_model=ChatResponse)
 # async def chat_json(request: ChatRequest):
@@ -51,31 +91,13 @@ def generate_session_id():
 #         logger.error(f"/chat (json) error: {e}")
 #         raise HTTPException(status_code=500, detail="Internal server error")
 
-@chat_router.post("/chat/form", response_model=ChatResponse)
-async def chat_form(
-    text: str = Form(...),
-    user_id: str = Form(...),
-    files: List[UploadFile] = File(None),
-    session_id: Optional[str] = Form(None),  
-    inline_files: Optional[str] = Form(None),
-):
-    """
-    Fixed version: Don't generate new session_id each time.
-    Use the session_id from frontend, or generate only if truly missing.
-    """
-    
-    # Only generate if not provided
-    if not session_id:
-        session_id = generate_session_id()
-        logger.info(f"Generated new session_id: {session_id}")
-    else:
-        logger.info(f"Using existing session_id: {session_id}")
-
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="Message text cannot be empty.")
-    if len(text) > 50_000:
-        raise HTTPException(status_code=400, detail="Message too long (max 50k characters).")
-
+async def store_chat_attachments(
+    session_id: str,
+    user_id: str,
+    files: Optional[List[UploadFile]],
+    inline_files: Optional[str],
+) -> None:
+    """Extract uploaded files (or the inline-text fallback) into system messages for the session."""
     # 1) Handle uploaded files - store as system messages
     had_extracted = False
     if files:
@@ -85,18 +107,21 @@ async def chat_form(
             raw = await f.read()
             if not raw:
                 continue
-            extracted = await FileService.extract_text_from_bytes(
-                raw, f.content_type or "application/octet-stream", f.filename
+            # Extracted once per distinct content (sha256), whichever session uploads it
+            content_hash, extracted = await attachment_store.get_or_extract(
+                raw,
+                lambda: FileService.extract_text_from_bytes(
+                    raw, f.content_type or "application/octet-stream", f.filename
+                ),
             )
             if extracted:
                 had_extracted = True
-                excerpt = extracted[:50_000]
-                # Store file content as system message
+                # Store a reference as system message; the text is resolved when the prompt is built
                 await ChatService.store_message(
                     session_id=session_id,
                     user_id=user_id,
                     role="system",
-                    content=f"[Attachment: {f.filename}]\n{excerpt}",
+                    content=attachment_store.reference(f.filename, content_hash),
                 )
                 logger.info(f"Stored file {f.filename} as system message in session {session_id}")
 
@@ -106,30 +131,142 @@ async def chat_form(
             items: list[dict[str, Any]] = json.loads(inline_files)
             for item in items:
                 name = item.get("name") or "attachment"
-                text_body = (item.get("text") or "")[:50_000]
+                text_body = item.get("text") or ""
                 if text_body:
                     await ChatService.store_message(
                         session_id=session_id,
                         user_id=user_id,
                         role="system",
-                        content=f"[Attachment: {name}]\n{text_body}",
+                        content=attachment_store.reference(name, await attachment_store.store_text(text_body)),
                     )
                     logger.info(f"Stored inline file {name} as system message in session {session_id}")
         except Exception as e:
             logger.error(f"Error processing inline files: {e}")
 
+@chat_router.post("/chat/form", response_model=ChatResponse)
+async def chat_form(
+    response: Response,
+    text: str = Form(...),
+    user_id: str = Form(...),
+    files: List[UploadFile] = File(None),
+    session_id: Optional[str] = Form(None),  
+    inline_files: Optional[str] = Form(None),
+):
+    """
+    Fixed version: Don't generate new session_id each time.
+    Use the session_id from frontend, or generate only if truly missing.
+    """
+    
+    # Only generate if not provided
+    if not session_id:
+        session_id = generate_session_id()
+        logger.info(f"Generated new session_id: {session_id}")
+    else:
+        logger.info(f"Using existing session_id: {session_id}")
+
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Message text cannot be empty.")
+    if len(text) > 50_000:
+        raise HTTPException(status_code=400, detail="Message too long (max 50k characters).")
+
+    # "chat" first: a request it rejects must not have spent "file" tokens
+    await enforce_rate_limit(user_id, "chat", response)
+    attachments = count_attachments(files, inline_files)
+    if attachments:
+        await enforce_rate_limit(user_id, "file", cost=attachments)
+
+    # 1) Store uploaded / inline files as system messages
+    await store_chat_attachments(session_id, user_id, files, inline_files)
+
     # 2) Process chat with the existing session_id
     request = ChatRequest(text=text.strip(), session_id=session_id, user_id=user_id)
-    response = await ChatService.process_chat_request(request)
+    try:
+        chat_response = await ChatService.process_chat_request(request)
+    except (AdmissionRejected, SchedulerRejected, NoProviderAvailable) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     
     # Ensure session_id is returned so frontend can track it
-    response.session_id = session_id
-    return response
+    chat_response.session_id = session_id
+    return chat_response
 
-@code_router.post("/code-completion", response_model=CodeCompletionResponse)
-async def code_completion(request: CodeCompletionRequest):
-    """Handle code completion requests."""
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@chat_router.post("/chat/stream")
+async def chat_stream(
+    http_request: Request,
+    text: str = Form(...),
+    user_id: str = Form(...),
+    files: List[UploadFile] = File(None),
+    session_id: Optional[str] = Form(None),
+    inline_files: Optional[str] = Form(None),
+):
+    """
+    Same input as /chat/form, answered as Server-Sent Events:
+      event: token  data: {"text": "..."}          (repeated)
+      event: done   data: ChatResponse fields       (turn stored in Redis)
+      event: error  data: {"detail", "status"}
+    """
+    if not session_id:
+        session_id = generate_session_id()
+        logger.info(f"Generated new session_id: {session_id}")
+
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Message text cannot be empty.")
+    if len(text) > 50_000:
+        raise HTTPException(status_code=400, detail="Message too long (max 50k characters).")
+
+    # "chat" first: a request it rejects must not have spent "file" tokens
+    decision = await enforce_rate_limit(user_id, "chat")
+    attachments = count_attachments(files, inline_files)
+    if attachments:
+        await enforce_rate_limit(user_id, "file", cost=attachments)
+
+    await store_chat_attachments(session_id, user_id, files, inline_files)
+    request = ChatRequest(text=text.strip(), session_id=session_id, user_id=user_id)
+
+    async def events():
+        stream = ChatService.stream_chat_request(request)
+        try:
+            async for event, data in stream:
+                if await http_request.is_disconnected():
+                    logger.info(f"Chat stream client disconnected (session {session_id})")
+                    return
+                yield sse_event(event, data)
+        except (AdmissionRejected, SchedulerRejected, NoProviderAvailable) as e:
+            yield sse_event("error", {"detail": str(e), "status": 503})
+        except Exception as e:
+            logger.error(f"/chat/stream error: {e}")
+            yield sse_event("error", {"detail": str(e), "status": 500})
+        finally:
+            # Closes the provider stream if we stopped early
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id,
+            **decision.headers(),
+        },
+    )
+
+async def run_code_completion(
+    request: CodeCompletionRequest, response: Optional[Response] = None
+) -> CodeCompletionResponse:
+    """Shared by the HTTP route and the WebSocket channel; errors surface as HTTPException."""
     try:
+        await enforce_rate_limit(request.user_id, "completion", response)
+        if request.document_id:
+            try:
+                code_completion_service.resolve_document_request(request)
+            except DocumentSyncError as e:
+                if not request.text:
+                    # Client re-opens the document (or falls back to a full payload)
+                    raise HTTPException(status_code=409, detail=str(e))
+                # Not mirrored (evicted, or too large): complete with the prefix/suffix the request carries
+                logger.debug(f"Completing without mirror: {e}")
+
         logger.info(f"Code completion request - Language: {request.language}, Text length: {len(request.text)}")
         logger.debug(f"Code completion context: {request.context}")
 
@@ -155,7 +292,144 @@ async def code_completion(request: CodeCompletionRequest):
     except Exception as e:
         logger.error(f"Code completion error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Code completion failed: {str(e)}")
-    
+
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.1"))
+
+async def cancel_on_disconnect(http_request: Request, task: asyncio.Task) -> None:
+    """Cancel `task` as soon as the client goes away (editor discarded the request)."""
+    while not task.done():
+        if await http_request.is_disconnected():
+            task.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+@code_router.post("/code-completion", response_model=CodeCompletionResponse)
+async def code_completion(request: CodeCompletionRequest, http_request: Request, response: Response):
+    """Handle code completion requests; the model call is cancelled if the client disconnects."""
+    task = asyncio.create_task(run_code_completion(request, response))
+    watcher = asyncio.create_task(cancel_on_disconnect(http_request, task))
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            task.cancel()
+            raise
+        logger.debug(f"Code completion cancelled by client disconnect ({request.user_id})")
+        # Nobody is listening; 499 = client closed request
+        return Response(status_code=499)
+    finally:
+        watcher.cancel()
+
+@code_router.websocket("/ws/completions")
+async def completion_socket(websocket: WebSocket):
+    """
+    Long-lived completion channel. JSON frames, correlated by "id":
+      -> {"type": "complete", "id", "payload": CodeCompletionRequest}
+      -> {"type": "cancel", "id"}
+      -> {"type": "document.open" | "document.change" | "document.close", "id", "payload"}
+      -> {"type": "ping"}
+      <- {"type": "result", "id", ...CodeCompletionResponse}
+      <- {"type": "ack", "id", ...}      (document operations)
+      <- {"type": "error", "id", "status", "detail", "retry_after"?}   (retry_after on 429)
+      <- {"type": "cancelled", "id"}
+    Completions run concurrently; document operations are applied in arrival
+    order so a completion always sees the edits sent before it.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def send(message: Dict[str, Any]) -> None:
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def complete(msg_id: str, payload: Dict[str, Any]) -> None:
+        try:
+            request = CodeCompletionRequest.model_validate(payload)
+            response = await run_code_completion(request)
+            await send({"type": "result", "id": msg_id, **response.model_dump(mode="json")})
+        except asyncio.CancelledError:
+            try:
+                await send({"type": "cancelled", "id": msg_id})
+            except Exception:
+                pass
+            raise
+        except ValidationError as e:
+            await send({"type": "error", "id": msg_id, "status": 422, "detail": e.errors(include_url=False, include_context=False)})
+        except HTTPException as e:
+            error = {"type": "error", "id": msg_id, "status": e.status_code, "detail": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                error["retry_after"] = int(e.headers["Retry-After"])
+            await send(error)
+        except Exception as e:
+            logger.error(f"WebSocket completion error: {e}", exc_info=True)
+            await send({"type": "error", "id": msg_id, "status": 500, "detail": "Code completion failed"})
+        finally:
+            # A re-used id may already map to the newer request: only remove our own entry
+            if tasks.get(msg_id) is asyncio.current_task():
+                del tasks[msg_id]
+
+    def document_op(msg_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if msg_type == "document.open":
+            req = DocumentOpenRequest.model_validate(payload)
+            doc = document_mirror.open(
+                user_id=req.user_id, document_id=req.document_id, version=req.version, text=req.text,
+                language=req.language, file_path=req.file_path, workspace_id=req.workspace_id,
+            )
+        elif msg_type == "document.change":
+            req = DocumentChangeRequest.model_validate(payload)
+            doc = document_mirror.apply_changes(
+                user_id=req.user_id, document_id=req.document_id, base_version=req.base_version,
+                version=req.version, changes=[c.model_dump() for c in req.changes],
+            )
+        else:
+            req = DocumentCloseRequest.model_validate(payload)
+            return {"document_id": req.document_id, "closed": document_mirror.close(req.user_id, req.document_id)}
+        return DocumentSyncResponse(document_id=doc.document_id, version=doc.version, length=len(doc.text)).model_dump()
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = json.loads(raw)
+                msg_type = message.get("type")
+                msg_id = str(message.get("id", ""))
+                payload = message.get("payload") or {}
+            except (ValueError, AttributeError):
+                await send({"type": "error", "id": None, "status": 400, "detail": "Malformed frame"})
+                continue
+
+            if msg_type == "ping":
+                await send({"type": "pong"})
+            elif msg_type == "cancel":
+                task = tasks.get(msg_id)
+                if task:
+                    task.cancel()
+            elif msg_type == "complete":
+                if len(tasks) >= WS_MAX_INFLIGHT:
+                    await send({"type": "error", "id": msg_id, "status": 429, "detail": "Too many in-flight completions"})
+                    continue
+                previous = tasks.pop(msg_id, None)
+                if previous:
+                    previous.cancel()  # re-used id supersedes the old request
+                tasks[msg_id] = asyncio.create_task(complete(msg_id, payload))
+            elif msg_type in ("document.open", "document.change", "document.close"):
+                try:
+                    await send({"type": "ack", "id": msg_id, **document_op(msg_type, payload)})
+                except DocumentSyncError as e:
+                    await send({"type": "error", "id": msg_id, "status": 409, "detail": str(e)})
+                except ValidationError as e:
+                    await send({"type": "error", "id": msg_id, "status": 422, "detail": e.errors(include_url=False, include_context=False)})
+                except ValueError as e:
+                    await send({"type": "error", "id": msg_id, "status": 413, "detail": str(e)})
+            else:
+                await send({"type": "error", "id": msg_id, "status": 400, "detail": f"Unknown frame type: {msg_type}"})
+    except WebSocketDisconnect:
+        logger.debug("Completion socket disconnected")
+    finally:
+        for task in list(tasks.values()):
+            task.cancel()
+
 @code_router.get("/code-completion/test")
 async def test_completion():
     """Test endpoint to verify completion service is working."""
@@ -175,10 +449,103 @@ async def test_completion():
         }
 
 
+@code_router.post("/documents/open", response_model=DocumentSyncResponse)
+async def open_document(payload: DocumentOpenRequest = Body(...)):
+    """Mirror a document's full text; later edits arrive via /documents/change."""
+    try:
+        doc = document_mirror.open(
+            user_id=payload.user_id,
+            document_id=payload.document_id,
+            version=payload.version,
+            text=payload.text,
+            language=payload.language,
+            file_path=payload.file_path,
+            workspace_id=payload.workspace_id,
+        )
+        return DocumentSyncResponse(document_id=doc.document_id, version=doc.version, length=len(doc.text))
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@code_router.post("/documents/change", response_model=DocumentSyncResponse)
+async def change_document(payload: DocumentChangeRequest = Body(...)):
+    """Apply incremental (LSP-style) edits to a mirrored document."""
+    try:
+        doc = document_mirror.apply_changes(
+            user_id=payload.user_id,
+            document_id=payload.document_id,
+            base_version=payload.base_version,
+            version=payload.version,
+            changes=[c.model_dump() for c in payload.changes],
+        )
+        return DocumentSyncResponse(document_id=doc.document_id, version=doc.version, length=len(doc.text))
+    except DocumentSyncError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@code_router.post("/documents/close")
+async def close_document(payload: DocumentCloseRequest = Body(...)):
+    """Drop a mirrored document."""
+    return {"document_id": payload.document_id, "closed": document_mirror.close(payload.user_id, payload.document_id)}
+
+
+@workspace_router.post("/workspace/sync", response_model=WorkspaceSyncResponse)
+async def sync_workspace(payload: WorkspaceSyncRequest = Body(...)):
+    """
+    Apply a workspace manifest (full snapshot) or delta of (path, sha256) entries.
+    Returns the hashes the server does not have yet; upload them via /workspace/blobs.
+    """
+    await enforce_rate_limit(payload.user_id, "file")
+    try:
+        missing, file_count = await workspace_store.apply_sync(
+            user_id=payload.user_id,
+            workspace_id=payload.workspace_id,
+            files=[(f.path, f.hash) for f in payload.files],
+            removed=payload.removed,
+            full_snapshot=payload.full_snapshot,
+        )
+        logger.info(
+            f"Workspace sync {payload.workspace_id}: {len(payload.files)} changed, "
+            f"{len(payload.removed)} removed, {len(missing)} blobs missing"
+        )
+        return WorkspaceSyncResponse(
+            workspace_id=payload.workspace_id,
+            missing=missing,
+            file_count=file_count,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"/workspace/sync error: {e}")
+        raise HTTPException(status_code=500, detail=f"Workspace sync failed: {e}")
+
+@workspace_router.post("/workspace/blobs", response_model=WorkspaceBlobUploadResponse)
+async def upload_workspace_blobs(payload: WorkspaceBlobUploadRequest = Body(...)):
+    """Store content-addressed blobs; content whose sha256 does not match is rejected."""
+    await enforce_rate_limit(payload.user_id, "file")
+    try:
+        stored, rejected = 0, []
+        for blob in payload.blobs:
+            if workspace_store.put_blob(blob.hash, blob.content):
+                stored += 1
+            else:
+                rejected.append(blob.hash)
+        return WorkspaceBlobUploadResponse(
+            workspace_id=payload.workspace_id,
+            stored=stored,
+            rejected=rejected,
+        )
+    except Exception as e:
+        logger.error(f"/workspace/blobs error: {e}")
+        raise HTTPException(status_code=500, detail=f"Blob upload failed: {e}")
+
+
 @chat_router.get("/chat/sessions", response_model=ChatHistoryResponse)
-async def list_sessions(user_id: str, limit: int = 30, offset: int = 0):
+async def list_sessions(
+    user_id: str,
+    limit: int = Query(30, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+):
     try:
-        rows = await ChatService.list_user_sessions(user_id, limit, offset)
+        rows, next_cursor = await ChatService.list_user_sessions(user_id, limit, cursor)
         items = [
             ChatHistoryItem(
                 session_id=r["session_id"],
@@ -195,11 +562,31 @@ async def list_sessions(user_id: str, limit: int = 30, offset: int = 0):
             user_id=user_id,
             sessions=items,
             total_sessions=total,
-            page_info={"limit": limit, "offset": offset},
+            page_info={"limit": limit, "next_cursor": next_cursor},
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"List sessions failed: {e}")
 
+@chat_router.get("/chat/search", response_model=ChatSearchResponse)
+async def search_chats(
+    user_id: str,
+    q: str = Query(..., min_length=1, max_length=200, description='Words, "phrases", or, -exclude'),
+    limit: int = Query(20, ge=1, le=50),
+):
+    """Full-text search over the user's saved conversations (live messages appear once persisted)."""
+    try:
+        rows = await ChatService.search_messages(user_id, q.strip(), limit)
+        return ChatSearchResponse(
+            user_id=user_id,
+            query=q,
+            results=[ChatSearchHit(**r) for r in rows],
+        )
+    except Exception as e:
+        logger.error(f"/chat/search error: {e}")
+        raise HTTPException(status_code=500, detail=f"Search failed: {e}")
+
 @chat_router.post("/chat/session/load", response_model=LoadChatResponse)
 async def load_session(payload: LoadChatRequest = Body(...)):
     try:
@@ -212,6 +599,26 @@ async def load_session(payload: LoadChatRequest = Body(...)):
         logger.error(f"/chat/session/load error: {e}")
         raise HTTPException(status_code=500, detail=f"Load session failed: {e}")
 
+@chat_router.get("/chat/session/history", response_model=ChatSessionHistoryResponse)
+async def session_history(
+    session_id: str,
+    user_id: str,
+    before_seq: Optional[int] = Query(None, ge=0, description="next_before_seq from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+):
+    """Page through a session's messages backwards, newest page first."""
+    try:
+        messages, next_before = await ChatService.get_history_page(session_id, user_id, before_seq, limit)
+        return ChatSessionHistoryResponse(
+            session_id=session_id,
+            user_id=user_id,
+            messages=messages,
+            next_before_seq=next_before,
+        )
+    except Exception as e:
+        logger.error(f"/chat/session/history error: {e}")
+        raise HTTPException(status_code=500, detail=f"Load history failed: {e}")
+
 @chat_router.post("/chat/session/close", response_model=CloseChatResponse)
 async def close_session(payload: CloseChatRequest = Body(...)):
     try:
@@ -264,6 +671,16 @@ async def get_model_info():
         logger.error(f"Error getting model info: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@health_router.get("/model-providers")
+async def get_model_providers():
+    """Per-provider routing stats (latency / error rate by call class)."""
+    return ai_model.get_stats()
+
+@health_router.get("/admission")
+async def get_admission_state():
+    """Load-shedding state per call class: in flight, queue wait, pressure, shed/degraded counts."""
+    return {"admission": admission.get_stats(), "scheduler": model_scheduler.get_stats()}
+
 @health_router.get("/stats")
 async def get_system_stats():
     """Basic service stats."""
@@ -272,6 +689,15 @@ async def get_system_stats():
             "ai_model_initialized": ai_model.is_initialized,
             "redis_connected": redis_client.is_connected,
             "database_connected": db_client.is_connected,
+            "project_watcher": project_watcher.get_stats(),
+            "document_mirror": document_mirror.get_stats(),
+            "model_scheduler": model_scheduler.get_stats(),
+            "rate_limiter": rate_limiter.get_stats(),
+            "admission": admission.get_stats(),
+            "chat_codec": message_codec.get_stats(),
+            "attachments": attachment_store.get_stats(),
+            "workspace_store": workspace_store.get_stats(),
+            "session_persister": await session_persister.get_stats(),
         }
 
         if db_client.is_connected:
@@ -297,14 +723,15 @@ async def health_check():
     try:
         model_info = ai_model.get_model_info()
         return HealthCheckResponse(
-            status="healthy" if ai_model.is_initialized else "degraded",
+            status="healthy" if ai_model.is_initialized and ai_model.available("chat") else "degraded",
             version=app_config.version,
             features=["chat", "code_completion", "session_lifecycle"],
             model=model_info.get("model_name", "unknown"),
             database_connected=db_client.is_connected,
             redis_connected=redis_client.is_connected,
             uptime_seconds=None,
-            timestamp=datetime.utcnow(),
+            providers=ai_model.get_circuit_states(),
+            timestamp=datetime.datetime.utcnow(),
         )
     except Exception as e:
         logger.error(f"Health check error: {e}")
@@ -315,9 +742,9 @@ async def health_check():
             model="unknown",
             database_connected=False,
             redis_connected=False,
-            timestamp=datetime.utcnow(),
+            timestamp=datetime.datetime.utcnow(),
         )
 
 def get_routers() -> List[APIRouter]:
     """Get all API routers."""
-    return [chat_router, code_router, health_router]
\ No newline at end of file
+    return [chat_router, code_router, health_router, workspace_router]
\ No newline at end of file
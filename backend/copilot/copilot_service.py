@@ -1,28 +1,28 @@
-import os, json, re, glob, asyncio, logging, tempfile,csv,io, hashlib
-from typing import Dict, Any, List, Optional, Tuple
+import os, json, re, glob, asyncio, logging, tempfile,csv,io, hashlib, base64, html
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Set
 from datetime import datetime
 import time
 import fnmatch
-import magic
 import hashlib
 from dataclasses import dataclass
 from language_contexts import get_language_contexts
-from model import ai_model
+from .project_watcher import ProjectContextWatcher
+from .workspace_store import workspace_store
+from .attachment_store import attachment_store
+from .document_mirror import document_mirror, offset_at
+from model_registry import ai_model
+from model_scheduler import model_scheduler, SchedulerRejected
+from admission import admission, AdmissionRejected
 from redis_client import redis_client
-from database.connection import db_client
+from database.connection import db_client, SNIPPET_START_SEL, SNIPPET_STOP_SEL
+from session_persister import resolve_lost_seq
 from database.schema import (
     ChatRequest, ChatResponse,
     CodeCompletionRequest, CodeCompletionResponse,
-    SupportedLanguage, SessionStatus,LoadChatRequest,
+    SupportedLanguage, SessionStatus,LoadChatRequest, detect_language_from_filename,
     LoadChatResponse,SessionInfo
     
 )
-from docx import Document
-from openpyxl import load_workbook
-import xlrd
-from PyPDF2 import PdfReader
-from PIL import Image
-import pytesseract
 from dotenv import load_dotenv
 
 
@@ -41,6 +41,9 @@ TEMPERATURE = float(os.getenv("CODE_COMPLETION_TEMPERATURE"))
 TOP_P_ENV = float(os.getenv("TOP_P"))
 CACHE_TTL = int(os.getenv("CACHE_TTL_SECONDS"))
 max_total_messages = int(os.getenv("CHAT_CONTEXT_MESSAGES"))
+# Messages cached when a saved session is reopened; older ones are paged in via /chat/session/history
+rehydrate_messages = int(os.getenv("CHAT_REHYDRATE_MESSAGES", str(max_total_messages)))
+PROJECT_WATCHED_TTL_SEC = int(os.getenv("PROJECT_WATCHED_TTL_SEC", "86400"))
 logger = logging.getLogger(__name__)
 
 
@@ -54,8 +57,38 @@ class CachedCompletion:
 class ProjectContextService:
     """Service for managing project context and file analysis"""
 
+    DEFAULT_EXCLUDE_PATTERNS = [
+        "*.pyc", "__pycache__/*", "*.log", "*.tmp",
+        "node_modules/*", ".git/*"
+    ]
+
+    # Per-root file index: abs root -> {relative path: rendered "# FILE" part}.
+    # Kept only for watched roots so changes can be patched in place.
+    _index: Dict[str, Dict[str, str]] = {}
+
+    @staticmethod
+    def _cache_key(root_dir: str) -> str:
+        return f"project_context:{os.path.abspath(root_dir)}"
+
+    @staticmethod
+    def _is_excluded(file_path: str, exclude_patterns: List[str]) -> bool:
+        return any(fnmatch.fnmatch(file_path, pat) for pat in exclude_patterns)
+
+    @staticmethod
+    def _read_part(file_path: str, root_dir: str) -> Optional[str]:
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                content = f.read()
+            return f"\n# FILE: {os.path.relpath(file_path, root_dir)}\n{content}"
+        except Exception:
+            return None
+
     @staticmethod
-    def get_project_context(
+    def _render(entries: Dict[str, str], max_chars: int) -> str:
+        return "".join(entries.values())[:max_chars]
+
+    @staticmethod
+    async def get_project_context(
         root_dir: str,
         exclude_patterns: Optional[List[str]] = None,
         # max_chars: int = 3000,
@@ -66,56 +99,156 @@ class ProjectContextService:
         """
         Read code files under root_dir into a single string for context,
         cache in Redis, and respect max_chars.
+        Watched roots keep a per-file index that the filesystem watcher patches,
+        so their cache stays fresh without waiting for the TTL.
         """
-        cache_key = f"project_context:{os.path.abspath(root_dir)}"
+        root = os.path.abspath(root_dir)
+        cache_key = ProjectContextService._cache_key(root)
+        watched = project_watcher.watch(root)
+        ttl = PROJECT_WATCHED_TTL_SEC if watched else cache_ttl
 
         # 1) Try Redis cache
         if redis_client.is_connected:
             try:
-                cached = redis_client.get(cache_key)
+                cached = await redis_client.get(cache_key)
             except AttributeError:
                 cached = None
             if cached:
                 logger.info(f"Using cached project context for {root_dir}")
                 return cached
 
-        # 2) Build fresh context
-        if exclude_patterns is None:
-            exclude_patterns = [
-                "*.pyc", "__pycache__/*", "*.log", "*.tmp",
-                "node_modules/*", ".git/*"
-            ]
-
-        files = glob.glob(os.path.join(root_dir, "**", "*.*"), recursive=True)
-        context_parts: List[str] = []
-        total_len = 0
-
-        for file_path in files:
-            if any(fnmatch.fnmatch(file_path, pat) for pat in exclude_patterns):
-                continue
-            try:
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read()
-                part = f"\n# FILE: {os.path.relpath(file_path, root_dir)}\n{content}"
-                context_parts.append(part)
+        # 2) Rebuild from the in-process index if the root is already indexed
+        entries = ProjectContextService._index.get(root) if watched else None
+        if entries is None:
+            # 3) Build fresh context
+            if exclude_patterns is None:
+                exclude_patterns = ProjectContextService.DEFAULT_EXCLUDE_PATTERNS
+
+            files = glob.glob(os.path.join(root, "**", "*.*"), recursive=True)
+            entries = {}
+            total_len = 0
+
+            for file_path in files:
+                if ProjectContextService._is_excluded(file_path, exclude_patterns):
+                    continue
+                part = ProjectContextService._read_part(file_path, root)
+                if part is None:
+                    continue
+                entries[os.path.relpath(file_path, root)] = part
                 total_len += len(part)
                 if total_len > max_chars:
                     break
-            except Exception:
-                continue
 
-        project_context = "".join(context_parts)[:max_chars]
+            if watched:
+                ProjectContextService._index[root] = entries
+
+        project_context = ProjectContextService._render(entries, max_chars)
 
-        # 3) Cache to Redis (best-effort)
+        # 4) Cache to Redis (best-effort)
         if redis_client.is_connected:
             try:
-                redis_client.set_with_expiry(cache_key, project_context, cache_ttl)
+                await redis_client.set_with_expiry(cache_key, project_context, ttl)
                 logger.info(f"Cached project context for {root_dir} in Redis")
             except AttributeError:
                 pass
 
         return project_context
 
+    @staticmethod
+    async def apply_file_changes(
+        root_dir: str,
+        paths: Set[str],
+        max_chars=int(os.getenv("PROJECT_MAX_CHARS")),
+    ) -> int:
+        """
+        Patch only the index entries for `paths` (re-read or drop them) and
+        rewrite the cached context. Returns the number of entries changed.
+        """
+        root = os.path.abspath(root_dir)
+        entries = ProjectContextService._index.get(root)
+        if entries is None:
+            # Not indexed in this worker: just invalidate the shared cache
+            if redis_client.is_connected:
+                await redis_client.delete(ProjectContextService._cache_key(root))
+            return 0
+
+        changed = 0
+        total_len = sum(len(part) for part in entries.values())
+        for path in paths:
+            if ProjectContextService._is_excluded(path, ProjectContextService.DEFAULT_EXCLUDE_PATTERNS):
+                continue
+            rel = os.path.relpath(path, root)
+            if rel.startswith(".."):
+                continue
+            part = ProjectContextService._read_part(path, root) if os.path.isfile(path) else None
+            old = entries.get(rel)
+            if part is None:
+                if entries.pop(rel, None) is not None:
+                    total_len -= len(old)
+                    changed += 1
+            elif old is None and total_len > max_chars:
+                continue  # same budget as the initial build: new files no longer fit
+            elif old != part:
+                entries[rel] = part
+                total_len += len(part) - len(old or "")
+                changed += 1
+
+        if changed and redis_client.is_connected:
+            await redis_client.set_with_expiry(
+                ProjectContextService._cache_key(root),
+                ProjectContextService._render(entries, max_chars),
+                PROJECT_WATCHED_TTL_SEC,
+            )
+            logger.info(f"Patched {changed} project context entries for {root}")
+        return changed
+
+    @staticmethod
+    async def get_workspace_context(
+        user_id: str,
+        workspace_id: str,
+        file_path: str,
+        max_chars=int(os.getenv("PROJECT_MAX_CHARS")),
+        cache_ttl=int(os.getenv("PROJECT_TTL_SEC"))
+    ) -> str:
+        """
+        Same as get_project_context, but built from a client-pushed workspace
+        snapshot. The cache key includes the workspace version, so every sync
+        invalidates it without any explicit delete.
+        """
+        directory = os.path.dirname(file_path.replace("\\", "/"))
+        version = await workspace_store.get_version(user_id, workspace_id)
+        cache_key = f"project_context:ws:{user_id}:{workspace_id}:{version}:{directory}"
+
+        if redis_client.is_connected:
+            cached = await redis_client.get(cache_key)
+            if cached:
+                logger.info(f"Using cached workspace context for {workspace_id}/{directory}")
+                return cached
+
+        files = await workspace_store.get_directory_files(user_id, workspace_id, directory, max_chars)
+        project_context = "".join(
+            f"\n# FILE: {path}\n{content}" for path, content in files.items()
+        )[:max_chars]
+
+        if redis_client.is_connected:
+            await redis_client.set_with_expiry(cache_key, project_context, cache_ttl)
+        return project_context
+
+    @staticmethod
+    async def drop_root(root_dir: str) -> None:
+        """Forget a root that is no longer watched; its cache can no longer be kept fresh."""
+        root = os.path.abspath(root_dir)
+        ProjectContextService._index.pop(root, None)
+        if redis_client.is_connected:
+            await redis_client.delete(ProjectContextService._cache_key(root))
+
+
+# Filesystem watcher keeping ProjectContextService caches fresh
+project_watcher = ProjectContextWatcher(
+    on_change=ProjectContextService.apply_file_changes,
+    on_evict=ProjectContextService.drop_root,
+)
+
 
 class CodeCompletionService:
     """Optimized service for handling code completion with minimal delay"""
@@ -126,6 +259,9 @@ class CodeCompletionService:
         self._last_before_text = ""
         self._cache_hits = 0
         self._cache_misses = 0
+        # Latest in-flight inline completion per user+document; a newer one cancels it
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._superseded = 0
 
     def _smart_truncate_before(self, text: str, max_length: int) -> str:
         """Smart truncation that preserves context boundaries"""
@@ -180,7 +316,42 @@ class CodeCompletionService:
         
         return before_text, after_text
 
-    def create_completion_prompt(self, request: CodeCompletionRequest) -> Tuple[str, Dict[str, Any]]:
+    def resolve_document_request(self, request: CodeCompletionRequest) -> CodeCompletionRequest:
+        """
+        Fill text/context for a request that references a mirrored document
+        (document_id + document_version + cursor_position) instead of carrying
+        the code. Raises DocumentSyncError when the mirror is missing or stale.
+        """
+        if not request.document_id:
+            return request
+
+        doc = document_mirror.get(request.user_id, request.document_id, request.document_version)
+        cursor = request.cursor_position or {}
+        offset = offset_at(doc.text, cursor.get("line", 0), cursor.get("character", 0))
+
+        # Server-side window: the widest the prompt builder will use for any mode
+        before_text = doc.text[max(0, offset - max(MENU_MAX_BEFORE, INLINE_MAX_BEFORE)):offset]
+        after_text = doc.text[offset:offset + max(MENU_MAX_AFTER, INLINE_MAX_AFTER)]
+
+        context = dict(request.context or {})
+        context["before"] = before_text
+        context["after"] = after_text
+        context.setdefault("line", cursor.get("line", 0))
+        request.context = context
+        request.text = (before_text[-1500:] + after_text[:500]).strip() or " "
+
+        if not request.file_path and doc.file_path:
+            request.file_path = doc.file_path
+        if not request.workspace_id and doc.workspace_id:
+            request.workspace_id = doc.workspace_id
+        if not request.language:
+            try:
+                request.language = SupportedLanguage(doc.language)
+            except ValueError:
+                request.language = detect_language_from_filename(request.file_path or "")
+        return request
+
+    async def create_completion_prompt(self, request: CodeCompletionRequest) -> Tuple[str, Dict[str, Any]]:
         """Create completion prompt with optimizations"""
         language = request.language or SupportedLanguage.PYTHON
         context = request.context or {}
@@ -202,9 +373,17 @@ class CodeCompletionService:
         project_context = ""
         if mode != "inline" and request.file_path:
             try:
-                from copilot_service import ProjectContextService
-                project_root = os.path.dirname(request.file_path)
-                project_context = ProjectContextService.get_project_context(project_root)
+                if request.workspace_id:
+                    project_context = await ProjectContextService.get_workspace_context(
+                        request.user_id, request.workspace_id, request.file_path
+                    )
+                else:
+                    # Whole watched project when the file is in one, otherwise its directory
+                    project_root = (
+                        project_watcher.project_root(request.file_path)
+                        or os.path.dirname(request.file_path)
+                    )
+                    project_context = await ProjectContextService.get_project_context(project_root)
                 # Limit project context length for speed
                 if len(project_context) > 500:
                     project_context = project_context[:500] + "..."
@@ -242,11 +421,17 @@ COMPLETION:"""
 
         return prompt, config
 
-    def post_process_completion(self, completion: str, language: SupportedLanguage) -> str:
+    def post_process_completion(self, completion: str, language: SupportedLanguage, fim: bool = False) -> str:
         """Optimized post-processing for minimal delay"""
         if not completion:
             return ""
 
+        if fim:
+            # FIM output is already the exact insertion: keep leading whitespace/newlines,
+            # drop special tokens a server may echo back and trailing blank space
+            completion = re.split(r"<\|[a-z_]+\|>", completion, maxsplit=1)[0]
+            return completion.rstrip()[:500]
+
         # Single-pass cleanup
         completion = completion.strip()
         
@@ -416,6 +601,7 @@ COMPLETION:"""
         Optimized model call with improved error handling and fallbacks
         """
         # Use env-driven parameters by mode
+        call_class = "inline" if mode == "inline" else "menu"
         max_tokens = INLINE_MAX_TOKENS if mode == "inline" else MENU_MAX_TOKENS
         timeout = INLINE_TIMEOUT if mode == "inline" else MENU_TIMEOUT
         temperature = TEMPERATURE
@@ -465,6 +651,10 @@ COMPLETION:"""
 
         # Try each fallback approach
         for attempt_num, attempt in enumerate(fallback_attempts, 1):
+            if not ai_model.available(call_class):
+                # Every provider's circuit is open: stop instead of hammering the upstream
+                logger.debug(f"No model provider available, abandoning {mode} ladder at attempt {attempt_num}")
+                break
             try:
                 logger.debug(f"Model call attempt {attempt_num}: {attempt['description']}")
                 
@@ -472,11 +662,12 @@ COMPLETION:"""
                     result = await ai_model.generate_code_completion(
                         prompt=prompt,
                         language=language_str,
+                        call_class=call_class,
                         **attempt["params"]
                     )
                 else:
                     # Positional arguments only
-                    result = await ai_model.generate_code_completion(prompt, language_str)
+                    result = await ai_model.generate_code_completion(prompt, language_str, call_class=call_class)
                 
                 # Handle different return types
                 if isinstance(result, tuple) and len(result) == 2:
@@ -509,6 +700,27 @@ COMPLETION:"""
         logger.error(f"All {len(fallback_attempts)} model call attempts failed for {mode} mode")
         return ("", False)
 
+    async def _call_fim(self, request: CodeCompletionRequest, language: SupportedLanguage, mode: str) -> Tuple[str, bool]:
+        """
+        Fill-in-the-middle call: prefix/suffix go to the model as-is, no
+        instruction wrapper. (text, True) may carry an empty middle, which is a
+        real answer; (_, False) means fall back to the instruction prompt.
+        """
+        context = request.context or {}
+        before, after = self._optimize_context_bounds(context.get("before", ""), context.get("after", ""), mode)
+        inline = mode == "inline"
+        try:
+            return await ai_model.generate_fim_completion(
+                before, after, language.value,
+                call_class="inline" if inline else "menu",
+                temperature=TEMPERATURE,
+                max_tokens=INLINE_MAX_TOKENS if inline else MENU_MAX_TOKENS,
+                timeout=INLINE_TIMEOUT if inline else MENU_TIMEOUT,
+            )
+        except Exception as e:
+            logger.warning(f"FIM completion failed, using instruction prompt: {e}")
+            return "", False
+
     def _build_simple_inline_prompt(self, language: SupportedLanguage, before: str, after: str) -> str:
         """Minimal prompt for fallback inline completion"""
         lang = language.value if hasattr(language, "value") else str(language)
@@ -563,7 +775,43 @@ COMPLETION:"""
             
         return min(0.95, base_confidence)
 
+    def _inflight_key(self, request: CodeCompletionRequest) -> Optional[str]:
+        """Only inline completions supersede each other: the editor discards the older one anyway."""
+        context = request.context or {}
+        if (context.get("mode") or "menu").lower() != "inline":
+            return None
+        return f"{request.user_id}:{request.document_id or request.file_path or ''}"
+
     async def get_completion(self, request: CodeCompletionRequest) -> Tuple[str, int, float]:
+        """
+        Run a completion as a cancellable task. Cancelling the caller (client
+        disconnect, WebSocket cancel frame) cancels the model call; a newer
+        inline request for the same document cancels the older one.
+        """
+        key = self._inflight_key(request)
+        if key is None:
+            return await self._get_completion(request)
+
+        previous = self._inflight.get(key)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self._superseded += 1
+
+        task = asyncio.create_task(self._get_completion(request))
+        self._inflight[key] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if task.cancelled() and not (current and current.cancelling()):
+                logger.debug(f"Inline completion superseded by a newer request ({key})")
+                return "", 0, 0.0
+            raise
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    async def _get_completion(self, request: CodeCompletionRequest) -> Tuple[str, int, float]:
         """Main completion method optimized for speed"""
         start_time = time.perf_counter()
         
@@ -586,8 +834,6 @@ COMPLETION:"""
                 logger.debug(f"Cache hit for {mode} completion: {processing_time}ms")
                 return cached_completion, processing_time, 0.9
 
-            # Create prompt
-            prompt, config = self.create_completion_prompt(request)
             logger.info(f"Generating {mode} completion for {lang_enum.value}")
             
             # Call model with optimizations
@@ -600,39 +846,50 @@ COMPLETION:"""
             #     logger.warning(f"Model call failed for {mode} mode in {processing_time}ms")
             #     return "", processing_time, 0.0
             
-            completion_text, success = await self._call_model(
-                prompt, lang_enum.value, config, mode
-            )
-
-            if (not success or not completion_text) and mode == "inline":
-                # --- SIMPLE INLINE FALLBACK ---
-                try:
-                    simple_prompt = self._build_simple_inline_prompt(
-                        lang_enum, context.get("before", ""), context.get("after", "")
-                    )
-                    completion_text, success = await self._call_simple(simple_prompt, lang_enum.value)
-                    if not success or not completion_text:
-                        processing_time = int((time.perf_counter() - start_time) * 1000)
-                        logger.warning(
-                            f"Primary + fallback failed for inline mode in {processing_time}ms"
-                        )
-                        return "", processing_time, 0.0
-                except Exception as e:
-                    processing_time = int((time.perf_counter() - start_time) * 1000)
-                    logger.warning(
-                        f"Inline fallback errored in {processing_time}ms: {e}"
-                    )
-                    return "", processing_time, 0.0
+            call_class = "inline" if mode == "inline" else "menu"
+            if not ai_model.available(call_class):
+                # Circuit open everywhere: fail fast (the cache above is the local fast path)
+                processing_time = int((time.perf_counter() - start_time) * 1000)
+                logger.info(f"Skipped {mode} completion: no model provider available")
+                return "", processing_time, 0.0
 
-            elif not success or not completion_text:
-                # Non-inline (menu) stays as-is
+            try:
+                # Shed up front when the class is saturated, then primary call + inline
+                # fallback share one slot; a late inline answer is dropped
+                with admission.admit(call_class):
+                    async with model_scheduler.slot(call_class):
+                        # Native FIM when a code model is available, else the instruction prompt
+                        fim = False
+                        if ai_model.supports_fim(call_class):
+                            completion_text, fim = await self._call_fim(request, lang_enum, mode)
+                            success = fim
+                        if not fim:
+                            prompt, config = await self.create_completion_prompt(request)
+                            completion_text, success = await self._call_model(
+                                prompt, lang_enum.value, config, mode
+                            )
+                        if (not success or not completion_text) and not fim and mode == "inline" and ai_model.available(call_class):
+                            simple_prompt = self._build_simple_inline_prompt(
+                                lang_enum, context.get("before", ""), context.get("after", "")
+                            )
+                            completion_text, success = await self._call_simple(simple_prompt, lang_enum.value)
+            except (AdmissionRejected, SchedulerRejected) as e:
                 processing_time = int((time.perf_counter() - start_time) * 1000)
-                logger.warning(f"Model call failed for {mode} mode in {processing_time}ms")
+                logger.info(f"Skipped {mode} completion: {e}")
                 return "", processing_time, 0.0
 
+            if not success or not completion_text:
+                processing_time = int((time.perf_counter() - start_time) * 1000)
+                if fim:
+                    logger.debug(f"FIM returned an empty middle for {mode} mode in {processing_time}ms")
+                elif mode == "inline":
+                    logger.warning(f"Primary + fallback failed for inline mode in {processing_time}ms")
+                else:
+                    logger.warning(f"Model call failed for {mode} mode in {processing_time}ms")
+                return "", processing_time, 0.0
 
             # Post-process
-            completion = self.post_process_completion(completion_text, lang_enum)
+            completion = self.post_process_completion(completion_text, lang_enum, fim=fim)
             
             if not completion.strip():
                 processing_time = int((time.perf_counter() - start_time) * 1000)
@@ -720,6 +977,7 @@ COMPLETION:"""
             "cache_misses": self._cache_misses,
             "hit_rate_percent": round(hit_rate, 2),
             "total_requests": total_requests,
+            "superseded_requests": self._superseded,
             "memory_usage_estimate": len(self.completion_cache) * 200  # Rough estimate in bytes
         }
 
@@ -901,12 +1159,13 @@ class ChatService:
     async def store_message(session_id: str, user_id: str, role: str, content: str) -> bool:
         """
         Store message in Redis ONLY during live conversation.
-        Postgres persistence happens on explicit flush/close.
+        Postgres persistence happens in the background (session_persister)
+        and on explicit flush/close.
         """
         try:
             if not redis_client.is_connected:
                 return False
-            ok = redis_client.add_chat_message(
+            ok = await redis_client.add_chat_message(
                 session_id=session_id, role=role, content=content, user_id=user_id
             )
             return bool(ok)
@@ -915,10 +1174,21 @@ class ChatService:
             return False
 
     @staticmethod
-    async def get_chat_history(session_id: str, user_id: str) -> List[Dict[str, Any]]:
+    async def store_turn(session_id: str, user_id: str, user_text: str, assistant_text: str) -> int:
+        """Store a user + assistant exchange in one Redis round trip; returns the message count."""
+        if not redis_client.is_connected:
+            return 0
+        count = await redis_client.append_turn(
+            session_id, [("user", user_text), ("assistant", assistant_text)], user_id=user_id
+        )
+        return count or 0
+
+    @staticmethod
+    async def get_chat_history(session_id: str, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Chronological history; with `limit` only the last N messages are fetched."""
         try:
             if redis_client.is_connected:
-                msgs = redis_client.get_chat_messages(session_id, user_id=user_id) or []
+                msgs = await redis_client.get_chat_messages(session_id, user_id=user_id, limit=limit) or []
                 return msgs
         except Exception as e:
             logger.warning(f"Redis get_chat_messages failed: {e}")
@@ -926,7 +1196,7 @@ class ChatService:
         # ✅ DB fallback MUST pass user_id
         try:
             if db_client.is_connected:
-                sess = await db_client.get_chat_session(session_id, user_id)
+                sess = await db_client.get_chat_session(session_id, user_id, limit=limit)
                 if sess and isinstance(sess.get("messages"), list):
                     return sess["messages"]
         except Exception as e:
@@ -945,31 +1215,38 @@ class ChatService:
         reason: str = "close_chat",
     ) -> int:
         """
-        Pull all messages from Redis and persist the entire session as one row in chat_sessions.metadata.
+        Pull the cached messages from Redis and append the ones Postgres doesn't
+        have yet to chat_messages (the session row is upserted alongside).
         """
         try:
-            messages: List[Dict[str, Any]] = []
-            if redis_client.is_connected:
-                messages = redis_client.get_chat_messages(session_id, user_id=user_id) or []
-
+            if not redis_client.is_connected:
+                return 0
+            [cached] = await redis_client.get_many_chat_messages([(session_id, user_id)])
+            messages = cached.messages
             if not messages:
                 return 0
+            first_seq = await resolve_lost_seq(session_id, user_id, cached)
+            if first_seq is None:
+                return 0  # counter lost and Postgres unreachable: keep the cache, the persister retries
 
-            if db_client.is_connected:
-                ok = await db_client.save_chat_session(
-                    session_id=session_id,
-                    messages=messages,
-                    user_id=user_id,
-                )
-                if not ok:
-                    return 0
+            ok = db_client.is_connected and await db_client.save_chat_session(
+                session_id=session_id,
+                messages=messages,
+                user_id=user_id,
+                first_seq=first_seq,
+                attachments=await attachment_store.texts_for(messages),
+            )
+            if not ok:
+                return 0  # still dirty and cached: the persister retries
+            # Clean only now, and only if nothing was written since the read
+            await redis_client.ack_dirty_sessions([(session_id, user_id, cached.counter)])
 
             if clear_cache and redis_client.is_connected:
                 try:
-                    redis_client.clear_chat_cache(session_id, user_id=user_id)
+                    await redis_client.clear_chat_cache(session_id, user_id=user_id)
                 except TypeError:
                     # if old signature
-                    redis_client.clear_chat_cache(session_id)
+                    await redis_client.clear_chat_cache(session_id)
 
             return len(messages)
         except Exception as e:
@@ -981,46 +1258,34 @@ class ChatService:
         """Get total message count for session (cache-first)."""
         try:
             if redis_client.is_connected:
-                if hasattr(redis_client, "get_session_message_count"):
-                    n = redis_client.get_session_message_count(session_id, user_id=user_id)
-                    if n is not None:
-                        return int(n)
-                msgs = redis_client.get_chat_messages(session_id, user_id=user_id) or []
-                return len(msgs)
+                # LLEN only: never read the messages just to count them
+                return await redis_client.get_session_message_count(session_id, user_id=user_id)
             return 0
         except Exception as e:
             logger.error(f"Error getting message count: {e}")
             return 0
 
     @staticmethod
-    async def process_chat_request(request: ChatRequest) -> ChatResponse:
-        start = asyncio.get_event_loop().time()
+    async def _build_model_messages(request: ChatRequest) -> List[Dict[str, str]]:
+        """Recent session history (chronological) followed by the current user message."""
         session_id, user_id = request.session_id, request.user_id
 
-        # Fetch ALL history from Redis (chronological order: oldest -> newest)
-        history = await ChatService.get_chat_history(session_id, user_id)
-
-        # Keep last N complete conversations in exact chronological order
+        # Fetch only the last N messages (chronological order: oldest -> newest).
         # This preserves the natural flow: system(file) → user → assistant → system(file) → user → etc.
-        
-        
-        # Simply take the last N messages in chronological order
-        if len(history) > max_total_messages:
-            recent_history = history[-max_total_messages:]
-            logger.info(f"Session {session_id}: Truncated to last {max_total_messages} messages from {len(history)} total")
-        else:
-            recent_history = history
-            logger.info(f"Session {session_id}: Using all {len(recent_history)} messages from history")
+        # and keeps the per-turn cost bounded by the context size, not the session length.
+        recent_history = await ChatService.get_chat_history(session_id, user_id, limit=max_total_messages)
+        logger.info(f"Session {session_id}: Using last {len(recent_history)} messages (limit {max_total_messages})")
 
         # Build model messages: preserve exact chronological order + current input
         model_msgs = []
         
-        # Add ALL recent messages in exact chronological order (system, user, assistant mixed naturally)
+        # Add ALL recent messages in exact chronological order (system, user, assistant mixed naturally);
+        # attachment references are expanded to their stored text here
         for i, m in enumerate(recent_history):
             if m.get("content"):
                 model_msgs.append({
                     "role": m["role"], 
-                    "content": m["content"]
+                    "content": await attachment_store.resolve(m["role"], m["content"])
                 })
                 
                 # Log each message for debugging
@@ -1032,16 +1297,17 @@ class ChatService:
         model_msgs.append({"role": "user", "content": request.text})
 
         logger.info(f"Final model input: {len(model_msgs)} messages (history: {len(recent_history)}, current: 1)")
+        return model_msgs
 
-        # Call model with chronological conversation
-        ai_text = await ai_model.generate_chat_response(model_msgs)
+    @staticmethod
+    async def _complete_turn(request: ChatRequest, ai_text: str, start: float) -> ChatResponse:
+        """Store the user + assistant messages and build the response."""
+        session_id, user_id = request.session_id, request.user_id
 
         # Store new user + assistant messages in Redis (preserving chronological order)
-        await ChatService.store_message(session_id, user_id, "user", request.text)
-        await ChatService.store_message(session_id, user_id, "assistant", ai_text)
+        count = await ChatService.store_turn(session_id, user_id, request.text, ai_text)
 
         # Respond
-        count = await ChatService.get_message_count(session_id, user_id)
         ms = int((asyncio.get_event_loop().time() - start) * 1000)
 
         return ChatResponse(
@@ -1054,11 +1320,75 @@ class ChatService:
             model_used="gemini-1.5-pro",
             processing_time_ms=ms
         )
+
+    @staticmethod
+    async def process_chat_request(request: ChatRequest) -> ChatResponse:
+        start = asyncio.get_event_loop().time()
+        with admission.admit("chat") as ticket:
+            model_msgs = await ChatService._build_model_messages(request)
+
+            # Call model with chronological conversation (shorter answer when degraded)
+            async with model_scheduler.slot("chat"):
+                ai_text = await ai_model.generate_chat_response(model_msgs, max_tokens=ticket.max_tokens)
+
+        response = await ChatService._complete_turn(request, ai_text, start)
+        if ticket.degraded:
+            response.metadata = {"degraded": True}
+        return response
+
+    @staticmethod
+    async def stream_chat_request(request: ChatRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of process_chat_request: yields ("token", {"text"}) as the
+        model produces output, then ("done", ChatResponse fields) once the turn is
+        stored. If the consumer stops early (client disconnect) the provider stream
+        is closed and nothing is persisted.
+        """
+        start = asyncio.get_event_loop().time()
+        parts: List[str] = []
+        first_token_ms: Optional[int] = None
+        with admission.admit("chat") as ticket:
+            model_msgs = await ChatService._build_model_messages(request)
+
+            async with model_scheduler.slot("chat"):
+                async for text in ai_model.stream_chat_response(model_msgs, max_tokens=ticket.max_tokens):
+                    if first_token_ms is None:
+                        first_token_ms = int((asyncio.get_event_loop().time() - start) * 1000)
+                    parts.append(text)
+                    yield "token", {"text": text}
+
+        ai_text = "".join(parts).strip()
+        if not ai_text:
+            raise RuntimeError("Model failed to generate valid response")
+
+        response = await ChatService._complete_turn(request, ai_text, start)
+        response.metadata = {"time_to_first_token_ms": first_token_ms, "degraded": ticket.degraded}
+        yield "done", response.model_dump(mode="json")
        
     @staticmethod
     async def load_session_to_cache(session_id: str, user_id: str, ttl: Optional[int] = None) -> LoadChatResponse:
+        """
+        Make a saved session live again by caching only its most recent window
+        (rehydrate_messages, the model context) instead of the whole history;
+        older messages are served page by page from Postgres (get_history_page).
+        A session that is still cached is left alone: it may hold messages the
+        persister hasn't written yet.
+        """
         try:
-            sess = await db_client.get_chat_session(session_id, user_id)
+            if await redis_client.session_exists_in_cache(session_id, user_id):
+                [cached] = await redis_client.get_many_chat_messages([(session_id, user_id)])
+                first_seq = await resolve_lost_seq(session_id, user_id, cached)
+                return LoadChatResponse(
+                    session_id=session_id,
+                    user_id=user_id,
+                    message_count=len(cached.messages),
+                    total_messages=(first_seq or 0) + len(cached.messages),
+                    status=SessionStatus.ACTIVE,
+                    message="Session already in cache",
+                    last_updated=None,
+                )
+
+            sess = await db_client.get_chat_session(session_id, user_id, limit=rehydrate_messages)
             if not sess:
                 return LoadChatResponse(
                     session_id=session_id,
@@ -1069,79 +1399,138 @@ class ChatService:
                     last_updated=None,
                 )
 
-            # --- normalize the shape defensively ---
-            if isinstance(sess, str):
-                # Some older/other codepath returned raw JSON
-                try:
-                    sess = json.loads(sess)
-                except Exception:
-                    raise TypeError("DB returned a string; expected an object. Check save_chat_session json.dumps and jsonb column.")
-
-            messages = None
-            if isinstance(sess, dict):
-                # prefer already-extracted messages
-                messages = sess.get("messages")
-                if not isinstance(messages, list):
-                    # fallback: look under metadata.messages
-                    md = sess.get("metadata") if isinstance(sess.get("metadata"), dict) else {}
-                    messages = md.get("messages") if isinstance(md.get("messages"), list) else []
-
-            if messages is None:
-                messages = []
+            messages = sess.get("messages") if isinstance(sess.get("messages"), list) else []
+            # Cache entries keep the plain message shape; the position is the seq counter's job
+            messages = [{k: v for k, v in m.items() if k != "seq"} for m in messages]
+            total = max(sess.get("message_count") or 0, len(messages))
 
-            # hydrate Redis
-            redis_client.load_chat_to_cache(session_id, messages, user_id=user_id, ttl=ttl)
+            # hydrate Redis with the window only
+            await redis_client.load_chat_to_cache(
+                session_id, messages, user_id=user_id, ttl=ttl, next_seq=total,
+            )
 
             return LoadChatResponse(
                 session_id=session_id,
                 user_id=user_id,
                 message_count=len(messages),
+                total_messages=total,
                 status=SessionStatus.LOADED,
-                message="Session loaded to cache",
-                last_updated=sess.get("updated_at") if isinstance(sess, dict) else None,
+                message=f"Loaded the last {len(messages)} of {total} messages to cache",
+                last_updated=sess.get("updated_at"),
             )
         except Exception as e:
             logger.error(f"load_session_to_cache error: {e}")
             raise
-        
+
     @staticmethod
-    async def list_user_sessions(user_id: str, limit: int = 30, offset: int = 0) -> List[Dict[str, Any]]:
+    async def get_history_page(
+        session_id: str,
+        user_id: str,
+        before_seq: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
         """
-        List saved sessions from Postgres for history/sidebar (archived list).
+        Up to `limit` messages (chronological, each with its `seq`) ending just
+        before `before_seq`, newest page when None. The cached tail is served from
+        Redis (it may not be persisted yet), anything older from Postgres by seq
+        range. Returns (messages, before_seq for the next older page or None).
         """
-        rows = []
+        first_seq, cached = 0, []
+        if redis_client.is_connected:
+            [tail] = await redis_client.get_many_chat_messages([(session_id, user_id)])
+            if tail.messages and await resolve_lost_seq(session_id, user_id, tail) is not None:
+                first_seq, cached = tail.first_seq, tail.messages
+
+        end = before_seq if before_seq is not None else (first_seq + len(cached) if cached else None)
+        if end is not None and end <= 0:
+            return [], None
+
+        page = [m for m in cached if end is None or m["seq"] < end][-limit:]
+        missing = limit - len(page)
+        if missing > 0 and db_client.is_connected:
+            # Older than the cached tail (or nothing cached): read the seq range from Postgres
+            older = await db_client.get_chat_messages(
+                session_id, user_id, limit=missing, before_seq=page[0]["seq"] if page else end,
+            )
+            page = older + page
+
+        next_before = page[0]["seq"] if page and page[0]["seq"] > 0 else None
+        page = [{**m, "content": await attachment_store.resolve(m["role"], m["content"])} for m in page]
+        return page, next_before
+
+    @staticmethod
+    def _highlight(snippet: str) -> str:
+        """HTML-escape a ts_headline snippet, then turn its match delimiters into <mark> tags."""
+        return (
+            html.escape(snippet)
+            .replace(SNIPPET_START_SEL, "<mark>")
+            .replace(SNIPPET_STOP_SEL, "</mark>")
+        )
+
+    @staticmethod
+    async def search_messages(user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Full-text search over the user's persisted chat history (Postgres GIN index)."""
+        if not db_client.is_connected:
+            return []
+        rows = await db_client.search_chat_messages(user_id, query, limit)
+        return [
+            {
+                "session_id": r["session_id"],
+                "seq": r["seq"],
+                "role": r["role"],
+                "snippet": ChatService._highlight(r["snippet"] or ""),
+                "rank": float(r["rank"] or 0.0),
+                "timestamp": r.get("ts"),
+            }
+            for r in rows
+        ]
+
+    @staticmethod
+    def _encode_cursor(updated_at: datetime, session_id: str) -> str:
+        raw = json.dumps([updated_at.isoformat(), session_id]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        """(updated_at, session_id) of the last row of the previous page; ValueError if malformed."""
         try:
-            if hasattr(db_client, "fetch_all"):
-                rows = await db_client.fetch_all(
-                    "SELECT session_id, user_id, metadata, created_at, updated_at "
-                    "FROM chat_sessions WHERE user_id = $1 "
-                    "ORDER BY updated_at DESC LIMIT $2 OFFSET $3",
-                    user_id, limit, offset
-                )
-            elif hasattr(db_client, "list_chat_sessions"):
-                rows = await db_client.list_chat_sessions(user_id, limit, offset)
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            updated_at, session_id = json.loads(raw)
+            return datetime.fromisoformat(updated_at), str(session_id)
         except Exception as e:
-            logger.error(f"list_user_sessions DB error: {e}")
-            return []
+            raise ValueError(f"Invalid cursor: {e}") from e
+
+    @staticmethod
+    async def list_user_sessions(
+        user_id: str,
+        limit: int = 30,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        List saved sessions from Postgres for history/sidebar (archived list), newest first.
+        Returns (items, next_cursor); pass next_cursor back for the following page
+        (None on the last one). Previews and counts are computed in SQL.
+        """
+        before = ChatService._decode_cursor(cursor) if cursor else None
+        # One extra row tells whether there is a next page
+        rows = await db_client.get_user_chat_sessions(user_id, limit + 1, before)
 
-        items: List[Dict[str, Any]] = []
-        for r in rows or []:
-            meta = r.get("metadata") or {}
-            msgs = meta.get("messages") if isinstance(meta, dict) else []
-            msgs = msgs if isinstance(msgs, list) else []
-            first = ""
-            if msgs:
-                c = (msgs[0].get("content") or "")[:120]
-                first = c.replace("\n", " ")
-            items.append({
+        items: List[Dict[str, Any]] = [
+            {
                 "session_id": r["session_id"],
-                "first_message": first,
-                "message_count": len(msgs),
+                "first_message": r["first_message"] or "",
+                "message_count": r["message_count"] or 0,
                 "created_at": r.get("created_at"),
                 "updated_at": r.get("updated_at"),
                 "status": "archived",
-            })
-        return items
+            }
+            for r in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = ChatService._encode_cursor(last["updated_at"], last["session_id"])
+        return items, next_cursor
 
 # Global service instanceclass FileService:
 class FileService:
@@ -1151,7 +1540,7 @@ class FileService:
     def _detect_mime(file_path: str) -> str:
         """Use libmagic to detect the true MIME type of the file."""
         try:
-        
+            import magic  # loaded on first upload, not at worker boot
             return magic.from_file(file_path, mime=True)  # e.g. "application/pdf"
         except Exception:
             return "unknown/unknown"
@@ -1160,6 +1549,7 @@ class FileService:
     def _detect_mime_from_bytes(raw: bytes) -> str:
         """Detect MIME directly from bytes via libmagic; fallback to octet-stream."""
         try:
+            import magic
             m = magic.from_buffer(raw, mime=True)
             return (m or "application/octet-stream").lower()
         except Exception:
@@ -1298,6 +1688,17 @@ class FileService:
         file_bytes: bytes,
         mime_type: Optional[str],
         original_name: Optional[str] = None
+    ) -> str:
+        """Extraction (PDF parsing, OCR) is CPU/IO heavy: run it off the event loop."""
+        return await asyncio.to_thread(
+            FileService._extract_text_from_bytes_sync, file_bytes, mime_type, original_name
+        )
+
+    @staticmethod
+    def _extract_text_from_bytes_sync(
+        file_bytes: bytes,
+        mime_type: Optional[str],
+        original_name: Optional[str] = None
     ) -> str:
         ext = (os.path.splitext(original_name)[1] or "").lower() if original_name else ""
         real_mime = FileService._detect_mime_from_bytes(file_bytes)
@@ -1365,7 +1766,9 @@ class FileService:
 
     @staticmethod
     def _extract_xlsx(file_path: str) -> str:
-        if load_workbook is None:
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
             return "[.xlsx extraction requires 'openpyxl' – pip install openpyxl]"
         try:
             wb = load_workbook(filename=file_path, data_only=True, read_only=True)
@@ -1382,7 +1785,9 @@ class FileService:
 
     @staticmethod
     def _extract_xls(file_path: str) -> str:
-        if xlrd is None:
+        try:
+            import xlrd
+        except ImportError:
             return "[.xls extraction requires 'xlrd' (<=1.2 for xls) – pip install xlrd]"
         try:
             wb = xlrd.open_workbook(file_path)
@@ -1402,7 +1807,9 @@ class FileService:
 
     @staticmethod
     def _extract_docx(file_path: str) -> str:
-        if Document is None:
+        try:
+            from docx import Document
+        except ImportError:
             return "[.docx extraction requires 'python-docx' – pip install python-docx]"
         try:
             doc = Document(file_path)
@@ -1436,7 +1843,9 @@ class FileService:
 
     @staticmethod
     def _extract_pdf(file_path: str) -> str:
-        if PdfReader is None:
+        try:
+            from PyPDF2 import PdfReader
+        except ImportError:
             return "[PDF extraction requires 'pypdf' – pip install pypdf]"
         try:
             reader = PdfReader(file_path)
@@ -1458,15 +1867,17 @@ class FileService:
 
     @staticmethod
     def _extract_image_ocr(file_path: str) -> str:
-        if Image is None or pytesseract is None:
+        try:
+            from PIL import Image
+            import pytesseract
+        except ImportError:
             return "[Image OCR requires 'Pillow' and 'pytesseract' (plus Tesseract installed). pip install pillow pytesseract]"
 
         # NEW: read from .env
         try:
             tcmd = os.getenv("TESSERACT_CMD")
             if tcmd:
-                import pytesseract as _pt
-                _pt.pytesseract.tesseract_cmd = tcmd
+                pytesseract.pytesseract.tesseract_cmd = tcmd
 
             # sanity check: raises if not found
             pytesseract.get_tesseract_version()
@@ -0,0 +1,217 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+DOCUMENT_MIRROR_MAX_DOCS = int(os.getenv("DOCUMENT_MIRROR_MAX_DOCS", "2000"))
+DOCUMENT_MIRROR_MAX_CHARS = int(os.getenv("DOCUMENT_MIRROR_MAX_CHARS", "2000000"))
+# Across all documents; the least recently used are dropped beyond it
+DOCUMENT_MIRROR_MAX_TOTAL_CHARS = int(os.getenv("DOCUMENT_MIRROR_MAX_TOTAL_CHARS", "100000000"))
+DOCUMENT_MIRROR_IDLE_SECONDS = int(os.getenv("DOCUMENT_MIRROR_IDLE_SECONDS", "3600"))
+
+
+class DocumentSyncError(Exception):
+    """Mirror is missing or out of date; the client must re-open the document."""
+
+
+@dataclass
+class MirroredDocument:
+    """Server-side copy of an editor document"""
+    document_id: str
+    user_id: str
+    text: str
+    version: int
+    language: Optional[str] = None
+    file_path: Optional[str] = None
+    workspace_id: Optional[str] = None
+    last_access: float = field(default_factory=time.time)
+
+
+def _utf16_column_to_index(line: str, character: int) -> int:
+    """Editor columns count UTF-16 code units; map one to a Python str index within `line`."""
+    units = 0
+    for i, ch in enumerate(line):
+        if units >= character:
+            return i
+        units += 2 if ord(ch) > 0xFFFF else 1
+    return len(line)
+
+
+def offset_at(text: str, line: int, character: int) -> int:
+    """Absolute str offset of an LSP-style (line, character) position, clamped to the text."""
+    start = 0
+    for _ in range(max(0, line)):
+        nl = text.find("\n", start)
+        if nl == -1:
+            return len(text)
+        start = nl + 1
+    end = text.find("\n", start)
+    line_text = text[start:] if end == -1 else text[start:end]
+    return start + _utf16_column_to_index(line_text, max(0, character))
+
+
+class DocumentMirror:
+    """
+    In-memory mirror of open editor documents, kept in sync with incremental edits.
+
+    Bounded LRU: at most DOCUMENT_MIRROR_MAX_DOCS documents holding at most
+    DOCUMENT_MIRROR_MAX_TOTAL_CHARS together, and documents idle longer than
+    DOCUMENT_MIRROR_IDLE_SECONDS are dropped. Documents above
+    DOCUMENT_MIRROR_MAX_CHARS are not mirrored at all. A dropped or stale
+    document raises DocumentSyncError so the client re-sends the full text
+    (or completes with its own prefix/suffix).
+
+    Mirrors live in this process only: with several workers (WORKERS > 1)
+    every client must be routed to the same worker (sticky sessions), which
+    the completion WebSocket gets for free; otherwise document open/change
+    and completions hit different mirrors.
+    """
+
+    def __init__(
+        self,
+        max_docs: int = DOCUMENT_MIRROR_MAX_DOCS,
+        max_chars: int = DOCUMENT_MIRROR_MAX_CHARS,
+        idle_seconds: int = DOCUMENT_MIRROR_IDLE_SECONDS,
+        max_total_chars: int = DOCUMENT_MIRROR_MAX_TOTAL_CHARS,
+    ):
+        self.max_docs = max_docs
+        self.max_chars = max_chars
+        self.idle_seconds = idle_seconds
+        self.max_total_chars = max_total_chars
+        self._docs: "OrderedDict[Tuple[str, str], MirroredDocument]" = OrderedDict()
+        self._total_chars = 0
+        self._evictions = 0
+        self._edits_applied = 0
+
+    def _touch(self, key: Tuple[str, str]) -> MirroredDocument:
+        doc = self._docs.get(key)
+        if doc is None:
+            raise DocumentSyncError(f"Document not open: {key[1]}")
+        if time.time() - doc.last_access > self.idle_seconds:
+            self._drop(key)
+            self._evictions += 1
+            raise DocumentSyncError(f"Document expired: {key[1]}")
+        doc.last_access = time.time()
+        self._docs.move_to_end(key)
+        return doc
+
+    def _drop(self, key: Tuple[str, str]) -> Optional[MirroredDocument]:
+        doc = self._docs.pop(key, None)
+        if doc is not None:
+            self._total_chars -= len(doc.text)
+        return doc
+
+    def _evict(self) -> None:
+        now = time.time()
+        # Oldest first: stop at the first document that is still fresh and fits the budgets
+        while self._docs:
+            key, doc = next(iter(self._docs.items()))
+            if (
+                len(self._docs) <= self.max_docs
+                and self._total_chars <= self.max_total_chars
+                and now - doc.last_access <= self.idle_seconds
+            ):
+                break
+            self._drop(key)
+            self._evictions += 1
+
+    def open(
+        self,
+        user_id: str,
+        document_id: str,
+        version: int,
+        text: str,
+        language: Optional[str] = None,
+        file_path: Optional[str] = None,
+        workspace_id: Optional[str] = None,
+    ) -> MirroredDocument:
+        """Register (or replace) a document with its full text."""
+        if len(text) > self.max_chars:
+            raise ValueError(f"Document too large to mirror ({len(text)} chars)")
+        key = (user_id, document_id)
+        doc = MirroredDocument(
+            document_id=document_id,
+            user_id=user_id,
+            text=text,
+            version=version,
+            language=language,
+            file_path=file_path,
+            workspace_id=workspace_id,
+        )
+        self._drop(key)
+        self._docs[key] = doc
+        self._total_chars += len(text)
+        self._evict()
+        return doc
+
+    def apply_changes(
+        self,
+        user_id: str,
+        document_id: str,
+        base_version: int,
+        version: int,
+        changes: List[Dict[str, Any]],
+    ) -> MirroredDocument:
+        """
+        Apply LSP-style content changes in order. Each change is
+        {"range": {"start": {"line", "character"}, "end": {...}}, "text": str};
+        a change without a range replaces the whole document.
+        """
+        doc = self._touch((user_id, document_id))
+        if doc.version != base_version:
+            raise DocumentSyncError(
+                f"Version mismatch for {document_id}: server has {doc.version}, edits are based on {base_version}"
+            )
+
+        text = doc.text
+        for change in changes:
+            rng = change.get("range")
+            if not rng:
+                text = change.get("text", "")
+                continue
+            start = offset_at(text, rng["start"]["line"], rng["start"]["character"])
+            end = offset_at(text, rng["end"]["line"], rng["end"]["character"])
+            text = text[:start] + change.get("text", "") + text[end:]
+
+        if len(text) > self.max_chars:
+            self.close(user_id, document_id)
+            raise DocumentSyncError(f"Document grew too large to mirror: {document_id}")
+
+        self._total_chars += len(text) - len(doc.text)
+        doc.text = text
+        doc.version = version
+        self._edits_applied += len(changes)
+        self._evict()
+        return doc
+
+    def get(self, user_id: str, document_id: str, version: Optional[int] = None) -> MirroredDocument:
+        """Return the mirror, requiring `version` to match when given."""
+        doc = self._touch((user_id, document_id))
+        if version is not None and doc.version != version:
+            raise DocumentSyncError(
+                f"Version mismatch for {document_id}: server has {doc.version}, request wants {version}"
+            )
+        return doc
+
+    def close(self, user_id: str, document_id: str) -> bool:
+        return self._drop((user_id, document_id)) is not None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self._docs),
+            "max_documents": self.max_docs,
+            "mirrored_chars": self._total_chars,
+            "max_total_chars": self.max_total_chars,
+            "edits_applied": self._edits_applied,
+            "evictions": self._evictions,
+        }
+
+
+# Global singleton
+document_mirror = DocumentMirror()
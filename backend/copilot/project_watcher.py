@@ -0,0 +1,250 @@
+import os
+import asyncio
+import inspect
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+from dotenv import load_dotenv
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # optional dependency – watcher is disabled without it
+    Observer = None
+    FileSystemEventHandler = object
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PROJECT_WATCH_ENABLED = os.getenv("PROJECT_WATCH_ENABLED", "true").lower() == "true"
+PROJECT_WATCH_MAX_ROOTS = int(os.getenv("PROJECT_WATCH_MAX_ROOTS", "32"))
+PROJECT_WATCH_DEBOUNCE_MS = int(os.getenv("PROJECT_WATCH_DEBOUNCE_MS", "500"))
+# Directories (os.pathsep-separated) projects may be watched under; nothing is watched when empty
+PROJECT_WATCH_ROOTS = [
+    os.path.realpath(p) for p in os.getenv("PROJECT_WATCH_ROOTS", "").split(os.pathsep) if p.strip()
+]
+# A watched root is the nearest directory holding one of these
+PROJECT_MARKERS = (".git", "pyproject.toml", "setup.py", "package.json", "go.mod", "Cargo.toml", "pom.xml")
+
+
+class _RootEventHandler(FileSystemEventHandler):
+    """Forwards file events of one watched root to the watcher (runs on the observer thread)."""
+
+    def __init__(self, watcher: "ProjectContextWatcher", root: str):
+        super().__init__()
+        self._watcher = watcher
+        self._root = root
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        paths = [event.src_path]
+        dest = getattr(event, "dest_path", None)
+        if dest:
+            paths.append(dest)
+        self._watcher._notify(self._root, paths)
+
+
+class ProjectContextWatcher:
+    """
+    Watches indexed project roots and reports changed files, debounced per root.
+
+    Events arrive on the watchdog thread and are handed to the event loop, so
+    `on_change(root, paths)` and `on_evict(root)` always run on the loop thread.
+    Either callback may be a coroutine function; it is then run as a task.
+    At most `max_roots` roots are watched; the least recently used is evicted.
+    Only project roots (see project_root) under `allowed_roots` are watched, so
+    a client-supplied path can't put a watch on / or on every subdirectory.
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[str, Set[str]], Any],
+        on_evict: Optional[Callable[[str], Any]] = None,
+        max_roots: int = PROJECT_WATCH_MAX_ROOTS,
+        debounce_ms: int = PROJECT_WATCH_DEBOUNCE_MS,
+        allowed_roots: Optional[Iterable[str]] = None,
+    ):
+        self._on_change = on_change
+        self.allowed_roots = [
+            os.path.realpath(p) for p in (PROJECT_WATCH_ROOTS if allowed_roots is None else allowed_roots)
+        ]
+        self._on_evict = on_evict
+        self.max_roots = max_roots
+        self.debounce_seconds = debounce_ms / 1000.0
+
+        self._observer = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watches: "OrderedDict[str, Any]" = OrderedDict()  # root -> ObservedWatch (LRU order)
+        self._pending: Dict[str, Set[str]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._callback_tasks: Set[asyncio.Task] = set()
+        self._events_seen = 0
+        self._flushes = 0
+        self._evictions = 0
+
+    @property
+    def available(self) -> bool:
+        return PROJECT_WATCH_ENABLED and Observer is not None
+
+    def is_watching(self, root_dir: str) -> bool:
+        return os.path.abspath(root_dir) in self._watches
+
+    def project_root(self, path: str) -> Optional[str]:
+        """
+        The project `path` belongs to: the nearest enclosing directory with a
+        PROJECT_MARKERS entry, searched up to (and including) the allowed root
+        containing it. None outside the allowed roots or without a marker.
+        """
+        current = os.path.realpath(path)
+        if not os.path.isdir(current):
+            current = os.path.dirname(current)
+        allowed = next(
+            (a for a in self.allowed_roots if os.path.commonpath([a, current]) == a), None
+        )
+        if allowed is None:
+            return None
+        while True:
+            if any(os.path.exists(os.path.join(current, m)) for m in PROJECT_MARKERS):
+                return current
+            if current == allowed:
+                return None
+            current = os.path.dirname(current)
+
+    # Watch management
+
+    def watch(self, root_dir: str) -> bool:
+        """Start (or refresh) watching a root. Must be called from the event loop thread."""
+        if not self.available:
+            return False
+
+        root = os.path.abspath(root_dir)
+        if root in self._watches:
+            self._watches.move_to_end(root)
+            return True
+        if not os.path.isdir(root) or self.project_root(root) != os.path.realpath(root):
+            return False  # not a project root under PROJECT_WATCH_ROOTS
+
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+
+        try:
+            if self._observer is None:
+                self._observer = Observer()
+                self._observer.daemon = True
+                self._observer.start()
+
+            while len(self._watches) >= self.max_roots:
+                oldest, _ = next(iter(self._watches.items()))
+                self.unwatch(oldest)
+                self._evictions += 1
+
+            self._watches[root] = self._observer.schedule(
+                _RootEventHandler(self, root), root, recursive=True
+            )
+            logger.info(f"Watching project root {root} ({len(self._watches)}/{self.max_roots})")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to watch project root {root}: {e}")
+            return False
+
+    def unwatch(self, root_dir: str) -> None:
+        """Stop watching a root and drop any pending changes for it."""
+        root = os.path.abspath(root_dir)
+        watch = self._watches.pop(root, None)
+        if watch is None:
+            return
+        try:
+            self._observer.unschedule(watch)
+        except Exception as e:
+            logger.debug(f"Unschedule failed for {root}: {e}")
+        timer = self._timers.pop(root, None)
+        if timer:
+            timer.cancel()
+        self._pending.pop(root, None)
+        if self._on_evict:
+            self._run_callback("evict", root, self._on_evict, root)
+
+    def stop(self) -> None:
+        """Stop all watches and the observer thread."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+        self._watches.clear()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=2)
+            except Exception as e:
+                logger.warning(f"Error stopping project watcher: {e}")
+            self._observer = None
+        logger.info("Project watcher stopped")
+
+    # Event plumbing
+
+    def _notify(self, root: str, paths: Iterable[str]) -> None:
+        """Called from the observer thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._enqueue, root, list(paths))
+
+    def _enqueue(self, root: str, paths: Iterable[str]) -> None:
+        if root not in self._watches:
+            return
+        self._events_seen += 1
+        self._pending.setdefault(root, set()).update(os.path.abspath(p) for p in paths)
+
+        # Debounce: every new event pushes the flush back
+        timer = self._timers.pop(root, None)
+        if timer:
+            timer.cancel()
+        self._timers[root] = self._loop.call_later(self.debounce_seconds, self._flush, root)
+
+    def _flush(self, root: str) -> None:
+        self._timers.pop(root, None)
+        paths = self._pending.pop(root, None)
+        if not paths or root not in self._watches:
+            return
+        self._flushes += 1
+        self._run_callback("change", root, self._on_change, root, paths)
+
+    def _run_callback(self, kind: str, root: str, callback: Callable[..., Any], *args: Any) -> None:
+        """Call a sync callback inline, or schedule an async one on the loop."""
+        try:
+            result = callback(*args)
+        except Exception as e:
+            logger.warning(f"Project watcher {kind} callback failed for {root}: {e}")
+            return
+        if not inspect.isawaitable(result):
+            return
+
+        async def run():
+            try:
+                await result
+            except Exception as e:
+                logger.warning(f"Project watcher {kind} callback failed for {root}: {e}")
+
+        try:
+            task = asyncio.ensure_future(run(), loop=self._loop)
+        except RuntimeError:
+            if inspect.iscoroutine(result):
+                result.close()  # loop gone (shutdown): nothing left to update
+            return
+        self._callback_tasks.add(task)
+        task.add_done_callback(self._callback_tasks.discard)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "available": self.available,
+            "watched_roots": len(self._watches),
+            "max_roots": self.max_roots,
+            "allowed_roots": len(self.allowed_roots),
+            "debounce_ms": int(self.debounce_seconds * 1000),
+            "events_seen": self._events_seen,
+            "flushes": self._flushes,
+            "evictions": self._evictions,
+        }
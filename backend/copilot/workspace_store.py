@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import posixpath
+from typing import Any, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from redis_client import redis_client
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+WORKSPACE_BLOB_DIR = os.getenv("WORKSPACE_BLOB_DIR", "./workspace_blobs")
+WORKSPACE_TTL_SECONDS = int(os.getenv("WORKSPACE_TTL_SECONDS", "604800"))
+WORKSPACE_MAX_BLOB_BYTES = int(os.getenv("WORKSPACE_MAX_BLOB_BYTES", "1048576"))
+WORKSPACE_MAX_FILES = int(os.getenv("WORKSPACE_MAX_FILES", "20000"))
+# Unreferenced blobs are deleted by a periodic sweep; 0 disables it
+WORKSPACE_BLOB_GC_INTERVAL_SECONDS = int(os.getenv("WORKSPACE_BLOB_GC_INTERVAL_SECONDS", "3600"))
+# Blobs younger than this are kept even if unreferenced (uploads racing their manifest)
+WORKSPACE_BLOB_GC_GRACE_SECONDS = int(os.getenv("WORKSPACE_BLOB_GC_GRACE_SECONDS", "3600"))
+
+_SHA256_HEX_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class WorkspaceStore:
+    """
+    Client-pushed workspace snapshots.
+
+    Blobs are stored once on disk, addressed by their sha256. Each workspace
+    has a manifest (relative path -> hash) in a Redis hash, plus a version
+    counter bumped on every sync so derived caches can key on it. Manifests
+    expire after WORKSPACE_TTL_SECONDS; a periodic sweep then deletes the
+    blobs no live manifest references.
+
+    Manifests are shared through Redis but blobs are not: on more than one
+    host WORKSPACE_BLOB_DIR must be a shared volume, or a blob reported as
+    present by one host is unreadable on the others.
+    """
+
+    def __init__(
+        self,
+        blob_dir: str = WORKSPACE_BLOB_DIR,
+        gc_interval: int = WORKSPACE_BLOB_GC_INTERVAL_SECONDS,
+        gc_grace: int = WORKSPACE_BLOB_GC_GRACE_SECONDS,
+    ):
+        self.blob_dir = blob_dir
+        self.gc_interval = gc_interval
+        self.gc_grace = gc_grace
+        # Fallback manifests when Redis is unavailable (single-worker only)
+        self._local_manifests: Dict[str, Dict[str, str]] = {}
+        self._local_versions: Dict[str, int] = {}
+        self._gc_task: Optional[asyncio.Task] = None
+        self._gc_runs = 0
+        self._gc_deleted = 0
+
+    # Keys
+
+    @staticmethod
+    def _manifest_key(user_id: str, workspace_id: str) -> str:
+        return f"workspace:{user_id}:{workspace_id}"
+
+    @staticmethod
+    def _version_key(user_id: str, workspace_id: str) -> str:
+        return f"workspace:{user_id}:{workspace_id}:version"
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        """Workspace-relative POSIX path; rejects anything escaping the root."""
+        norm = posixpath.normpath(path.replace("\\", "/")).lstrip("/")
+        if norm in ("", ".") or norm.startswith("../"):
+            raise ValueError(f"Invalid workspace path: {path}")
+        return norm
+
+    # Blobs
+
+    def _blob_path(self, content_hash: str) -> str:
+        h = content_hash.lower()
+        # Hashes come from clients: never let one become a path outside blob_dir
+        if not _SHA256_HEX_RE.match(h):
+            raise ValueError(f"Invalid blob hash: {content_hash[:80]!r}")
+        return os.path.join(self.blob_dir, h[:2], h)
+
+    def has_blob(self, content_hash: str) -> bool:
+        try:
+            return os.path.exists(self._blob_path(content_hash))
+        except ValueError:
+            return False
+
+    def put_blob(self, content_hash: str, content: str) -> bool:
+        """Store content under its hash; refuses mismatched or oversized content."""
+        data = content.encode("utf-8")
+        if len(data) > WORKSPACE_MAX_BLOB_BYTES:
+            return False
+        if hashlib.sha256(data).hexdigest() != content_hash.lower():
+            return False
+        path = self._blob_path(content_hash)
+        if os.path.exists(path):
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # atomic: readers never see partial blobs
+        return True
+
+    def read_blob(self, content_hash: str) -> Optional[str]:
+        try:
+            with open(self._blob_path(content_hash), "r", encoding="utf-8", errors="ignore") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    # Garbage collection
+
+    async def _referenced_hashes(self) -> Set[str]:
+        """Hashes in every live manifest (this worker's local ones included)."""
+        referenced = {h for manifest in self._local_manifests.values() for h in manifest.values()}
+        keys = [k for k in await redis_client.scan_keys("workspace:*") if not k.endswith(":version")]
+        for values in await redis_client.hash_values_many(keys):
+            referenced.update(values)
+        return referenced
+
+    def _sweep(self, referenced: Set[str], cutoff: float) -> int:
+        deleted = 0
+        for dirpath, _, filenames in os.walk(self.blob_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    if name in referenced or os.path.getmtime(path) > cutoff:
+                        continue
+                    os.remove(path)  # also stale .tmp files of crashed uploads
+                    deleted += 1
+                except OSError:
+                    continue
+        return deleted
+
+    async def gc_blobs(self) -> int:
+        """Delete blobs that no live manifest references; returns the number deleted."""
+        if not os.path.isdir(self.blob_dir):
+            return 0
+        if not redis_client.is_connected:
+            return 0  # the manifests are in Redis: without them every blob looks unreferenced
+        # Listed before the walk starts: a blob synced meanwhile is newer than the grace cutoff
+        cutoff = time.time() - self.gc_grace
+        referenced = await self._referenced_hashes()
+        deleted = await asyncio.to_thread(self._sweep, referenced, cutoff)
+        self._gc_runs += 1
+        self._gc_deleted += deleted
+        if deleted:
+            logger.info(f"Workspace blob GC deleted {deleted} unreferenced blob(s)")
+        return deleted
+
+    def start_gc(self) -> None:
+        if self.gc_interval <= 0 or self._gc_task is not None:
+            return
+        self._gc_task = asyncio.create_task(self._run_gc())
+
+    async def stop_gc(self) -> None:
+        if self._gc_task is None:
+            return
+        self._gc_task.cancel()
+        await asyncio.gather(self._gc_task, return_exceptions=True)
+        self._gc_task = None
+
+    async def _run_gc(self) -> None:
+        while True:
+            # Jittered, so workers sharing a blob volume don't sweep together
+            await asyncio.sleep(self.gc_interval * random.uniform(0.8, 1.2))
+            try:
+                await self.gc_blobs()
+            except Exception as e:
+                # e.g. Redis unreachable: deleting without the manifests would be unsafe
+                logger.warning(f"Workspace blob GC skipped: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "gc_interval_seconds": self.gc_interval,
+            "gc_runs": self._gc_runs,
+            "gc_deleted_blobs": self._gc_deleted,
+        }
+
+    # Manifests
+
+    async def get_manifest(self, user_id: str, workspace_id: str) -> Dict[str, str]:
+        if redis_client.is_connected:
+            return await redis_client.hash_get_all(self._manifest_key(user_id, workspace_id))
+        return dict(self._local_manifests.get(self._manifest_key(user_id, workspace_id), {}))
+
+    async def get_version(self, user_id: str, workspace_id: str) -> int:
+        if redis_client.is_connected:
+            return int(await redis_client.get(self._version_key(user_id, workspace_id)) or 0)
+        return self._local_versions.get(self._manifest_key(user_id, workspace_id), 0)
+
+    async def apply_sync(
+        self,
+        user_id: str,
+        workspace_id: str,
+        files: List[Tuple[str, str]],
+        removed: List[str],
+        full_snapshot: bool = False,
+    ) -> Tuple[List[str], int]:
+        """
+        Apply a manifest (full) or delta to the workspace.
+        Returns (hashes the server is missing, file count after the sync).
+        """
+        entries = {self.normalize_path(p): h.lower() for p, h in files}
+        for h in entries.values():
+            self._blob_path(h)  # ValueError for anything but a sha256 hex digest
+        gone = [self.normalize_path(p) for p in removed]
+        key = self._manifest_key(user_id, workspace_id)
+
+        if redis_client.is_connected:
+            await redis_client.hash_set_many(
+                key, entries, remove=gone, replace=full_snapshot, expiry=WORKSPACE_TTL_SECONDS
+            )
+            await redis_client.incr(self._version_key(user_id, workspace_id), WORKSPACE_TTL_SECONDS)
+            manifest = await redis_client.hash_get_all(key)
+        else:
+            manifest = {} if full_snapshot else self._local_manifests.get(key, {})
+            for p in gone:
+                manifest.pop(p, None)
+            manifest.update(entries)
+            self._local_manifests[key] = manifest
+            self._local_versions[key] = self._local_versions.get(key, 0) + 1
+
+        if len(manifest) > WORKSPACE_MAX_FILES:
+            logger.warning(f"Workspace {workspace_id} has {len(manifest)} files (limit {WORKSPACE_MAX_FILES})")
+
+        missing = sorted({h for h in entries.values() if not self.has_blob(h)})
+        return missing, len(manifest)
+
+    async def get_directory_files(
+        self, user_id: str, workspace_id: str, directory: str, max_chars: int
+    ) -> Dict[str, str]:
+        """Contents of the synced files under `directory`, in path order, up to max_chars."""
+        prefix = self.normalize_path(directory) + "/" if directory not in ("", ".") else ""
+        manifest = await self.get_manifest(user_id, workspace_id)
+        files: Dict[str, str] = {}
+        total_len = 0
+        for path in sorted(p for p in manifest if p.startswith(prefix)):
+            content = self.read_blob(manifest[path])
+            if content is None:
+                continue
+            files[path] = content
+            total_len += len(content)
+            if total_len > max_chars:
+                break
+        return files
+
+
+# Global singleton
+workspace_store = WorkspaceStore()
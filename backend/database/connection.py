@@ -10,6 +10,10 @@ from contextlib import asynccontextmanager
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Match delimiters in search snippets (chr(2)/chr(3) in search_chat_messages)
+SNIPPET_START_SEL = "\x02"
+SNIPPET_STOP_SEL = "\x03"
+
 class PostgreSQLConnection:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
@@ -123,22 +127,253 @@ class PostgreSQLConnection:
             return False
         
     
-    async def save_chat_session(self, session_id: str, messages, user_id: str) -> bool:
-        sql = """
+    # Chat persistence: chat_sessions (one row per session) + chat_messages
+    # (append-only, one row per message, keyed by (session_id, seq)).
+    # See database/migrations/001_chat_messages.sql.
+
+    @staticmethod
+    def _parse_ts(value) -> datetime:
+        if isinstance(value, datetime):
+            return value
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return datetime.utcnow()
+
+    async def save_chat_session(
+        self, session_id: str, messages, user_id: str, first_seq: int = 0,
+        attachments: Optional[Dict[str, str]] = None,
+    ) -> bool:
+        """Persist one session; `messages` are consecutive, the first one having seq `first_seq`."""
+        return await self.save_chat_sessions([(session_id, user_id, first_seq, messages)], attachments)
+
+    async def save_chat_sessions(self, sessions: List[tuple], attachments: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Persist several (session_id, user_id, first_seq, messages) sessions in one
+        transaction: one multi-row upsert of the session rows, then a single
+        INSERT of only the messages past what each session already has.
+        Existing messages are never rewritten. `attachments` (sha256 -> text)
+        referenced by the messages are stored alongside (004_attachments.sql).
+        """
+        if not sessions:
+            return True
+        # A message's own "seq" (set when read from the cache) wins over its position:
+        # entries the cache couldn't decode leave gaps that positions would close
+        latest = {
+            session_id: (session_id, user_id, [
+                (m.get("seq", first_seq + offset), m) for offset, m in enumerate(messages)
+            ])
+            for session_id, user_id, first_seq, messages in sessions if messages
+        }
+        if not latest:
+            return True
+
+        values, args = [], []
+        for session_id, user_id, numbered in latest.values():
+            n = len(args)
+            values.append(f"(${n + 1}, ${n + 2}, ${n + 3}::jsonb, NOW(), NOW())")
+            args.extend([session_id, user_id, json.dumps({"message_count": numbered[-1][0] + 1})])
+        # ON CONFLICT cannot touch the same row twice in one statement, hence `latest`
+        upsert_sql = f"""
         INSERT INTO public.chat_sessions (session_id, user_id, metadata, created_at, updated_at)
-        VALUES ($1, $2, $3::jsonb, NOW(), NOW())
+        VALUES {", ".join(values)}
         ON CONFLICT (session_id) DO UPDATE
-        SET metadata   = EXCLUDED.metadata,
+        SET metadata   = COALESCE(public.chat_sessions.metadata, '{{}}'::jsonb)
+                         || jsonb_build_object('message_count', GREATEST(
+                                (EXCLUDED.metadata->>'message_count')::int,
+                                COALESCE((public.chat_sessions.metadata->>'message_count')::int, 0))),
             user_id    = COALESCE(EXCLUDED.user_id, public.chat_sessions.user_id),
             updated_at = NOW();
         """
-        metadata = {"messages": messages, "message_count": len(messages)}
-        # IMPORTANT: ::jsonb expects a JSON string, not a Python dict
-        return await self.execute_command(sql, session_id, user_id, json.dumps(metadata))
+        try:
+            async with self.get_connection() as conn:
+                async with conn.transaction():
+                    await conn.execute(upsert_sql, *args)
+                    if attachments:
+                        await conn.execute(
+                            """
+                            INSERT INTO public.attachments (sha256, text)
+                            SELECT * FROM unnest($1::text[], $2::text[])
+                            ON CONFLICT (sha256) DO NOTHING
+                            """,
+                            list(attachments), list(attachments.values()),
+                        )
+                    stored = {
+                        r["session_id"]: r["next_seq"]
+                        for r in await conn.fetch(
+                            "SELECT session_id, MAX(seq) + 1 AS next_seq FROM public.chat_messages "
+                            "WHERE session_id = ANY($1::text[]) GROUP BY session_id",
+                            list(latest),
+                        )
+                    }
+                    cols = ([], [], [], [], [], [])
+                    for session_id, user_id, numbered in latest.values():
+                        next_seq = stored.get(session_id, 0)
+                        first, last = numbered[0][0], numbered[-1][0]
+                        if last + 1 < next_seq:
+                            # The cache always holds the newest messages: a tail ending below
+                            # the stored MAX(seq) means its sequence counter fell behind
+                            logger.error(
+                                f"Chat session {session_id}: cached messages end at seq "
+                                f"{last} but Postgres has {next_seq - 1}; "
+                                f"sequence counter is behind, {len(numbered)} message(s) not persisted"
+                            )
+                            continue
+                        if first > next_seq:
+                            # Messages trimmed from the cache before they were ever persisted
+                            logger.error(
+                                f"Chat session {session_id}: cached messages start at seq {first} "
+                                f"but Postgres ends at {next_seq - 1}; "
+                                f"{first - next_seq} message(s) were lost before persisting"
+                            )
+                        for seq, m in numbered:
+                            if seq < next_seq:
+                                continue  # already persisted
+                            cols[0].append(session_id)
+                            cols[1].append(seq)
+                            cols[2].append(m.get("role") or "user")
+                            cols[3].append(m.get("content") or "")
+                            cols[4].append(self._parse_ts(m.get("timestamp")))
+                            cols[5].append(user_id)
+                    if cols[0]:
+                        # Rows enter the search index (003_chat_messages_search.sql) as they are inserted
+                        status = await conn.execute(
+                            """
+                            INSERT INTO public.chat_messages (session_id, seq, role, content, ts, user_id)
+                            SELECT * FROM unnest($1::text[], $2::int[], $3::text[], $4::text[], $5::timestamp[], $6::text[])
+                            ON CONFLICT (session_id, seq) DO NOTHING
+                            """,
+                            *cols,
+                        )
+                        inserted = int(status.rsplit(" ", 1)[-1])  # "INSERT 0 <rows>"
+                        if inserted < len(cols[0]):
+                            logger.warning(
+                                f"{len(cols[0]) - inserted} chat message(s) hit an existing (session_id, seq) "
+                                f"and were not written (sessions: {', '.join(sorted(set(cols[0])))})"
+                            )
+            return True
+        except Exception as e:
+            logger.error(f"save_chat_sessions error: {e}")
+            return False
 
+    async def get_attachment_text(self, content_hash: str) -> Optional[str]:
+        row = await self.fetch_one("SELECT text FROM public.attachments WHERE sha256 = $1", content_hash)
+        return row["text"] if row else None
+
+    async def align_cached_messages(self, session_id: str, user_id: str, messages: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Seq of messages[0] for a cached tail whose sequence counter was lost:
+        the longest prefix of `messages` equal (role, content) to the end of the
+        stored session overlaps it; everything after continues from MAX(seq)+1.
+        None if Postgres can't be read.
+        """
+        if not self.is_connected:
+            return None
+        try:
+            async with self.get_connection() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT seq, role, content FROM public.chat_messages
+                    WHERE session_id = $1 AND user_id = $2
+                    ORDER BY seq DESC LIMIT $3
+                    """,
+                    session_id, user_id, len(messages),
+                )
+        except Exception as e:
+            logger.error(f"align_cached_messages error: {e}")
+            return None
+        tail = [(r["role"], r["content"]) for r in reversed(rows)]
+        next_seq = rows[0]["seq"] + 1 if rows else 0
+        cached = [(m.get("role"), m.get("content")) for m in messages]
+        for overlap in range(min(len(tail), len(cached)), 0, -1):
+            if tail[len(tail) - overlap:] == cached[:overlap]:
+                return next_seq - overlap
+        return next_seq
+
+    async def get_chat_messages(
+        self,
+        session_id: str,
+        user_id: str,
+        *,
+        limit: Optional[int] = None,
+        before_seq: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Chronological messages of `user_id`'s session, read by primary-key range:
+        the last `limit` messages before `before_seq` (all when both are None).
+        Each message carries its `seq`. Another user's session reads as empty.
+        """
+        rows = await self.execute_query(
+            """
+            SELECT seq, role, content, ts
+            FROM public.chat_messages
+            WHERE session_id = $1 AND seq < COALESCE($2::int, 2147483647)
+              AND user_id = $4
+            ORDER BY seq DESC
+            LIMIT $3
+            """,
+            session_id, before_seq, limit, user_id,
+        )
+        rows.reverse()  # oldest → newest
+        return [
+            {
+                "role": r["role"],
+                "content": r["content"],
+                "timestamp": r["ts"].isoformat() if r["ts"] else None,
+                "user_id": user_id,
+                "seq": r["seq"],
+            }
+            for r in rows
+        ]
+
+    async def search_chat_messages(self, user_id: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Full-text search of one user's persisted messages, best match first.
+        `query` uses web-search syntax ("quoted phrase", or, -exclude). Matching
+        and the user filter are both answered by chat_messages_user_search_idx;
+        attachment text is matched by attachments_search_idx and joined back to
+        the user's referencing messages (004_attachments.sql). Highlights are
+        computed only for the rows returned.
+        """
+        return await self.execute_query(
+            """
+            SELECT
+                hit.session_id,
+                hit.seq,
+                hit.role,
+                hit.ts,
+                hit.rank,
+                -- Raw message text: matches are delimited by chr(2)/chr(3), the caller escapes it
+                ts_headline('english', hit.content, hit.query,
+                            'StartSel=' || chr(2) || ', StopSel=' || chr(3)
+                            || ', MaxFragments=2, MinWords=5, MaxWords=20') AS snippet
+            FROM (
+                SELECT m.session_id, m.seq, m.role, m.ts, m.content, q.query,
+                       ts_rank_cd(to_tsvector('english', m.content), q.query) AS rank
+                FROM public.chat_messages m,
+                     websearch_to_tsquery('english', $2) AS q(query)
+                WHERE m.user_id = $1
+                  AND to_tsvector('english', m.content) @@ q.query
+                UNION ALL
+                SELECT m.session_id, m.seq, m.role, m.ts,
+                       split_part(m.content, chr(10), 1) || chr(10) || a.text, q.query,
+                       ts_rank_cd(to_tsvector('english', a.text), q.query) AS rank
+                FROM public.attachments a
+                CROSS JOIN websearch_to_tsquery('english', $2) AS q(query)
+                JOIN public.chat_messages m
+                  ON m.user_id = $1 AND m.role = 'system' AND right(m.content, 64) = a.sha256
+                WHERE to_tsvector('english', a.text) @@ q.query
+                ORDER BY rank DESC, ts DESC
+                LIMIT $3
+            ) hit
+            ORDER BY hit.rank DESC, hit.ts DESC
+            """,
+            user_id, query, limit,
+        )
 
     # --- LOAD: always return a dict with "messages" & "message_count" ---
-    async def get_chat_session(self, session_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    async def get_chat_session(self, session_id: str, user_id: str, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Session row plus its messages (the last `limit` ones if given); message_count is the full count."""
         row = await self.fetch_one(
             """
             SELECT session_id, user_id, metadata, created_at, updated_at
@@ -160,46 +395,61 @@ class PostgreSQLConnection:
         if not isinstance(md, dict):
             md = {}
 
-        msgs = md.get("messages")
-        if not isinstance(msgs, list):
-            msgs = []
+        msgs = await self.get_chat_messages(session_id, user_id, limit=limit)
+        if msgs:
+            count = msgs[-1]["seq"] + 1
+        else:
+            # Not migrated yet (see 001_chat_messages.sql): messages still in the blob
+            msgs = md.get("messages") if isinstance(md.get("messages"), list) else []
+            count = len(msgs)
+            if limit:
+                msgs = msgs[-limit:]
 
         row["messages"] = msgs
-        row["message_count"] = (md.get("message_count")
-                                if isinstance(md.get("message_count"), int)
-                                else len(msgs))
-        # Optional: hide raw metadata if you want
-        # row.pop("metadata", None)
-
+        row["message_count"] = count
+        row.pop("metadata", None)
         return row
 
 
-    
     # --- list sessions for sidebar/history (lightweight) ---
-    async def get_user_chat_sessions(self, user_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    async def get_user_chat_sessions(
+        self,
+        user_id: str,
+        limit: int = 50,
+        before: Optional[tuple] = None,
+    ) -> List[Dict[str, Any]]:
         """
-        Return lightweight rows for the sidebar: first_message preview and message_count,
-        computed directly in SQL from metadata->'messages'.
+        Return lightweight rows for the sidebar, newest first: first_message preview
+        (from chat_messages seq 0) and message_count are computed in SQL, so no
+        message content beyond the preview leaves the database.
+        Keyset pagination: `before` is the (updated_at, session_id) of the last row
+        of the previous page; served by chat_sessions_user_updated_idx
+        (database/migrations/002_chat_sessions_keyset.sql).
         """
-        rows = await self.execute_query(
-            """
+        args: List[Any] = [user_id, limit]
+        keyset = ""
+        if before is not None:
+            keyset = "AND (s.updated_at, s.session_id) < ($3, $4)"
+            args.extend(before)
+        return await self.execute_query(
+            f"""
             SELECT
-                session_id,
-                user_id,
-                created_at,
-                updated_at,
-                -- count messages directly in SQL (0 if missing)
-                COALESCE(jsonb_array_length(metadata->'messages'), 0) AS message_count,
+                s.session_id,
+                s.user_id,
+                s.created_at,
+                s.updated_at,
+                COALESCE((s.metadata->>'message_count')::int, 0) AS message_count,
                 -- first message content preview (empty if none)
-                LEFT(COALESCE((metadata->'messages'->0->>'content'), ''), 10) AS first_message
-            FROM public.chat_sessions
-            WHERE user_id = $1
-            ORDER BY updated_at DESC NULLS LAST, created_at DESC NULLS LAST
-            LIMIT $2 OFFSET $3
+                REPLACE(LEFT(COALESCE(fm.content, ''), 120), chr(10), ' ') AS first_message
+            FROM public.chat_sessions s
+            LEFT JOIN public.chat_messages fm
+                   ON fm.session_id = s.session_id AND fm.seq = 0
+            WHERE s.user_id = $1 {keyset}
+            ORDER BY s.updated_at DESC, s.session_id DESC
+            LIMIT $2
             """,
-            user_id, limit, offset
+            *args
         )
-        return rows
 
 
 # Global PostgreSQL instance
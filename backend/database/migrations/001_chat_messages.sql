@@ -0,0 +1,44 @@
+-- 001: chat messages move out of chat_sessions.metadata into an append-only table.
+--
+--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f database/migrations/001_chat_messages.sql
+--
+-- chat_sessions keeps one row per session (owner, timestamps, metadata.message_count);
+-- each message is one row keyed by (session_id, seq), seq = 0, 1, 2, ... per session.
+-- Safe to re-run: the backfill skips rows that already exist.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.chat_messages (
+    session_id  TEXT        NOT NULL,
+    seq         INTEGER     NOT NULL,
+    role        TEXT        NOT NULL,
+    content     TEXT        NOT NULL,
+    ts          TIMESTAMP   NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+    PRIMARY KEY (session_id, seq)
+);
+
+-- Backfill from metadata.messages (array order becomes seq)
+INSERT INTO public.chat_messages (session_id, seq, role, content, ts)
+SELECT
+    s.session_id,
+    m.ord - 1,
+    COALESCE(m.msg->>'role', 'user'),
+    COALESCE(m.msg->>'content', ''),
+    COALESCE(
+        CASE WHEN m.msg->>'timestamp' ~ '^\d{4}-\d{2}-\d{2}T'
+             THEN (m.msg->>'timestamp')::timestamp END,
+        s.updated_at,
+        NOW() AT TIME ZONE 'utc'
+    )
+FROM public.chat_sessions s
+CROSS JOIN LATERAL jsonb_array_elements(s.metadata->'messages') WITH ORDINALITY AS m(msg, ord)
+WHERE jsonb_typeof(s.metadata->'messages') = 'array'
+ON CONFLICT (session_id, seq) DO NOTHING;
+
+-- Drop the copied blobs; keep the count the sidebar shows
+UPDATE public.chat_sessions
+SET metadata = (metadata - 'messages')
+             || jsonb_build_object('message_count', jsonb_array_length(metadata->'messages'))
+WHERE jsonb_typeof(metadata->'messages') = 'array';
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- 002: keyset pagination of the session sidebar on (updated_at, session_id).
+--
+--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f database/migrations/002_chat_sessions_keyset.sql
+--
+-- Row comparisons skip NULLs, so updated_at becomes NOT NULL first.
+
+BEGIN;
+
+UPDATE public.chat_sessions
+SET updated_at = COALESCE(created_at, NOW())
+WHERE updated_at IS NULL;
+
+ALTER TABLE public.chat_sessions
+    ALTER COLUMN updated_at SET DEFAULT NOW(),
+    ALTER COLUMN updated_at SET NOT NULL;
+
+COMMIT;
+
+-- WHERE user_id = $1 AND (updated_at, session_id) < ($2, $3)
+-- ORDER BY updated_at DESC, session_id DESC LIMIT n  -> backward index range scan, no sort.
+-- CONCURRENTLY cannot run inside a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_sessions_user_updated_idx
+    ON public.chat_sessions (user_id, updated_at, session_id);
@@ -0,0 +1,23 @@
+-- 003: full-text search over chat messages.
+--
+--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f database/migrations/003_chat_messages_search.sql
+--
+-- chat_messages gets the owning user_id (denormalized from chat_sessions) so a
+-- single GIN index answers "this user's messages matching the query" without
+-- touching other users' matches. The index is on an expression, so rows are
+-- indexed as they are inserted and nothing is rewritten. Queries must use the
+-- exact same expression: to_tsvector('english', content).
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+ALTER TABLE public.chat_messages ADD COLUMN IF NOT EXISTS user_id TEXT;
+
+-- One-off backfill; on large tables run it in session_id ranges
+UPDATE public.chat_messages m
+SET user_id = s.user_id
+FROM public.chat_sessions s
+WHERE m.session_id = s.session_id AND m.user_id IS NULL;
+
+-- CONCURRENTLY cannot run inside a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_messages_user_search_idx
+    ON public.chat_messages USING GIN (user_id, to_tsvector('english', content));
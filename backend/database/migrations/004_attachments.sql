@@ -0,0 +1,23 @@
+-- 004: extracted attachment text, shared by every session that references it.
+--
+--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f database/migrations/004_attachments.sql
+--
+-- Chat rows store only "[Attachment: name]\n@attachment:<sha256>"; the text is
+-- written here (keyed by that sha256) in the same transaction as the messages
+-- that reference it, so it survives any host's local cache.
+
+CREATE TABLE IF NOT EXISTS public.attachments (
+    sha256      CHAR(64)    PRIMARY KEY,
+    text        TEXT        NOT NULL,
+    created_at  TIMESTAMP   NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+);
+
+-- Search (see 003): attachment text matches, then joined back to the user's
+-- referencing messages by the hash at the end of their content.
+-- CONCURRENTLY cannot run inside a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS attachments_search_idx
+    ON public.attachments USING GIN (to_tsvector('english', text));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_messages_attachment_ref_idx
+    ON public.chat_messages (user_id, right(content, 64))
+    WHERE role = 'system';
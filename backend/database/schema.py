@@ -118,22 +118,35 @@ class CloseChatRequest(BaseModel):
 
 
 class CodeCompletionRequest(BaseModel):
-    text: str = Field(..., min_length=1, max_length=2000, description="Code context")
+    text: Optional[str] = Field(None, max_length=2000, description="Code context (optional with document_id; used when the document is not mirrored)")
     session_id: Optional[str] = Field(default="code_completion", max_length=255)
     user_id: str = Field(..., max_length=50, description="User identifier")
     source: Optional[str] = Field(default="autocomplete")
     language: Optional[SupportedLanguage] = None
     file_path: Optional[str] = Field(None, max_length=500)
+    workspace_id: Optional[str] = Field(None, max_length=255, description="Synced workspace; file_path is then workspace-relative")
+    document_id: Optional[str] = Field(None, max_length=1000, description="Mirrored document to complete in")
+    document_version: Optional[int] = Field(None, description="Mirrored document version the cursor refers to")
     cursor_position: Optional[Dict[str, int]] = Field(None, description="Cursor line/column position")
     context: Optional[Dict[str, Any]] = Field(None, description="Before/after code context")
 
     @field_validator("text")
     @classmethod
-    def _non_empty_code(cls, v: str) -> str:
-        if not v or not v.strip():
+    def _non_empty_code(cls, v: Optional[str]) -> Optional[str]:
+        if v is None:
+            return v
+        if not v.strip():
             raise ValueError("Code text cannot be empty")
         return v.strip()
 
+    @model_validator(mode="after")
+    def _text_or_document(self) -> "CodeCompletionRequest":
+        if self.text is None and not self.document_id:
+            raise ValueError("Either text or document_id is required")
+        if self.document_id and not self.cursor_position:
+            raise ValueError("cursor_position is required with document_id")
+        return self
+
     @model_validator(mode="before")
     @classmethod
     def _set_language_from_extension(cls, data: Any) -> Any:
@@ -149,6 +162,60 @@ class CodeCompletionRequest(BaseModel):
                     data["language"] = mapped
         return data
 
+# Document mirror (incremental edit sync)
+class TextPosition(BaseModel):
+    line: int = Field(..., ge=0)
+    character: int = Field(..., ge=0)
+
+class TextRange(BaseModel):
+    start: TextPosition
+    end: TextPosition
+
+class TextDocumentChange(BaseModel):
+    range: Optional[TextRange] = Field(None, description="Replaced range; omit to replace the whole document")
+    text: str = Field(..., description="Inserted text")
+
+class DocumentOpenRequest(BaseModel):
+    user_id: str = Field(..., max_length=50, description="User identifier")
+    document_id: str = Field(..., max_length=1000, description="Editor document URI")
+    version: int = Field(..., description="Editor document version")
+    text: str = Field(..., description="Full document text")
+    language: Optional[str] = Field(None, max_length=50, description="Editor language id")
+    file_path: Optional[str] = Field(None, max_length=500)
+    workspace_id: Optional[str] = Field(None, max_length=255)
+
+class DocumentChangeRequest(BaseModel):
+    user_id: str = Field(..., max_length=50, description="User identifier")
+    document_id: str = Field(..., max_length=1000, description="Editor document URI")
+    base_version: int = Field(..., description="Version the changes apply to")
+    version: int = Field(..., description="Version after applying the changes")
+    changes: List[TextDocumentChange] = Field(..., description="Changes, applied in order")
+
+class DocumentCloseRequest(BaseModel):
+    user_id: str = Field(..., max_length=50, description="User identifier")
+    document_id: str = Field(..., max_length=1000, description="Editor document URI")
+
+# Workspace snapshot sync (client-pushed, content-addressed)
+class WorkspaceFileEntry(BaseModel):
+    path: str = Field(..., max_length=500, description="Workspace-relative path")
+    hash: str = Field(..., pattern=r"^[0-9a-f]{64}$", description="sha256 hex of the file content")
+
+class WorkspaceSyncRequest(BaseModel):
+    user_id: str = Field(..., max_length=50, description="User identifier")
+    workspace_id: str = Field(..., max_length=255, description="Workspace identifier")
+    files: List[WorkspaceFileEntry] = Field(default_factory=list, description="Added or changed files")
+    removed: List[str] = Field(default_factory=list, description="Deleted workspace-relative paths")
+    full_snapshot: bool = Field(default=False, description="Replace the manifest instead of applying a delta")
+
+class WorkspaceBlob(BaseModel):
+    hash: str = Field(..., pattern=r"^[0-9a-f]{64}$", description="sha256 hex of content")
+    content: str = Field(..., description="UTF-8 file content")
+
+class WorkspaceBlobUploadRequest(BaseModel):
+    user_id: str = Field(..., max_length=50, description="User identifier")
+    workspace_id: str = Field(..., max_length=255, description="Workspace identifier")
+    blobs: List[WorkspaceBlob] = Field(..., description="Blobs requested by a previous sync")
+
 # Responses
 
 class ChatResponse(BaseModel):
@@ -173,6 +240,7 @@ class LoadChatResponse(BaseModel):
     session_id: str = Field(..., description="Loaded session identifier")
     user_id: str = Field(..., description="User identifier")
     message_count: int = Field(..., description="Number of messages loaded")
+    total_messages: Optional[int] = Field(None, description="Messages in the whole session (older ones via /chat/session/history)")
     status: SessionStatus = Field(default=SessionStatus.LOADED, description="Session status")
     message: str = Field(..., description="Status message")
     last_updated: Optional[datetime] = Field(None, description="When session was last updated")
@@ -197,7 +265,26 @@ class ChatHistoryResponse(BaseModel):
     user_id: str = Field(..., description="User identifier")
     sessions: List[ChatHistoryItem] = Field(..., description="List of chat sessions")
     total_sessions: int = Field(..., description="Total number of sessions")
-    page_info: Dict[str, int] = Field(..., description="Pagination info")
+    page_info: Dict[str, Any] = Field(..., description="Pagination info (limit, next_cursor)")
+
+class ChatSessionHistoryResponse(BaseModel):
+    session_id: str = Field(..., description="Session identifier")
+    user_id: str = Field(..., description="User identifier")
+    messages: List[Dict[str, Any]] = Field(..., description="Messages, oldest first, each with its seq")
+    next_before_seq: Optional[int] = Field(None, description="Pass as before_seq for the next older page (None at the start)")
+
+class ChatSearchHit(BaseModel):
+    session_id: str = Field(..., description="Session containing the message")
+    seq: int = Field(..., description="Position of the message in its session")
+    role: str = Field(..., description="Message role")
+    snippet: str = Field(..., description="Matching fragments, HTML-escaped, terms wrapped in <mark></mark>")
+    rank: float = Field(..., description="Relevance (higher is better)")
+    timestamp: Optional[datetime] = Field(None, description="Message time")
+
+class ChatSearchResponse(BaseModel):
+    user_id: str = Field(..., description="User identifier")
+    query: str = Field(..., description="Search query")
+    results: List[ChatSearchHit] = Field(..., description="Matching messages, best first")
 
 # class CodeCompletionResponse(BaseModel):
 #     completion: str = Field(..., description="Generated code completion")
@@ -218,10 +305,27 @@ class CodeCompletionResponse(BaseModel):
     user_id: str
 
 
+class DocumentSyncResponse(BaseModel):
+    document_id: str = Field(..., description="Editor document URI")
+    version: int = Field(..., description="Version now mirrored on the server")
+    length: int = Field(..., description="Mirrored text length in characters")
+
+class WorkspaceSyncResponse(BaseModel):
+    workspace_id: str = Field(..., description="Workspace identifier")
+    missing: List[str] = Field(..., description="Content hashes the server still needs")
+    file_count: int = Field(..., description="Files in the workspace manifest after this sync")
+
+class WorkspaceBlobUploadResponse(BaseModel):
+    workspace_id: str = Field(..., description="Workspace identifier")
+    stored: int = Field(..., description="Blobs stored by this upload")
+    rejected: List[str] = Field(default_factory=list, description="Hashes that did not match their content or were too large")
+
+
 # Database models (Postgres)
 class ChatSession(TimestampedModel):
     """
-    Persist entire conversation in metadata (e.g., {'messages': [...]}).
+    One row per conversation; metadata holds {'message_count': n}.
+    Messages live in chat_messages (see database/migrations/001_chat_messages.sql).
     """
     id: Optional[int] = None
     session_id: str = Field(..., max_length=255)
@@ -260,6 +364,7 @@ class HealthCheckResponse(BaseModel):
     redis_connected: bool = Field(..., description="Redis connection status")
     uptime_seconds: Optional[float] = Field(None, description="Service uptime in seconds")
     active_sessions_count: Optional[int] = Field(None, description="Number of active sessions in cache")
+    providers: Optional[Dict[str, Any]] = Field(None, description="Circuit breaker state per model provider")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 class ModelConfig(BaseModel):
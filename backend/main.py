@@ -9,12 +9,17 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 
 # Import our modules
-from model import ai_model
+from model_registry import ai_model
+from readiness import readiness
 from redis_client import redis_client
+from session_persister import session_persister
 from database.connection import db_client
 from copilot.copilot_routers import get_routers
+from copilot.copilot_service import project_watcher
+from copilot.workspace_store import workspace_store
 from database.schema import AppConfig, HealthCheckResponse
 
 # Load environment variables
@@ -47,42 +52,56 @@ async def lifespan(app: FastAPI):
     
     startup_success = True
     
-    # Initialize AI Model Client
-    logger.info("Initializing AI model client...")
-    if not ai_model.initialize():
+    # Model client config, Redis and PostgreSQL are independent: connect them concurrently.
+    # The sync model setup runs in a thread so it doesn't hold up the event loop.
+    logger.info("Initializing AI model client, Redis and PostgreSQL...")
+    model_ok, redis_ok, db_ok = await asyncio.gather(
+        asyncio.to_thread(ai_model.initialize),
+        redis_client.connect(),
+        db_client.connect(),
+    )
+
+    if not model_ok:
         logger.error("❌ Failed to initialize AI model client")
         startup_success = False
-    logger.info(f"AI Model check complete. startup_success is: {startup_success}")
-
-    # Initialize Redis Connection
-    logger.info("Connecting to Redis...")
-    if not redis_client.connect():
+    if not redis_ok:
         logger.warning("⚠️ Redis connection failed - continuing without cache")
         # Optional: you can decide whether cache is critical
         # startup_success = False
-    logger.info(f"Redis check complete. startup_success is: {startup_success}")
-    
-    # Initialize PostgreSQL Connection
-    logger.info("Connecting to PostgreSQL...")
-    if not await db_client.connect():
+    if not db_ok:
         logger.warning("⚠️ PostgreSQL connection failed - continuing without persistence")
         # If DB is critical, flip this to: startup_success = False
         # startup_success = False
-    logger.info(f"PostgreSQL connection check complete. startup_success is: {startup_success}")
+    logger.info(f"Dependency init complete (model={model_ok}, redis={redis_ok}, postgres={db_ok})")
     
     # No table creation/migration here (tables already exist)
 
     if not startup_success:
         logger.error("❌ Critical services failed to initialize")
         raise Exception("Application startup failed")
+
+    # The model round-trip runs in the background; /ready reports not-ready until it passes
+    readiness.start_probe("model", ai_model.smoke_test)
+
+    # Write-behind persistence of live chat sessions (Redis -> Postgres)
+    if redis_ok and db_ok:
+        session_persister.start()
+    # Deletes blobs of expired workspace manifests, which live in Redis
+    if redis_ok:
+        workspace_store.start_gc()
     
     logger.info("✅ Application startup completed successfully")
     yield
 
     # Shutdown sequence
     logger.info("Shutting down application...")
+    await readiness.stop()
+    await session_persister.stop()  # before disconnecting: flushes what is still dirty
+    await workspace_store.stop_gc()
+    project_watcher.stop()
+    await ai_model.aclose()
     if redis_client.is_connected:
-        redis_client.disconnect()
+        await redis_client.disconnect()
         logger.info("Redis connection closed")
     if db_client.is_connected:
         await db_client.disconnect()
@@ -91,7 +110,7 @@ async def lifespan(app: FastAPI):
 
     # Close Redis connection
     if redis_client.is_connected:
-        redis_client.disconnect()
+        await redis_client.disconnect()
         logger.info("Redis connection closed")
     
     # Close PostgreSQL connection
@@ -162,6 +181,13 @@ async def health():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+# Readiness (load balancer / k8s readinessProbe): 503 until background probes pass
+@app.get("/ready")
+async def ready():
+    """Readiness check, separate from liveness (/health)"""
+    state = readiness.get_state()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=jsonable_encoder(state))
+
 # # Global exception handlers
 # @app.exception_handler(HTTPException)
 # async def http_exception_handler(request: Request, exc: HTTPException):
@@ -231,6 +257,12 @@ if __name__ == "__main__":
     workers = int(os.getenv("WORKERS", "1"))
     
     logger.info(f"Starting server on {host}:{port}")
+    if workers > 1:
+        # copilot/document_mirror.py keeps mirrors in process memory
+        logger.warning(
+            f"WORKERS={workers}: document mirrors are per worker. Put sticky routing (per client) "
+            "in front, or HTTP document sync lands on other workers and completions fall back to full context"
+        )
     
     uvicorn.run(
         "main:app",
@@ -0,0 +1,168 @@
+import os
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+from dotenv import load_dotenv
+
+try:
+    import msgpack
+except ImportError:  # optional dependency – entries stay JSON without it
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency – entries are packed but not compressed
+    zstandard = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CHAT_CODEC_ENABLED = os.getenv("CHAT_CODEC_ENABLED", "true").lower() == "true"
+# Packed entries at least this large are zstd-compressed
+CHAT_CODEC_COMPRESS_MIN_BYTES = int(os.getenv("CHAT_CODEC_COMPRESS_MIN_BYTES", "512"))
+CHAT_CODEC_ZSTD_LEVEL = int(os.getenv("CHAT_CODEC_ZSTD_LEVEL", "3"))
+# Measure the JSON size (for the savings stats) of one encoded message in N; 0 disables
+CHAT_CODEC_STATS_SAMPLE_EVERY = int(os.getenv("CHAT_CODEC_STATS_SAMPLE_EVERY", "100"))
+
+# First byte of a stored entry. Legacy entries are JSON objects and start with "{".
+FORMAT_PACKED = 0x01      # msgpack
+FORMAT_ZSTD_V1 = 0x02     # zstd(msgpack) with PREFIX_DICTIONARY_V1
+
+# Compact positional layout for the usual message shape
+ROLES = ("user", "assistant", "system")
+MESSAGE_FIELDS = ("role", "content", "timestamp", "user_id")
+
+# Raw-content zstd dictionary: text that recurs across sessions (attachment
+# headers, prompt boilerplate, common code). Never edit a released dictionary:
+# add PREFIX_DICTIONARY_V2 with a new format byte so old entries stay readable.
+PREFIX_DICTIONARY_V1 = "\n".join([
+    "[Attachment: ", ".pdf]\n", ".docx]\n", ".xlsx]\n", ".txt]\n", ".py]\n", ".csv]\n",
+    "user", "assistant", "system", "content", "timestamp", "user_id",
+    "Here is", "Here's", "```python\n", "```javascript\n", "```typescript\n", "```\n",
+    "def ", "class ", "import ", "from ", "return ", "self.", "async def ", "await ",
+    "function ", "const ", "let ", "export ", "interface ", "public ", "private ",
+    "    ", "        ", "\n\n", "**", "- ", "1. ", "2. ", "3. ",
+]).encode("utf-8")
+
+
+class MessageCodec:
+    """
+    Encoding of chat messages stored in Redis lists.
+
+    Entries are msgpack with the common fields stored positionally (no repeated
+    keys); anything larger than CHAT_CODEC_COMPRESS_MIN_BYTES is zstd-compressed
+    with a shared prefix dictionary. A leading format byte versions the entry,
+    and plain JSON entries written before the codec are read transparently.
+    """
+
+    def __init__(self, enabled: bool = CHAT_CODEC_ENABLED, sample_every: int = CHAT_CODEC_STATS_SAMPLE_EVERY):
+        self.enabled = enabled and msgpack is not None
+        self.sample_every = sample_every
+        self._compressor = None
+        self._decompressor = None
+        if zstandard is not None:
+            dictionary = zstandard.ZstdCompressionDict(
+                PREFIX_DICTIONARY_V1, dict_type=zstandard.DICT_TYPE_RAWCONTENT
+            )
+            self._compressor = zstandard.ZstdCompressor(level=CHAT_CODEC_ZSTD_LEVEL, dict_data=dictionary)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        self._encoded = 0
+        self._compressed = 0
+        self._stored_bytes = 0
+        self._sampled = 0
+        self._sampled_json_bytes = 0
+        self._sampled_stored_bytes = 0
+        self._legacy_reads = 0
+
+    @staticmethod
+    def _to_compact(message: Dict[str, Any]) -> Union[list, Dict[str, Any]]:
+        """[role, content, epoch_seconds, user_id] when the message has the usual shape."""
+        if set(message) != set(MESSAGE_FIELDS):
+            return message
+        ts = None
+        if message["timestamp"]:
+            try:
+                dt = datetime.fromisoformat(message["timestamp"])
+            except (TypeError, ValueError):
+                return message
+            if dt.tzinfo is not None or dt.microsecond or dt.isoformat(timespec="seconds") != message["timestamp"]:
+                return message  # only the naive-UTC seconds format we write round-trips exactly
+            ts = int(dt.replace(tzinfo=timezone.utc).timestamp())
+        role = message["role"]
+        return [ROLES.index(role) if role in ROLES else role, message["content"], ts, message["user_id"]]
+
+    @staticmethod
+    def _from_compact(value: Union[list, Dict[str, Any]]) -> Dict[str, Any]:
+        if isinstance(value, dict):
+            return value
+        role, content, ts, user_id = value
+        return {
+            "role": ROLES[role] if isinstance(role, int) else role,
+            "content": content,
+            "timestamp": (
+                datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds")
+                if ts is not None else None
+            ),
+            "user_id": user_id,
+        }
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        if not self.enabled:
+            return json.dumps(message).encode("utf-8")
+
+        packed = msgpack.packb(self._to_compact(message), use_bin_type=True)
+        if self._compressor is not None and len(packed) >= CHAT_CODEC_COMPRESS_MIN_BYTES:
+            data = bytes([FORMAT_ZSTD_V1]) + self._compressor.compress(packed)
+            self._compressed += 1
+        else:
+            data = bytes([FORMAT_PACKED]) + packed
+
+        self._encoded += 1
+        self._stored_bytes += len(data)
+        if self.sample_every > 0 and (self._encoded - 1) % self.sample_every == 0:  # first message, then every Nth
+            self._sampled += 1
+            self._sampled_json_bytes += len(json.dumps(message).encode("utf-8"))
+            self._sampled_stored_bytes += len(data)
+        return data
+
+    def decode(self, data: Union[bytes, str]) -> Optional[Dict[str, Any]]:
+        """Decode one list entry; None if it is malformed or needs a missing library."""
+        try:
+            if isinstance(data, str) or data[:1] == b"{":
+                self._legacy_reads += 1
+                return json.loads(data)
+            fmt, body = data[0], data[1:]
+            if fmt == FORMAT_ZSTD_V1:
+                if self._decompressor is None:
+                    raise RuntimeError("zstandard is not installed")
+                body = self._decompressor.decompress(body)
+            elif fmt != FORMAT_PACKED:
+                raise ValueError(f"unknown format byte {fmt:#x}")
+            if msgpack is None:
+                raise RuntimeError("msgpack is not installed")
+            return self._from_compact(msgpack.unpackb(body, raw=False))
+        except Exception as e:
+            logger.warning(f"Skipping undecodable chat entry: {e}")
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        # JSON sizes are only measured on a sample; savings are extrapolated from its ratio
+        ratio = self._sampled_stored_bytes / self._sampled_json_bytes if self._sampled_json_bytes else None
+        json_bytes = int(self._stored_bytes / ratio) if ratio else None
+        return {
+            "enabled": self.enabled,
+            "compression": self._compressor is not None,
+            "encoded": self._encoded,
+            "compressed": self._compressed,
+            "legacy_json_reads": self._legacy_reads,
+            "sampled": self._sampled,
+            "stored_bytes": self._stored_bytes,
+            "json_bytes_estimate": json_bytes,
+            "saved_bytes_estimate": json_bytes - self._stored_bytes if json_bytes is not None else None,
+            "ratio": round(ratio, 3) if ratio else None,
+        }
+
+
+# Global singleton
+message_codec = MessageCodec()
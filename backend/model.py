@@ -1,9 +1,8 @@
 import os
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple, TYPE_CHECKING
 from dotenv import load_dotenv
-import google.generativeai as genai
 from database.schema import ModelConfig 
 from database.schema import ModelConfig as RuntimeModelConfig
 load_dotenv()
@@ -26,6 +25,9 @@ class AIModelClient:
       - get_model_info()
     """
 
+    # Gemini has no fill-in-the-middle endpoint: completions use the instruction prompt
+    supports_fim = False
+
     def __init__(self):
         self.is_initialized: bool = False
         self._model = None
@@ -67,6 +69,9 @@ class AIModelClient:
                 logger.error("GEMINI_API_KEY is required")
                 return False
 
+            # Imported here: the SDK (grpc, protobuf) is heavy and only needed if Gemini is configured
+            import google.generativeai as genai
+
             genai.configure(api_key=self._api_key)
             self._model = genai.GenerativeModel(self._model_name)
 
@@ -93,14 +98,6 @@ class AIModelClient:
                     logger.warning("ModelConfig validation failed, continuing without config object: %s", config_error)
                     self.config = None
 
-            # Smoke test (non-fatal)
-            try:
-                resp = self._model.generate_content("Answer only: 2 + 2 = ?")
-                txt = (getattr(resp, "text", "") or "").strip()
-                logger.info("✅ Client test successful: %s", txt[:16])
-            except Exception as e:
-                logger.warning("Gemini smoke test failed (continuing): %s", e)
-
             self.is_initialized = True
             logger.info("✅ AI Model client initialized successfully")
             return True
@@ -110,6 +107,27 @@ class AIModelClient:
             self.is_initialized = False
             return False
 
+    async def smoke_test(self) -> bool:
+        """One tiny request over the async transport (used as the readiness probe)."""
+        if not self.is_initialized:
+            return False
+        try:
+            resp = await asyncio.wait_for(
+                self._model.generate_content_async("Answer only: 2 + 2 = ?"),
+                timeout=self._default_timeout,
+            )
+            txt = (getattr(resp, "text", "") or "").strip()
+            logger.info("✅ Client test successful: %s", txt[:16])
+            return True
+        except Exception as e:
+            logger.warning("Gemini smoke test failed: %s", e)
+            return False
+
+    async def aclose(self) -> None:
+        """The SDK owns its async transport; nothing to release beyond the model handle."""
+        self._model = None
+        self.is_initialized = False
+
     # ---------- Helpers ----------
 
     def _flatten_messages(self, messages: List[Dict[str, str]]) -> str:
@@ -146,8 +164,8 @@ class AIModelClient:
 
     # ---------- Public API ----------
 
-    async def generate_chat_response(self, messages: List[Dict[str, str]]) -> str:
-        """Generate chat response using default settings from .env"""
+    async def generate_chat_response(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> str:
+        """Generate chat response using default settings from .env (max_tokens overrides the length cap)"""
         if not self.is_initialized and not self.initialize():
             raise RuntimeError("Model not initialized")
 
@@ -155,12 +173,11 @@ class AIModelClient:
 
         try:
             resp = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self._model.generate_content,
+                self._model.generate_content_async(
                     prompt,
                     generation_config={
                         "temperature": self._default_temperature,
-                        "max_output_tokens": self._default_max_tokens,
+                        "max_output_tokens": max_tokens or self._default_max_tokens,
                     },
                 ),
                 timeout=self._default_timeout,
@@ -177,6 +194,42 @@ class AIModelClient:
             logger.error("Chat generation error: %s", e)
             raise RuntimeError("Model failed to generate valid response")
 
+    async def stream_chat_response(
+        self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Yield the chat response in chunks as Gemini streams it."""
+        if not self.is_initialized and not self.initialize():
+            raise RuntimeError("Model not initialized")
+
+        prompt = self._flatten_messages(messages)
+
+        try:
+            resp = await asyncio.wait_for(
+                self._model.generate_content_async(
+                    prompt,
+                    generation_config={
+                        "temperature": self._default_temperature,
+                        "max_output_tokens": max_tokens or self._default_max_tokens,
+                    },
+                    stream=True,
+                ),
+                timeout=self._default_timeout,
+            )
+            async for chunk in resp:
+                try:
+                    text = chunk.text
+                except Exception:  # chunk without text parts (e.g. safety stop)
+                    text = ""
+                if text:
+                    yield text
+
+        except asyncio.TimeoutError:
+            logger.error("Chat stream timed out")
+            raise RuntimeError("Request timed out - please try a shorter message")
+        except Exception as e:
+            logger.error("Chat stream error: %s", e)
+            raise RuntimeError("Model failed to generate valid response")
+
     async def generate_code_completion(self, prompt: str, language: str = "python") -> Tuple[str, bool]:
         """Generate code completion for any programming language using .env settings"""
         if not self.is_initialized and not self.initialize():
@@ -210,8 +263,7 @@ class AIModelClient:
 
         try:
             resp = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self._model.generate_content,
+                self._model.generate_content_async(
                     completion_prompt,
                     generation_config={
                         "temperature": self._code_temperature,
@@ -243,8 +295,7 @@ class AIModelClient:
         try:
             simple_prompt = f"Complete this {language} code (only provide the completion):\n\n{prompt[-200:]}"
             resp = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self._model.generate_content,
+                self._model.generate_content_async(
                     simple_prompt,
                     generation_config={
                         "temperature": 0.05,
@@ -275,8 +326,7 @@ class AIModelClient:
 
         try:
             resp = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self._model.generate_content,
+                self._model.generate_content_async(
                     flat,
                     generation_config={
                         "temperature": self._file_temperature,
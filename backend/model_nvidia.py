@@ -1,20 +1,54 @@
 import os
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional, Tuple
-from openai import OpenAI
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple, TYPE_CHECKING
 from dotenv import load_dotenv
 from database.schema import ModelConfig
 
 
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Shared keep-alive pool: concurrency is bounded by sockets, not worker threads
+MODEL_HTTP_MAX_CONNECTIONS = int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", "100"))
+MODEL_HTTP_MAX_KEEPALIVE = int(os.getenv("MODEL_HTTP_MAX_KEEPALIVE", "20"))
+MODEL_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MODEL_HTTP_KEEPALIVE_EXPIRY", "30"))
+MODEL_HTTP_CONNECT_TIMEOUT = float(os.getenv("MODEL_HTTP_CONNECT_TIMEOUT", "5"))
+
+# Native fill-in-the-middle through the completions API (Qwen2.5-Coder FIM tokens).
+# Opt-in: enable only when NVIDIA_FIM_MODEL (or the chat model) is served on the
+# completions endpoint and accepts these tokens.
+NVIDIA_FIM_ENABLED = os.getenv("NVIDIA_FIM_ENABLED", "false").lower() == "true"
+NVIDIA_FIM_MODEL = os.getenv("NVIDIA_FIM_MODEL", "")
+FIM_PREFIX = "<|fim_prefix|>"
+FIM_SUFFIX = "<|fim_suffix|>"
+FIM_MIDDLE = "<|fim_middle|>"
+FIM_STOP = ["<|endoftext|>", "<|fim_pad|>", "<|file_sep|>", "<|repo_name|>", "<|im_end|>"]
+
+
+def build_fim_prompt(prefix: str, suffix: str) -> str:
+    return f"{FIM_PREFIX}{prefix}{FIM_SUFFIX}{suffix}{FIM_MIDDLE}"
+
+
 class AIModelClient:
     def __init__(self):
-        self.client: Optional[OpenAI] = None
+        self.client: Optional["AsyncOpenAI"] = None
+        self._http: Optional["httpx.AsyncClient"] = None
         self.config: Optional[ModelConfig] = None
         self.is_initialized = False
+
+    @property
+    def supports_fim(self) -> bool:
+        """Set explicitly with NVIDIA_FIM_ENABLED; never inferred from the model name."""
+        return NVIDIA_FIM_ENABLED and self.is_initialized
+
+    @property
+    def fim_model_name(self) -> str:
+        return NVIDIA_FIM_MODEL or (self.config.name if self.config else "")
     
     def initialize(self) -> bool:
         """Initialize AI model client with configuration from environment"""
@@ -36,44 +70,71 @@ class AIModelClient:
                 timeout_seconds=int(os.getenv("MODEL_TIMEOUT_SECONDS"))
             )
             
-            # Initialize OpenAI client
-            self.client = OpenAI(
+            # SDK imports deferred to first initialization (keeps worker boot light)
+            import httpx
+            from openai import AsyncOpenAI
+
+            # Async client over a pooled keep-alive connection pool. Retries are
+            # disabled: callers have their own fallbacks and a timeout must stay a timeout.
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MODEL_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=MODEL_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=MODEL_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(self.config.timeout_seconds, connect=MODEL_HTTP_CONNECT_TIMEOUT),
+            )
+            self.client = AsyncOpenAI(
                 base_url=self.config.base_url,
-                api_key=self.config.api_key
+                api_key=self.config.api_key,
+                http_client=self._http,
+                max_retries=0,
             )
             
-            # Test the client
-            if self._test_client():
-                self.is_initialized = True
-                logger.info("✅ AI Model client initialized successfully")
-                return True
-            else:
-                logger.error("❌ AI Model client test failed")
-                return False
+            self.is_initialized = True
+            logger.info("✅ AI Model client initialized successfully")
+            return True
                 
         except Exception as e:
             logger.error(f"❌ Failed to initialize AI model client: {e}")
             return False
     
-    def _test_client(self) -> bool:
-        """Test the AI model client with a simple request"""
+    async def smoke_test(self) -> bool:
+        """Test the AI model client with a simple request (used as the readiness probe)"""
+        if not self.is_initialized:
+            return False
         try:
-            response = self.client.chat.completions.create(
-                model=self.config.name,
-                messages=[{"role": "user", "content": "What is 2+2?"}],
-                temperature=0.2,
-                top_p=0.7,
-                max_tokens=50,
-                stream=False
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.config.name,
+                    messages=[{"role": "user", "content": "What is 2+2?"}],
+                    temperature=0.2,
+                    top_p=0.7,
+                    max_tokens=50,
+                    stream=False
+                ),
+                timeout=self.config.timeout_seconds
             )
             
             test_response = self._safe_get_response_text(response)
             logger.info(f"✅ Client test successful: {test_response[:50]}...")
-            return bool(test_response and len(test_response.strip()) > 0)
+            ok = bool(test_response and len(test_response.strip()) > 0)
             
         except Exception as e:
             logger.error(f"Client test failed: {e}")
-            return False
+            ok = False
+        
+        if not ok:
+            logger.error("❌ AI Model client test failed")
+        return ok
+    
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self.client = None
+        self.is_initialized = False
     
     def _safe_get_response_text(self, response) -> str:
         """Safely extract text from API response"""
@@ -110,8 +171,7 @@ class AIModelClient:
             
             # Generate response with timeout
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.client.chat.completions.create,
+                self.client.chat.completions.create(
                     model=self.config.name,
                     messages=messages,
                     temperature=temp,
@@ -136,6 +196,48 @@ class AIModelClient:
             logger.error(f"Chat generation error: {e}")
             raise Exception(f"Chat generation failed: {str(e)}")
     
+    async def stream_chat_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Yield the chat response in chunks as the model streams it"""
+        if not self.is_initialized:
+            raise Exception("AI Model client not initialized")
+        
+        try:
+            temp = temperature or self.config.default_temperature
+            tokens = max_tokens or self.config.default_max_tokens
+            timeout_secs = timeout or self.config.timeout_seconds
+            
+            # Timeout covers the time to the first byte; the stream itself may run longer
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.config.name,
+                    messages=messages,
+                    temperature=temp,
+                    top_p=self.config.default_top_p,
+                    max_tokens=tokens,
+                    stream=True
+                ),
+                timeout=timeout_secs
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+            
+        except asyncio.TimeoutError:
+            logger.error("Chat stream timed out")
+            raise Exception("Request timed out - please try a shorter message")
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            raise Exception(f"Chat generation failed: {str(e)}")
+    
     async def generate_code_completion(
         self,
         prompt: str,
@@ -153,8 +255,7 @@ class AIModelClient:
             
             # Generate completion
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.client.chat.completions.create,
+                self.client.chat.completions.create(
                     model=self.config.name,
                     messages=[{"role": "user", "content": prompt}],
                     temperature=temperature,
@@ -186,14 +287,47 @@ class AIModelClient:
             logger.error(f"Code completion error: {e}")
             return "", False
     
+    async def generate_fim_completion(
+        self,
+        prefix: str,
+        suffix: str,
+        language: str = "python",
+        temperature: float = 0.1,
+        max_tokens: int = 150,
+        timeout: Optional[int] = None
+    ) -> Tuple[str, bool]:
+        """
+        Fill-in-the-middle completion: the model sees the code before and after
+        the cursor and returns exactly the text to insert. Errors are raised so
+        the caller can fall back to the instruction prompt.
+        """
+        if not self.is_initialized:
+            raise Exception("AI Model client not initialized")
+
+        timeout_secs = timeout or 10
+        response = await asyncio.wait_for(
+            self.client.completions.create(
+                model=self.fim_model_name,
+                prompt=build_fim_prompt(prefix, suffix),
+                temperature=temperature,
+                top_p=0.8,
+                max_tokens=max_tokens,
+                stop=FIM_STOP,
+                stream=False
+            ),
+            timeout=timeout_secs
+        )
+        if not response.choices:
+            return "", False
+        return response.choices[0].text or "", True
+
     async def _generate_simple_completion(self, prompt: str, language: str) -> str:
         """Generate simple completion for blocked responses"""
         try:
             simple_prompt = f"Complete this {language} code: {prompt[-100:]}"
             
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.client.chat.completions.create,
+                self.client.chat.completions.create(
                     model=self.config.name,
                     messages=[{"role": "user", "content": simple_prompt}],
                     temperature=0.05,
@@ -241,8 +375,7 @@ class AIModelClient:
             tokens = max_tokens or 1024
             
             response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.client.chat.completions.create,
+                self.client.chat.completions.create(
                     model=self.config.name,
                     messages=messages,
                     temperature=0.7,
@@ -279,6 +412,7 @@ class AIModelClient:
             "default_top_p": self.config.default_top_p,
             "default_max_tokens": self.config.default_max_tokens,
             "timeout_seconds": self.config.timeout_seconds,
+            "supports_fim": self.supports_fim,
             "is_initialized": self.is_initialized
         }
 
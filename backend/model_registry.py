@@ -0,0 +1,372 @@
+import os
+import time
+import random
+import asyncio
+import inspect
+import logging
+import importlib
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Protocol, Tuple
+from dotenv import load_dotenv
+from circuit_breaker import CircuitBreaker, CLOSED
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Comma-separated provider names, in preference order when there is no data yet
+MODEL_PROVIDERS = [p.strip() for p in os.getenv("MODEL_PROVIDERS", "gemini").split(",") if p.strip()]
+# Share of calls sent to a random healthy provider so stats stay fresh
+MODEL_ROUTING_EXPLORE = float(os.getenv("MODEL_ROUTING_EXPLORE", "0.05"))
+MODEL_ROUTING_MIN_SAMPLES = int(os.getenv("MODEL_ROUTING_MIN_SAMPLES", "5"))
+MODEL_ROUTING_EWMA_ALPHA = float(os.getenv("MODEL_ROUTING_EWMA_ALPHA", "0.2"))
+# Score = latency + error_rate * penalty: a failure costs as much as this many ms
+MODEL_ROUTING_ERROR_PENALTY_MS = float(os.getenv("MODEL_ROUTING_ERROR_PENALTY_MS", "5000"))
+# A provider whose FIM endpoint errors is left out of FIM routing for this long
+# (its circuit breaker, shared with chat, is not touched)
+MODEL_FIM_ERROR_COOLDOWN_SECONDS = float(os.getenv("MODEL_FIM_ERROR_COOLDOWN_SECONDS", "300"))
+
+# name -> module exposing an `ai_model` client; imported only when configured
+PROVIDER_MODULES: Dict[str, str] = {
+    "gemini": "model",
+    "nvidia": "model_nvidia",
+}
+
+CALL_CLASSES = ("inline", "menu", "chat", "file")
+
+
+class ModelProvider(Protocol):
+    """What a backend client must offer to be registered"""
+    is_initialized: bool
+    supports_fim: bool  # explicit capability flag; providers without it are never sent FIM prompts
+
+    def initialize(self) -> bool: ...
+    async def smoke_test(self) -> bool: ...
+    async def aclose(self) -> None: ...
+    async def generate_chat_response(self, messages: List[Dict[str, str]], **kwargs: Any) -> str: ...
+    def stream_chat_response(self, messages: List[Dict[str, str]], **kwargs: Any) -> AsyncIterator[str]: ...
+    async def generate_code_completion(self, prompt: str, language: str = "python", **kwargs: Any) -> Tuple[str, bool]: ...
+    async def generate_fim_completion(self, prefix: str, suffix: str, language: str = "python", **kwargs: Any) -> Tuple[str, bool]: ...
+    async def process_file_content(self, file_content: str, prompt: str = ..., **kwargs: Any) -> str: ...
+    def get_model_info(self) -> Dict[str, Any]: ...
+
+
+class NoProviderAvailable(RuntimeError):
+    """Every configured provider is down or failed this call."""
+
+
+@dataclass
+class RouteStats:
+    """Observed behaviour of one provider for one call class"""
+    calls: int = 0
+    errors: int = 0
+    latency_ms: float = 0.0   # EWMA
+    error_rate: float = 0.0   # EWMA of 0/1 outcomes
+
+    def record(self, latency_ms: Optional[float], ok: bool) -> None:
+        a = MODEL_ROUTING_EWMA_ALPHA
+        first = self.calls == 0
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.error_rate = (0.0 if ok else 1.0) if first else (1 - a) * self.error_rate + a * (0.0 if ok else 1.0)
+        if ok and latency_ms is not None:
+            self.latency_ms = latency_ms if self.latency_ms == 0.0 else (1 - a) * self.latency_ms + a * latency_ms
+
+    @property
+    def score(self) -> float:
+        return self.latency_ms + MODEL_ROUTING_ERROR_PENALTY_MS * self.error_rate
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_ms_ewma": round(self.latency_ms, 1),
+            "error_rate_ewma": round(self.error_rate, 3),
+        }
+
+
+class ProviderRegistry:
+    """
+    Runs several model backends side by side behind the single-client
+    interface the services already use (`ai_model`).
+
+    Each call is routed, per call class (inline / menu / chat / file), to the
+    healthy provider with the best observed latency and error rate; providers
+    with too few samples are tried first, and a small share of traffic is
+    spread at random so the numbers stay current. A provider that raises (or
+    returns no completion) is skipped and the next one is tried.
+
+    Every provider has a circuit breaker; while it is open the provider is left
+    out of routing, and when all are open calls fail fast instead of adding
+    load to a struggling upstream.
+    """
+
+    def __init__(self, names: List[str] = MODEL_PROVIDERS):
+        self.names = names
+        self.providers: Dict[str, ModelProvider] = {}
+        self._stats: Dict[str, Dict[str, RouteStats]] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._params: Dict[Tuple[str, str], Optional[set]] = {}
+        self._fim_paused_until: Dict[str, float] = {}  # name -> monotonic time
+
+    # ---------- Lifecycle ----------
+
+    def _load(self, name: str) -> Optional[ModelProvider]:
+        module_name = PROVIDER_MODULES.get(name)
+        if module_name is None:
+            logger.error(f"Unknown model provider '{name}' (known: {', '.join(PROVIDER_MODULES)})")
+            return None
+        try:
+            return importlib.import_module(module_name).ai_model
+        except Exception as e:
+            logger.error(f"❌ Could not load model provider '{name}': {e}")
+            return None
+
+    def initialize(self) -> bool:
+        """Load and initialize every configured provider; True if at least one is usable."""
+        for name in self.names:
+            if name in self.providers:
+                continue
+            provider = self._load(name)
+            if provider is None:
+                continue
+            if provider.initialize():
+                self.providers[name] = provider
+                self._stats[name] = {c: RouteStats() for c in CALL_CLASSES}
+                self.breakers[name] = CircuitBreaker(name)
+                logger.info(f"✅ Model provider '{name}' ready")
+            else:
+                logger.error(f"❌ Model provider '{name}' failed to initialize")
+        return self.is_initialized
+
+    async def smoke_test(self) -> bool:
+        names = list(self.providers)
+        results = await asyncio.gather(*(self.providers[n].smoke_test() for n in names), return_exceptions=True)
+        for name, ok in zip(names, results):
+            if ok is not True:
+                logger.error(f"❌ Model provider '{name}' failed its smoke test: {ok}")
+        return any(ok is True for ok in results)
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(p.aclose() for p in self.providers.values()), return_exceptions=True)
+
+    @property
+    def is_initialized(self) -> bool:
+        return any(p.is_initialized for p in self.providers.values())
+
+    # ---------- Routing ----------
+
+    def available(self, call_class: str = "menu") -> bool:
+        """False when every provider is down or behind an open circuit: callers should fail fast."""
+        return bool(self._route(call_class, explore=False))
+
+    def supports_fim(self, call_class: str = "inline") -> bool:
+        """True when a healthy provider can take native fill-in-the-middle prompts."""
+        return bool(self._route(call_class, explore=False, fim=True))
+
+    def _route(self, call_class: str, explore: bool = True, fim: bool = False) -> List[str]:
+        """Healthy providers (initialized, circuit not open), best first."""
+        healthy = [
+            n for n in self.names
+            if n in self.providers and self.providers[n].is_initialized and self.breakers[n].available
+            and (not fim or self._fim_usable(n))
+        ]
+        if len(healthy) <= 1:
+            return healthy
+        if explore and random.random() < MODEL_ROUTING_EXPLORE:
+            random.shuffle(healthy)
+            return healthy
+        stats = {n: self._stats[n][call_class] for n in healthy}
+        # Under-sampled providers first (config order), then by score
+        return sorted(
+            healthy,
+            key=lambda n: (stats[n].calls >= MODEL_ROUTING_MIN_SAMPLES, stats[n].score),
+        )
+
+    def _fim_usable(self, name: str) -> bool:
+        # FIM never claims a half-open probe: that belongs to the provider's regular traffic
+        return (
+            getattr(self.providers[name], "supports_fim", False) is True
+            and self.breakers[name].state == CLOSED
+            and time.monotonic() >= self._fim_paused_until.get(name, 0.0)
+        )
+
+    def _record(self, name: str, call_class: str, start: float, ok: bool) -> None:
+        latency_ms = (time.perf_counter() - start) * 1000
+        self._stats[name][call_class].record(latency_ms, ok)
+        if ok:
+            self.breakers[name].record_success()
+        else:
+            self.breakers[name].record_failure()
+
+    def _normalize_kwargs(self, name: str, method: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop sampling options (temperature, max_tokens, timeout, top_p) a provider does not take."""
+        key = (name, method)
+        if key not in self._params:
+            params = inspect.signature(getattr(self.providers[name], method)).parameters
+            accepts_any = any(p.kind is inspect.Parameter.VAR_KEYWORD for p in params.values())
+            self._params[key] = None if accepts_any else set(params)
+        allowed = self._params[key]
+        return {k: v for k, v in kwargs.items() if v is not None and (allowed is None or k in allowed)}
+
+    async def _call(
+        self,
+        call_class: str,
+        method: str,
+        invoke: Callable[[ModelProvider, Dict[str, Any]], Awaitable[Any]],
+        kwargs: Dict[str, Any],
+        succeeded: Callable[[Any], bool] = lambda result: True,
+        fim: bool = False,
+    ) -> Any:
+        last_error: Optional[BaseException] = None
+        fallback: Any = None
+        for name in self._route(call_class, fim=fim):
+            breaker = self.breakers[name]
+            if not fim and not breaker.allow():
+                continue
+            start = time.perf_counter()
+            try:
+                result = await invoke(self.providers[name], self._normalize_kwargs(name, method, kwargs))
+            except Exception as e:
+                if fim:
+                    # FIM endpoint errors (404, unsupported prompt) say nothing about chat health:
+                    # pause FIM for this provider instead of feeding the shared breaker
+                    self._fim_paused_until[name] = time.monotonic() + MODEL_FIM_ERROR_COOLDOWN_SECONDS
+                    logger.warning(
+                        f"Provider '{name}' failed {method} ({call_class}): {e}; "
+                        f"FIM paused for {MODEL_FIM_ERROR_COOLDOWN_SECONDS:.0f}s"
+                    )
+                else:
+                    self._record(name, call_class, start, ok=False)
+                    logger.warning(f"Provider '{name}' failed {method} ({call_class}): {e}")
+                last_error = e
+                continue
+            except BaseException:
+                if not fim:
+                    breaker.release()
+                raise
+            ok = succeeded(result)
+            if not fim:
+                self._record(name, call_class, start, ok=ok)
+            if ok:
+                return result
+            if fallback is None:
+                fallback = result
+        if fallback is not None:
+            return fallback  # every provider answered, none fully: keep the best-ranked answer
+        raise NoProviderAvailable(f"No model provider could serve {method}: {last_error}")
+
+    # ---------- Client interface ----------
+
+    async def generate_chat_response(
+        self, messages: List[Dict[str, str]], call_class: str = "chat", **kwargs: Any
+    ) -> str:
+        return await self._call(
+            call_class, "generate_chat_response",
+            lambda p, kw: p.generate_chat_response(messages, **kw), kwargs,
+        )
+
+    async def stream_chat_response(
+        self, messages: List[Dict[str, str]], call_class: str = "chat", **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """Fails over only until the first chunk; after that the stream is committed to one provider."""
+        last_error: Optional[BaseException] = None
+        for name in self._route(call_class):
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            start = time.perf_counter()
+            started = False
+            try:
+                stream = self.providers[name].stream_chat_response(
+                    messages, **self._normalize_kwargs(name, "stream_chat_response", kwargs)
+                )
+                async for chunk in stream:
+                    if not started:
+                        started = True
+                        self._record(name, call_class, start, ok=True)  # time to first token
+                    yield chunk
+            except Exception as e:
+                if started:
+                    raise
+                self._record(name, call_class, start, ok=False)
+                logger.warning(f"Provider '{name}' failed stream_chat_response ({call_class}): {e}")
+                last_error = e
+                continue
+            except BaseException:
+                if not started:
+                    breaker.release()
+                raise
+            if started:
+                return
+            self._record(name, call_class, start, ok=False)  # empty stream
+        raise NoProviderAvailable(f"No model provider could serve stream_chat_response: {last_error}")
+
+    async def generate_code_completion(
+        self, prompt: str, language: str = "python", call_class: str = "menu", **kwargs: Any
+    ) -> Tuple[str, bool]:
+        try:
+            return await self._call(
+                call_class, "generate_code_completion",
+                lambda p, kw: p.generate_code_completion(prompt, language, **kw), kwargs,
+                succeeded=lambda r: bool(r and r[0] and r[1]),
+            )
+        except NoProviderAvailable as e:
+            logger.warning(str(e))
+            return "", False
+
+    async def generate_fim_completion(
+        self, prefix: str, suffix: str, language: str = "python", call_class: str = "inline", **kwargs: Any
+    ) -> Tuple[str, bool]:
+        """Fill-in-the-middle on FIM-capable providers only; ("", False) lets the caller fall back."""
+        try:
+            return await self._call(
+                call_class, "generate_fim_completion",
+                lambda p, kw: p.generate_fim_completion(prefix, suffix, language, **kw), kwargs,
+                succeeded=lambda r: bool(r and r[1]),  # an empty middle is a valid answer
+                fim=True,
+            )
+        except NoProviderAvailable as e:
+            logger.warning(str(e))
+            return "", False
+
+    async def process_file_content(
+        self, file_content: str, prompt: str = "Analyze this file content and provide insights:", **kwargs: Any
+    ) -> str:
+        return await self._call(
+            "file", "process_file_content",
+            lambda p, kw: p.process_file_content(file_content, prompt, **kw), kwargs,
+        )
+
+    # ---------- Introspection ----------
+
+    def get_circuit_states(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.get_state() for name, breaker in self.breakers.items()}
+
+    def get_model_info(self) -> Dict[str, Any]:
+        """Info of the provider currently preferred for chat, plus the provider list."""
+        route = self._route("chat", explore=False)
+        info = dict(self.providers[route[0]].get_model_info()) if route else {"model_name": "unavailable"}
+        info["providers"] = list(self.providers)
+        return info
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.names,
+            "providers": {
+                name: {
+                    "initialized": provider.is_initialized,
+                    "model_name": provider.get_model_info().get("model_name"),
+                    "supports_fim": getattr(provider, "supports_fim", False),
+                    "fim_paused_seconds": round(max(0.0, self._fim_paused_until.get(name, 0.0) - time.monotonic()), 1),
+                    "circuit": self.breakers[name].get_state(),
+                    "routes": {c: s.to_dict() for c, s in self._stats[name].items()},
+                }
+                for name, provider in self.providers.items()
+            },
+            "preferred": {c: (self._route(c, explore=False) or [None])[0] for c in CALL_CLASSES},
+        }
+
+
+# Global singleton used by the rest of the app
+ai_model = ProviderRegistry()
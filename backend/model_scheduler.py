@@ -0,0 +1,209 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Total model calls in flight across all classes
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "24"))
+
+
+@dataclass
+class CallClass:
+    """Scheduling policy for one kind of model call"""
+    name: str
+    priority: int          # lower runs first
+    max_concurrency: int
+    queue_deadline_ms: int  # give up if no slot within this budget
+
+
+# Keystroke completions first; a burst of chats or file jobs must not starve them
+CALL_CLASSES: Dict[str, CallClass] = {
+    c.name: c for c in (
+        CallClass("inline", 0,
+                  int(os.getenv("SCHED_INLINE_CONCURRENCY", "16")),
+                  int(os.getenv("SCHED_INLINE_QUEUE_DEADLINE_MS", "150"))),
+        CallClass("menu", 1,
+                  int(os.getenv("SCHED_MENU_CONCURRENCY", "8")),
+                  int(os.getenv("SCHED_MENU_QUEUE_DEADLINE_MS", "1000"))),
+        CallClass("chat", 2,
+                  int(os.getenv("SCHED_CHAT_CONCURRENCY", "6")),
+                  int(os.getenv("SCHED_CHAT_QUEUE_DEADLINE_MS", "15000"))),
+        CallClass("file", 3,
+                  int(os.getenv("SCHED_FILE_CONCURRENCY", "2")),
+                  int(os.getenv("SCHED_FILE_QUEUE_DEADLINE_MS", "30000"))),
+    )
+}
+
+
+class SchedulerRejected(Exception):
+    """No model slot became free within the call class's queue deadline."""
+
+    def __init__(self, call_class: str, waited_ms: int):
+        super().__init__(f"No model capacity for '{call_class}' call after {waited_ms}ms in queue")
+        self.call_class = call_class
+        self.waited_ms = waited_ms
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    call_class: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.perf_counter)
+
+
+@dataclass
+class _ClassStats:
+    running: int = 0
+    queued: int = 0
+    granted: int = 0
+    rejected: int = 0
+    queue_wait_ms_avg: float = 0.0
+    queue_wait_ms_max: float = 0.0
+
+
+class ModelCallScheduler:
+    """
+    Priority scheduler in front of the model client.
+
+    Each call class has its own concurrency limit on top of a global one.
+    Callers that cannot run immediately wait in a priority queue (inline >
+    menu > chat > file, FIFO within a class); when a slot frees up it goes to
+    the most urgent waiter whose class still has room. A caller still queued
+    when its class deadline passes gets SchedulerRejected: for inline
+    completions a late answer is worthless, so it is better to drop it.
+    """
+
+    def __init__(self, classes: Dict[str, CallClass] = CALL_CLASSES, max_concurrency: int = MODEL_MAX_CONCURRENCY):
+        self.classes = classes
+        self.max_concurrency = max_concurrency
+        self._running = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._stats: Dict[str, _ClassStats] = {name: _ClassStats() for name in classes}
+
+    def _has_room(self, call_class: str) -> bool:
+        return (
+            self._running < self.max_concurrency
+            and self._stats[call_class].running < self.classes[call_class].max_concurrency
+        )
+
+    def _grant(self, call_class: str) -> None:
+        self._running += 1
+        stats = self._stats[call_class]
+        stats.running += 1
+        stats.granted += 1
+
+    def _record_wait(self, call_class: str, waited_ms: float) -> None:
+        stats = self._stats[call_class]
+        stats.queue_wait_ms_avg = 0.9 * stats.queue_wait_ms_avg + 0.1 * waited_ms
+        stats.queue_wait_ms_max = max(stats.queue_wait_ms_max, waited_ms)
+
+    def _release(self, call_class: str) -> None:
+        self._running -= 1
+        self._stats[call_class].running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued callers, most urgent first."""
+        skipped: List[_Waiter] = []
+        while self._waiters and self._running < self.max_concurrency:
+            waiter = heapq.heappop(self._waiters)
+            if waiter.future.done():  # timed out or cancelled while queued
+                continue
+            if not self._has_room(waiter.call_class):
+                skipped.append(waiter)
+                continue
+            self._stats[waiter.call_class].queued -= 1
+            self._grant(waiter.call_class)
+            waiter.future.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+    async def acquire(self, call_class: str, deadline_ms: Optional[int] = None) -> None:
+        """Wait for a slot; raises SchedulerRejected once the queue deadline passes."""
+        policy = self.classes[call_class]
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, _Waiter(policy.priority, next(self._seq), call_class, future))
+        stats = self._stats[call_class]
+        stats.queued += 1
+        self._dispatch()
+        if future.done():
+            self._record_wait(call_class, 0.0)
+            return
+
+        timeout = (deadline_ms if deadline_ms is not None else policy.queue_deadline_ms) / 1000
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we gave up: hand it back
+                self._release(call_class)
+            else:
+                future.cancel()
+                stats.queued -= 1
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            waited_ms = int((time.perf_counter() - start) * 1000)
+            stats.rejected += 1
+            self._record_wait(call_class, waited_ms)
+            logger.debug(f"Dropped queued {call_class} model call after {waited_ms}ms")
+            raise SchedulerRejected(call_class, waited_ms) from None
+        self._record_wait(call_class, (time.perf_counter() - start) * 1000)
+
+    @asynccontextmanager
+    async def slot(self, call_class: str, deadline_ms: Optional[int] = None) -> AsyncIterator[None]:
+        """`async with model_scheduler.slot("inline"): ...` around a model call."""
+        await self.acquire(call_class, deadline_ms)
+        try:
+            yield
+        finally:
+            self._release(call_class)
+
+    def queue_wait_ms(self, call_class: str) -> float:
+        """Smoothed recent queue wait for a class"""
+        return self._stats[call_class].queue_wait_ms_avg
+
+    def oldest_wait_ms(self, call_class: str) -> float:
+        """How long the longest-waiting queued caller of a class has been waiting (0 if none)"""
+        now = time.perf_counter()
+        waits = [
+            now - w.enqueued_at for w in self._waiters
+            if w.call_class == call_class and not w.future.done()
+        ]
+        return max(waits) * 1000 if waits else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "max_concurrency": self.max_concurrency,
+            "classes": {
+                name: {
+                    "priority": self.classes[name].priority,
+                    "max_concurrency": self.classes[name].max_concurrency,
+                    "queue_deadline_ms": self.classes[name].queue_deadline_ms,
+                    "running": s.running,
+                    "queued": s.queued,
+                    "granted": s.granted,
+                    "rejected": s.rejected,
+                    "queue_wait_ms_avg": round(s.queue_wait_ms_avg, 1),
+                    "queue_wait_ms_max": round(s.queue_wait_ms_max, 1),
+                }
+                for name, s in self._stats.items()
+            },
+        }
+
+
+# Global singleton
+model_scheduler = ModelCallScheduler()
@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from redis_client import redis_client
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_LOCAL_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_BUCKETS", "10000"))
+
+
+@dataclass
+class BucketPolicy:
+    """Token bucket: `burst` tokens, refilled at `per_minute` tokens per minute"""
+    burst: int
+    per_minute: float
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+
+# Route class -> policy, per user
+RATE_LIMITS: Dict[str, BucketPolicy] = {
+    "completion": BucketPolicy(
+        int(os.getenv("RATE_LIMIT_COMPLETION_BURST", "60")),
+        float(os.getenv("RATE_LIMIT_COMPLETION_PER_MINUTE", "300")),
+    ),
+    "chat": BucketPolicy(
+        int(os.getenv("RATE_LIMIT_CHAT_BURST", "5")),
+        float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20")),
+    ),
+    "file": BucketPolicy(
+        int(os.getenv("RATE_LIMIT_FILE_BURST", "10")),
+        float(os.getenv("RATE_LIMIT_FILE_PER_MINUTE", "30")),
+    ),
+}
+
+# Refill + take in one round trip. Uses the Redis clock so all workers agree on time.
+# Returns {allowed, tokens_left, retry_after_seconds}; floats as strings (Lua numbers truncate).
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # seconds until `cost` tokens are available (0 when allowed)
+
+    def headers(self) -> Dict[str, str]:
+        h = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+        }
+        if not self.allowed:
+            h["Retry-After"] = str(max(1, int(self.retry_after + 0.999)))
+        return h
+
+
+class RateLimiter:
+    """
+    Per-user, per-route-class token buckets.
+
+    Buckets live in Redis and are updated atomically by a Lua script, so all
+    workers share one budget per user. When Redis is unavailable each worker
+    falls back to its own in-process buckets (bounded LRU), which is looser
+    but still stops a single runaway client.
+    """
+
+    def __init__(self, limits: Dict[str, BucketPolicy] = RATE_LIMITS, enabled: bool = RATE_LIMIT_ENABLED):
+        self.limits = limits
+        self.enabled = enabled
+        self._script = None
+        self._script_client = None
+        self._local: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, ts)
+        self._allowed = 0
+        self._rejected = 0
+        self._redis_errors = 0
+
+    @staticmethod
+    def _key(user_id: str, route_class: str) -> str:
+        return f"ratelimit:{route_class}:{user_id}"
+
+    async def _check_redis(self, key: str, policy: BucketPolicy, cost: int) -> Optional[Tuple[bool, float, float]]:
+        client = redis_client.get_client()
+        if client is None:
+            return None
+        try:
+            if self._script is None or self._script_client is not client:
+                self._script = client.register_script(TOKEN_BUCKET_LUA)
+                self._script_client = client
+            allowed, tokens, retry_after = await self._script(keys=[key], args=[policy.burst, policy.rate, cost])
+            return bool(int(allowed)), float(tokens), float(retry_after)
+        except Exception as e:
+            self._redis_errors += 1
+            logger.warning(f"Rate limit check via Redis failed, using local buckets: {e}")
+            return None
+
+    def _check_local(self, key: str, policy: BucketPolicy, cost: int) -> Tuple[bool, float, float]:
+        now = time.monotonic()
+        tokens, ts = self._local.get(key, (float(policy.burst), now))
+        tokens = min(policy.burst, tokens + (now - ts) * policy.rate)
+        if tokens >= cost:
+            allowed, retry_after = True, 0.0
+            tokens -= cost
+        else:
+            allowed, retry_after = False, (cost - tokens) / policy.rate
+        self._local[key] = (tokens, now)
+        self._local.move_to_end(key)
+        while len(self._local) > RATE_LIMIT_LOCAL_MAX_BUCKETS:
+            self._local.popitem(last=False)
+        return allowed, tokens, retry_after
+
+    async def check(self, user_id: str, route_class: str, cost: int = 1) -> RateLimitDecision:
+        """Take `cost` tokens from the user's bucket for `route_class` if available."""
+        policy = self.limits[route_class]
+        if not self.enabled:
+            return RateLimitDecision(True, policy.burst, policy.burst, 0.0)
+        cost = max(1, min(cost, policy.burst))  # a larger cost could never be satisfied
+
+        key = self._key(user_id or "anonymous", route_class)
+        result = await self._check_redis(key, policy, cost) or self._check_local(key, policy, cost)
+        allowed, tokens, retry_after = result
+        if allowed:
+            self._allowed += 1
+        else:
+            self._rejected += 1
+            logger.info(f"Rate limited {route_class} for user {user_id}: retry in {retry_after:.1f}s")
+        return RateLimitDecision(allowed, policy.burst, int(tokens), retry_after)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "limits": {name: {"burst": p.burst, "per_minute": p.per_minute} for name, p in self.limits.items()},
+            "allowed": self._allowed,
+            "rejected": self._rejected,
+            "redis_errors": self._redis_errors,
+            "local_buckets": len(self._local),
+        }
+
+
+# Global singleton
+rate_limiter = RateLimiter()
@@ -0,0 +1,80 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+READINESS_PROBE_INTERVAL_SECONDS = float(os.getenv("READINESS_PROBE_INTERVAL_SECONDS", "2"))
+READINESS_PROBE_MAX_INTERVAL_SECONDS = float(os.getenv("READINESS_PROBE_MAX_INTERVAL_SECONDS", "60"))
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """
+    Readiness of the service, separate from liveness.
+
+    Startup only connects dependencies; slow checks (the model smoke test) run
+    as background probes and flip their component to ready when they pass, so
+    the worker can start serving immediately and report not-ready until then.
+    """
+
+    def __init__(self):
+        self._components: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.started_at = time.time()
+
+    def set(self, component: str, state: str, detail: Optional[str] = None) -> None:
+        self._components[component] = {"state": state, "detail": detail, "since": time.time()}
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._components) and all(c["state"] == READY for c in self._components.values())
+
+    def start_probe(self, component: str, probe: Callable[[], Awaitable[bool]]) -> None:
+        """Run `probe` in the background until it returns True, backing off between attempts."""
+        self.set(component, PENDING)
+
+        async def run():
+            interval = READINESS_PROBE_INTERVAL_SECONDS
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    ok = await probe()
+                    detail = None
+                except Exception as e:
+                    ok, detail = False, str(e)
+                if ok:
+                    self.set(component, READY)
+                    logger.info(f"✅ {component} ready after {attempt} probe(s)")
+                    return
+                self.set(component, FAILED, detail or f"probe failed (attempt {attempt})")
+                logger.warning(f"⚠️ {component} not ready yet, retrying in {interval:.0f}s")
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, READINESS_PROBE_MAX_INTERVAL_SECONDS)
+
+        self._tasks[component] = asyncio.create_task(run())
+
+    async def stop(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "components": self._components,
+        }
+
+
+# Global singleton
+readiness = Readiness()
@@ -1,20 +1,69 @@
 import os
 import json
+import time
 import logging
-from typing import Optional, List, Dict, Any
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
-import redis
+import redis.asyncio as redis
+from message_codec import message_codec
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Sessions with messages not yet persisted to Postgres: sorted set, member -> time first dirtied
+DIRTY_SESSIONS_KEY = "chat:dirty"
+
+# ZREM each dirty member whose sequence counter (KEYS[i+1]) still has the value it was
+# persisted at (ARGV pairs: member, counter); a later write leaves the member dirty.
+ACK_DIRTY_LUA = """
+local acked = 0
+for i = 2, #KEYS do
+    local counter = tonumber(redis.call('GET', KEYS[i]) or '0')
+    if counter == tonumber(ARGV[2 * i - 2]) then
+        acked = acked + redis.call('ZREM', KEYS[1], ARGV[2 * i - 3])
+    end
+end
+return acked
+"""
+
+# Re-seat a lost sequence counter, unless another caller already did (counter >= list length).
+# ARGV[1]: increment taking the counter from the value seen at read time to the repaired one.
+RESTORE_SEQ_LUA = """
+local cur = tonumber(redis.call('GET', KEYS[1]) or '0')
+if cur >= redis.call('LLEN', KEYS[2]) then return cur end
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return value
+"""
+
+
+@dataclass
+class CachedChat:
+    """A session's cached tail as read from Redis"""
+    first_seq: Optional[int]        # seq of messages[0]; None when the counter was lost
+    messages: List[Dict[str, Any]]  # chronological; each carries "seq" when first_seq is known
+    counter: int                    # sequence counter value at read time (0 if missing)
+
 
 class RedisConnection:
-    
+    """
+    Async Redis access (redis.asyncio) over a shared connection pool, so a slow
+    round trip only suspends the awaiting request instead of the event loop.
+    Multi-command writes go through pipelines (one round trip each).
+    Chat lists hold binary entries (see message_codec) and use a second,
+    non-decoding client; everything else is plain strings.
+    Every chat write also bumps the session's sequence counter (total messages
+    ever written, so the cached tail maps to chat_messages.seq even after
+    trimming) and marks the session dirty (DIRTY_SESSIONS_KEY) in the same
+    transaction, for the write-behind persister.
+    """
+
     def __init__(self):
         self.client: Optional[redis.Redis] = None
+        self.raw_client: Optional[redis.Redis] = None  # bytes in/out, for chat lists
         self.is_connected = False
 
         # TTL for chat sessions (seconds)
@@ -29,7 +78,7 @@ class RedisConnection:
     
     # Connection management
     
-    def connect(self) -> bool:
+    async def connect(self) -> bool:
         """Initialize Redis connection using .env credentials."""
         try:
             redis_host = os.getenv("REDIS_HOST")
@@ -38,21 +87,24 @@ class RedisConnection:
             redis_password = os.getenv("REDIS_PASSWORD")
             redis_db = int(os.getenv("REDIS_DB"))
 
-            self.client = redis.Redis(
+            options = dict(
                 host=redis_host,
                 port=redis_port,
                 username=redis_user,
                 password=redis_password,
                 db=redis_db,
-                decode_responses=True,  # store/read strings
                 socket_timeout=5,
                 socket_connect_timeout=5,
                 retry_on_timeout=True,
+                health_check_interval=30,
                 max_connections=self.max_connections,
             )
+            # store/read strings
+            self.client = redis.Redis(connection_pool=redis.ConnectionPool(decode_responses=True, **options))
+            self.raw_client = redis.Redis(connection_pool=redis.ConnectionPool(decode_responses=False, **options))
 
             # Sanity check
-            self.client.ping()
+            await self.client.ping()
             self.is_connected = True
             logger.info("✅ Redis connected successfully")
             return True
@@ -60,14 +112,17 @@ class RedisConnection:
         except Exception as e:
             logger.warning(f"⚠️ Redis connection failed: {e}")
             self.client = None
+            self.raw_client = None
             self.is_connected = False
             return False
 
-    def disconnect(self):
-        """Close Redis connection."""
+    async def disconnect(self):
+        """Close Redis connection (and its pool)."""
         if self.client:
             try:
-                self.client.close()
+                await self.client.aclose(close_connection_pool=True)
+                if self.raw_client:
+                    await self.raw_client.aclose(close_connection_pool=True)
                 logger.info("Redis connection closed")
             except Exception as e:
                 logger.warning(f"Error closing Redis connection: {e}")
@@ -84,38 +139,124 @@ class RedisConnection:
         """Consistent key format; pass user_id to avoid cross-user collisions."""
         return f"chat:{user_id}:{session_id}" if user_id else f"chat:{session_id}"
 
-    def set_with_expiry(self, key: str, value: str, expiry: int = 36000) -> bool:
+    def _seq_key(self, session_id: str, user_id: Optional[str] = None) -> str:
+        """Counter of messages ever appended to the session (next chat_messages.seq)."""
+        return f"chatseq:{user_id}:{session_id}" if user_id else f"chatseq:{session_id}"
+
+    async def set_with_expiry(self, key: str, value: str, expiry: int = 36000) -> bool:
         """SET key with expiry (seconds)."""
         try:
             if self.client:
-                self.client.setex(key, expiry, value)
+                await self.client.setex(key, expiry, value)
                 return True
         except Exception as e:
             logger.error(f"Redis set error: {e}")
         return False
 
-    def get(self, key: str) -> Optional[str]:
+    async def get(self, key: str) -> Optional[str]:
         """GET key (string)."""
         try:
             if self.client:
-                return self.client.get(key)
+                return await self.client.get(key)
         except Exception as e:
             logger.error(f"Redis get error: {e}")
         return None
 
-    def delete(self, key: str) -> bool:
+    async def delete(self, key: str) -> bool:
         """DEL key."""
         try:
             if self.client:
-                return bool(self.client.delete(key))
+                return bool(await self.client.delete(key))
         except Exception as e:
             logger.error(f"Redis delete error: {e}")
         return False
 
-    
+    async def incr(self, key: str, expiry: Optional[int] = None) -> Optional[int]:
+        """INCR key (optionally refreshing its TTL)."""
+        try:
+            if self.client:
+                pipe = self.client.pipeline(True)
+                pipe.incr(key)
+                if expiry:
+                    pipe.expire(key, expiry)
+                return int((await pipe.execute())[0])
+        except Exception as e:
+            logger.error(f"Redis incr error: {e}")
+        return None
+
+    # Hash helpers
+
+    async def hash_set_many(
+        self,
+        key: str,
+        mapping: Dict[str, str],
+        *,
+        remove: Optional[List[str]] = None,
+        replace: bool = False,
+        expiry: Optional[int] = None,
+    ) -> bool:
+        """HSET several fields (and HDEL `remove`) in one transaction; `replace` clears the hash first."""
+        try:
+            if self.client:
+                pipe = self.client.pipeline(True)
+                if replace:
+                    pipe.delete(key)
+                if remove:
+                    pipe.hdel(key, *remove)
+                if mapping:
+                    pipe.hset(key, mapping=mapping)
+                if expiry:
+                    pipe.expire(key, expiry)
+                await pipe.execute()
+                return True
+        except Exception as e:
+            logger.error(f"Redis hash_set_many error: {e}")
+        return False
+
+    async def scan_keys(self, pattern: str, count: int = 1000) -> List[str]:
+        """All keys matching `pattern` (SCAN, so the server is never blocked)."""
+        keys: List[str] = []
+        try:
+            if self.client:
+                async for key in self.client.scan_iter(match=pattern, count=count):
+                    keys.append(key)
+        except Exception as e:
+            logger.error(f"Redis scan error: {e}")
+            raise
+        return keys
+
+    async def hash_values_many(self, keys: List[str]) -> List[List[str]]:
+        """HVALS of several hashes in one round trip; keys that aren't hashes read as empty."""
+        if not self.client or not keys:
+            return []
+        pipe = self.client.pipeline(False)
+        for key in keys:
+            pipe.hvals(key)
+        replies = await pipe.execute(raise_on_error=False)
+        return [[] if isinstance(r, Exception) else r for r in replies]
+
+    async def hash_get_all(self, key: str) -> Dict[str, str]:
+        """HGETALL key."""
+        try:
+            if self.client:
+                return await self.client.hgetall(key) or {}
+        except Exception as e:
+            logger.error(f"Redis hgetall error: {e}")
+        return {}
+
+
     # Chat-centric helpers (core API)
+
+    @staticmethod
+    def _chat_message(role: str, content: str, user_id: Optional[str]) -> bytes:
+        return message_codec.encode({
+            "role": role,
+            "content": content,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "user_id": user_id,
+        })
     
-    def add_chat_message(
+    async def add_chat_message(
         self,
         session_id: str,
         role: str,
@@ -129,27 +270,53 @@ class RedisConnection:
         if not self.is_connected or not self.client:
             return False
 
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
-            "user_id": user_id,
-        }
-
         key = self._chat_key(session_id, user_id)
         try:
-            pipe = self.client.pipeline(True)
-            pipe.lpush(key, json.dumps(message))               # newest → left
+            pipe = self.raw_client.pipeline(True)
+            pipe.lpush(key, self._chat_message(role, content, user_id))  # newest → left
             if self.chat_max_history and self.chat_max_history > 0:
                 pipe.ltrim(key, 0, self.chat_max_history - 1)  # keep last N (by index)
             pipe.expire(key, self.chat_ttl)                    # refresh TTL
-            pipe.execute()
+            self._bump_seq(pipe, session_id, user_id, 1)
+            self._mark_dirty(pipe, session_id, user_id)
+            await pipe.execute()
             return True
         except Exception as e:
             logger.error(f"Redis add_chat_message error: {e}")
             return False
 
-    def get_chat_messages(
+    async def append_turn(
+        self,
+        session_id: str,
+        messages: List[Tuple[str, str]],
+        user_id: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Append several (role, content) messages in order, trim, refresh TTL and
+        read the new length, all in one MULTI/EXEC round trip.
+        Returns the session's message count, or None if the write failed.
+        """
+        if not self.is_connected or not self.client:
+            return None
+
+        key = self._chat_key(session_id, user_id)
+        try:
+            pipe = self.raw_client.pipeline(True)
+            # LPUSH with several values pushes them left one by one: the last is newest
+            pipe.lpush(key, *(self._chat_message(role, content, user_id) for role, content in messages))
+            if self.chat_max_history and self.chat_max_history > 0:
+                pipe.ltrim(key, 0, self.chat_max_history - 1)
+            pipe.expire(key, self.chat_ttl)
+            self._bump_seq(pipe, session_id, user_id, len(messages))
+            self._mark_dirty(pipe, session_id, user_id)
+            pipe.llen(key)
+            results = await pipe.execute()
+            return int(results[-1])
+        except Exception as e:
+            logger.error(f"Redis append_turn error: {e}")
+            return None
+
+    async def get_chat_messages(
         self,
         session_id: str,
         user_id: Optional[str] = None,
@@ -162,90 +329,218 @@ class RedisConnection:
 
         We LPUSH (newest → left). LRANGE returns [newest ... oldest].
         For chronological order, reverse the list unless oldest_first=False.
-        `limit`: if provided, return only the last N chronologically.
+        `limit`: if provided, return only the last N chronologically; only those
+        N entries are read and decoded (LRANGE 0 N-1), however long the session.
         """
         if not self.is_connected or not self.client:
             return []
 
         key = self._chat_key(session_id, user_id)
+        end = limit - 1 if limit is not None and limit > 0 else -1
         try:
-            raw = self.client.lrange(key, 0, -1)  # newest → oldest
+            raw = await self.raw_client.lrange(key, 0, end)  # newest → oldest
             msgs: List[Dict[str, Any]] = []
             for item in raw:
-                try:
-                    msgs.append(json.loads(item))
-                except Exception:
-                    # skip malformed entries
-                    continue
+                msg = message_codec.decode(item)
+                if msg is not None:  # skip malformed entries
+                    msgs.append(msg)
 
             if oldest_first:
                 msgs.reverse()  # oldest → newest
 
-            if limit is not None and limit > 0:
-                msgs = msgs[-limit:]
-
             return msgs
         except Exception as e:
             logger.error(f"Redis get_chat_messages error: {e}")
             return []
 
-    def get_session_message_count(self, session_id: str, user_id: Optional[str] = None) -> int:
+    async def get_many_chat_messages(
+        self,
+        sessions: List[Tuple[str, Optional[str]]],
+        raise_errors: bool = False,
+    ) -> List[CachedChat]:
+        """
+        Cached messages of several (session_id, user_id) sessions in one MULTI.
+        The counter is never below the list length while intact; if it is (the
+        key was evicted, or predates the counter) first_seq is None and the
+        caller must re-derive it from Postgres (session_persister.resolve_lost_seq).
+        A failed read looks like empty sessions unless `raise_errors` is set.
+        """
+        if not self.is_connected or not self.client or not sessions:
+            return [CachedChat(0, [], 0) for _ in sessions]
+        try:
+            pipe = self.raw_client.pipeline(True)  # list and counter read consistently
+            for session_id, user_id in sessions:
+                pipe.lrange(self._chat_key(session_id, user_id), 0, -1)
+                pipe.get(self._seq_key(session_id, user_id))
+            replies = await pipe.execute()
+            results = []
+            for raw, total in zip(replies[::2], replies[1::2]):
+                counter = int(total or 0)
+                first_seq = counter - len(raw) if counter >= len(raw) else None
+                msgs: List[Dict[str, Any]] = []
+                for offset, item in enumerate(reversed(raw)):  # oldest → newest
+                    msg = message_codec.decode(item)
+                    if msg is not None:
+                        if first_seq is not None:
+                            msg["seq"] = first_seq + offset
+                        msgs.append(msg)
+                results.append(CachedChat(first_seq, msgs, counter))
+            return results
+        except Exception as e:
+            logger.error(f"Redis get_many_chat_messages error: {e}")
+            if raise_errors:
+                raise
+            return [CachedChat(0, [], 0) for _ in sessions]
+
+    async def restore_seq(self, session_id: str, user_id: Optional[str], increment: int) -> Optional[int]:
+        """Repair a lost sequence counter by `increment` (no-op if it was already repaired)."""
+        if not self.is_connected or not self.client:
+            return None
+        try:
+            return int(await self.client.eval(
+                RESTORE_SEQ_LUA, 2,
+                self._seq_key(session_id, user_id), self._chat_key(session_id, user_id),
+                increment, self.chat_ttl,
+            ))
+        except Exception as e:
+            logger.error(f"Redis restore_seq error: {e}")
+            return None
+
+    async def get_session_message_count(self, session_id: str, user_id: Optional[str] = None) -> int:
         """Return number of messages stored for this session."""
         if not self.is_connected or not self.client:
             return 0
         try:
             key = self._chat_key(session_id, user_id)
-            return int(self.client.llen(key) or 0)
+            return int(await self.client.llen(key) or 0)
         except Exception as e:
             logger.error(f"Redis LLEN error: {e}")
             return 0
 
-    def clear_chat_cache(self, session_id: str, user_id: Optional[str] = None) -> bool:
+    async def clear_chat_cache(self, session_id: str, user_id: Optional[str] = None) -> bool:
         """Remove a session’s cached list entirely."""
         if not self.is_connected or not self.client:
             return False
         try:
-            key = self._chat_key(session_id, user_id)
-            self.client.delete(key)
+            await self.client.delete(self._chat_key(session_id, user_id), self._seq_key(session_id, user_id))
             return True
         except Exception as e:
             logger.error(f"Redis DEL error: {e}")
             return False
 
-    def load_chat_to_cache(
+    async def load_chat_to_cache(
         self,
         session_id: str,
         messages: List[Dict[str, Any]], *,
         user_id: Optional[str] = None,
         ttl: Optional[int] = None,
+        next_seq: Optional[int] = None,
     ) -> int:
         """
         Replace cache with the provided chronological `messages`
         (e.g., loaded from Postgres). Uses RPUSH to preserve order.
+        `next_seq`: the session's total message count, when `messages` is only its tail.
         """
         if not self.is_connected or not self.client:
             return False
 
         key = self._chat_key(session_id, user_id)
+        seq_key = self._seq_key(session_id, user_id)
+        ttl = int(ttl or self.chat_ttl)
         try:
-            pipe = self.client.pipeline(True)
+            pipe = self.raw_client.pipeline(True)
             pipe.delete(key)
             for m in messages:
-                pipe.rpush(key, json.dumps(m))      # chronological append
-            pipe.expire(key, int(ttl or self.chat_ttl))
-            pipe.execute()
+                pipe.rpush(key, message_codec.encode(m))  # chronological append
+            pipe.expire(key, ttl)
+            pipe.set(seq_key, next_seq if next_seq is not None else len(messages), ex=ttl)
+            await pipe.execute()
             return True
         except Exception as e:
             logger.error(f"Redis load_chat_to_cache error: {e}")
             return False
 
-    def session_exists_in_cache(self, session_id: str, user_id: Optional[str] = None) -> bool:
+    # Dirty-session tracking (write-behind persistence)
+
+    @staticmethod
+    def _dirty_member(session_id: str, user_id: Optional[str]) -> str:
+        return json.dumps([user_id, session_id])
+
+    def _bump_seq(self, pipe, session_id: str, user_id: Optional[str], count: int) -> None:
+        seq_key = self._seq_key(session_id, user_id)
+        pipe.incrby(seq_key, count)
+        pipe.expire(seq_key, self.chat_ttl)
+
+    def _mark_dirty(self, pipe, session_id: str, user_id: Optional[str]) -> None:
+        # NX keeps the time of the first unpersisted write, so the oldest sessions flush first
+        pipe.zadd(DIRTY_SESSIONS_KEY, {self._dirty_member(session_id, user_id): time.time()}, nx=True)
+
+    async def get_dirty_sessions(self, count: int) -> List[Tuple[str, Optional[str], float]]:
+        """
+        The up to `count` longest-dirty sessions: [(session_id, user_id, dirty_since)].
+        They stay in the dirty set until ack_dirty_sessions, so a failed read or
+        save (or a crash before it) leaves them for the next tick.
+        """
+        if not self.is_connected or not self.client:
+            return []
+        try:
+            dirty = await self.client.zrange(DIRTY_SESSIONS_KEY, 0, count - 1, withscores=True)
+        except Exception as e:
+            logger.error(f"Redis ZRANGE error: {e}")
+            return []
+        sessions = []
+        for member, since in dirty:
+            try:
+                user_id, session_id = json.loads(member)
+            except (TypeError, ValueError):
+                logger.warning(f"Dropping malformed dirty-session entry: {member!r}")
+                await self.client.zrem(DIRTY_SESSIONS_KEY, member)
+                continue
+            sessions.append((session_id, user_id, float(since)))
+        return sessions
+
+    async def ack_dirty_sessions(self, sessions: List[Tuple[str, Optional[str], int]]) -> int:
+        """
+        Mark (session_id, user_id, counter) sessions clean after persisting them,
+        `counter` being the sequence counter read with the persisted messages.
+        A session written since then keeps its dirty mark. Returns the number acked.
+        """
+        if not self.is_connected or not self.client or not sessions:
+            return 0
+        keys, args = [DIRTY_SESSIONS_KEY], []
+        for session_id, user_id, counter in sessions:
+            keys.append(self._seq_key(session_id, user_id))
+            args.extend([self._dirty_member(session_id, user_id), counter])
+        try:
+            return int(await self.client.eval(ACK_DIRTY_LUA, len(keys), *keys, *args))
+        except Exception as e:
+            logger.error(f"Redis ack_dirty_sessions error: {e}")
+            return 0
+
+    async def dirty_session_stats(self) -> Dict[str, Any]:
+        """Backlog size and age of the oldest unpersisted session."""
+        if not self.is_connected or not self.client:
+            return {"dirty_sessions": 0, "oldest_dirty_seconds": None}
+        try:
+            pipe = self.client.pipeline(False)
+            pipe.zcard(DIRTY_SESSIONS_KEY)
+            pipe.zrange(DIRTY_SESSIONS_KEY, 0, 0, withscores=True)
+            count, oldest = await pipe.execute()
+            return {
+                "dirty_sessions": int(count),
+                "oldest_dirty_seconds": round(time.time() - oldest[0][1], 1) if oldest else None,
+            }
+        except Exception as e:
+            logger.error(f"Redis dirty_session_stats error: {e}")
+            return {"dirty_sessions": None, "oldest_dirty_seconds": None}
+
+    async def session_exists_in_cache(self, session_id: str, user_id: Optional[str] = None) -> bool:
         """True if the session key currently exists in cache."""
         if not self.is_connected or not self.client:
             return False
         try:
             key = self._chat_key(session_id, user_id)
-            return bool(self.client.exists(key))
+            return bool(await self.client.exists(key))
         except Exception as e:
             logger.error(f"Redis EXISTS error: {e}")
             return False
@@ -0,0 +1,174 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from redis_client import redis_client, CachedChat
+from database.connection import db_client
+from copilot.attachment_store import attachment_store
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+SESSION_PERSIST_ENABLED = os.getenv("SESSION_PERSIST_ENABLED", "true").lower() == "true"
+SESSION_PERSIST_INTERVAL_SECONDS = float(os.getenv("SESSION_PERSIST_INTERVAL_SECONDS", "15"))
+SESSION_PERSIST_BATCH_SIZE = int(os.getenv("SESSION_PERSIST_BATCH_SIZE", "50"))
+# Upper bound per tick, so a large backlog drains over several ticks instead of in one burst
+SESSION_PERSIST_MAX_BATCHES_PER_TICK = int(os.getenv("SESSION_PERSIST_MAX_BATCHES_PER_TICK", "4"))
+
+DirtySession = Tuple[str, Optional[str], float]  # (session_id, user_id, dirty_since)
+
+
+async def resolve_lost_seq(session_id: str, user_id: Optional[str], cached: CachedChat) -> Optional[int]:
+    """
+    Re-derive the seqs of a cached tail whose Redis counter was lost (evicted,
+    or never written), number its messages and re-seat the counter.
+    Returns the seq of the first cached message, or None if Postgres is unavailable.
+    """
+    if cached.first_seq is not None:
+        return cached.first_seq
+    first_seq = await db_client.align_cached_messages(session_id, user_id, cached.messages)
+    if first_seq is None:
+        return None
+    for offset, msg in enumerate(cached.messages):
+        msg["seq"] = first_seq + offset
+    cached.first_seq = first_seq
+    restored = await redis_client.restore_seq(session_id, user_id, first_seq + len(cached.messages) - cached.counter)
+    if restored is not None:
+        cached.counter = restored
+    logger.warning(
+        f"Chat session {session_id}: sequence counter was lost (had {cached.counter}); "
+        f"restored to {first_seq + len(cached.messages)} from Postgres"
+    )
+    return first_seq
+
+
+class SessionPersister:
+    """
+    Write-behind persistence of live chat sessions from Redis to Postgres.
+
+    Chat writes mark their session dirty in a Redis sorted set (same MULTI as
+    the write). Every SESSION_PERSIST_INTERVAL_SECONDS (jittered, so workers
+    don't line up) each worker reads the longest-dirty sessions (ZRANGE) in
+    one pipeline and persists the batch in one transaction: a multi-row
+    upsert of the session rows plus one append-only insert of the messages
+    Postgres doesn't have yet. Only then is each session marked clean, and
+    only if its sequence counter is still the one read with its messages: a
+    message written meanwhile keeps it dirty, and a failed read or save (or
+    a crash) leaves the whole batch for the next tick. Saving is idempotent,
+    so two workers persisting the same session do no harm.
+    As long as the interval is well below REDIS_CHAT_TTL_SECONDS, a session
+    reaches Postgres before its cache entry can expire.
+    """
+
+    def __init__(
+        self,
+        interval: float = SESSION_PERSIST_INTERVAL_SECONDS,
+        batch_size: int = SESSION_PERSIST_BATCH_SIZE,
+        max_batches: int = SESSION_PERSIST_MAX_BATCHES_PER_TICK,
+        enabled: bool = SESSION_PERSIST_ENABLED,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        self._ticks = 0
+        self._flushed_sessions = 0
+        self._flushed_messages = 0
+        self._failed_batches = 0
+        self._last_flush_at: Optional[float] = None
+        self._max_lag_seconds = 0.0
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Session persister started (every ~{self.interval:.0f}s, "
+            f"up to {self.batch_size * self.max_batches} sessions per tick)"
+        )
+
+    async def stop(self) -> None:
+        """Stop the loop, then persist whatever is still dirty (bounded)."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            flushed = await self.flush_once(max_batches=self.max_batches * 4)
+            if flushed:
+                logger.info(f"Persisted {flushed} dirty session(s) on shutdown")
+        except Exception as e:
+            logger.warning(f"Final session flush failed: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            # ±20% jitter spreads the writes of several workers over the interval
+            await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+            try:
+                await self.flush_once()
+            except Exception as e:
+                logger.error(f"Session persister tick failed: {e}")
+
+    async def flush_once(self, max_batches: Optional[int] = None) -> int:
+        """Persist up to `max_batches` batches of dirty sessions; returns the number persisted."""
+        if not (redis_client.is_connected and db_client.is_connected):
+            return 0
+        self._ticks += 1
+        # Read the whole tick's share up front: sessions stay in the set until acked,
+        # so re-reading from the start would return ones that just failed again
+        dirty = await redis_client.get_dirty_sessions(self.batch_size * (max_batches or self.max_batches))
+        total = 0
+        for i in range(0, len(dirty), self.batch_size):
+            total += await self._flush_batch(dirty[i:i + self.batch_size])
+        return total
+
+    async def _flush_batch(self, batch: List[DirtySession]) -> int:
+        # A failed read raises: the batch stays dirty instead of looking like cleared sessions
+        histories = await redis_client.get_many_chat_messages(
+            [(sid, uid) for sid, uid, _ in batch], raise_errors=True
+        )
+        rows, done = [], []
+        for (sid, uid, _), cached in zip(batch, histories):
+            # An empty list means the cache was cleared after an explicit flush (or expired)
+            if cached.messages:
+                if cached.first_seq is None and await resolve_lost_seq(sid, uid, cached) is None:
+                    continue  # can't number its messages yet; stays dirty for the next tick
+                rows.append((sid, uid, cached.first_seq, cached.messages))
+            done.append((sid, uid, cached.counter))
+        attachments = await attachment_store.texts_for(m for *_, messages in rows for m in messages)
+        if rows and not await db_client.save_chat_sessions(rows, attachments):
+            self._failed_batches += 1
+            logger.warning(f"Session persist batch of {len(rows)} failed; left dirty for the next tick")
+            return 0
+        await redis_client.ack_dirty_sessions(done)
+
+        now = time.time()
+        self._max_lag_seconds = max(self._max_lag_seconds, now - min(since for _, _, since in batch))
+        self._last_flush_at = now
+        self._flushed_sessions += len(rows)
+        self._flushed_messages += sum(len(messages) for _, _, _, messages in rows)
+        return len(rows)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "ticks": self._ticks,
+            "flushed_sessions": self._flushed_sessions,
+            "flushed_messages": self._flushed_messages,
+            "failed_batches": self._failed_batches,
+            "max_lag_seconds": round(self._max_lag_seconds, 1),
+            "last_flush_at": self._last_flush_at,
+            **(await redis_client.dirty_session_stats()),
+        }
+
+
+# Global singleton
+session_persister = SessionPersister()
@@ -0,0 +1,83 @@
+"""
+Startup guard: import the app the way a uvicorn worker does and check import
+time, resident memory and that heavy optional libraries stayed unloaded.
+
+    python startup_benchmark.py            # exit code 1 if a budget is exceeded
+    python startup_benchmark.py --runs 5   # report the median of several runs
+
+Budgets come from STARTUP_MAX_IMPORT_SECONDS and STARTUP_MAX_RSS_MB.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STARTUP_MAX_IMPORT_SECONDS = float(os.getenv("STARTUP_MAX_IMPORT_SECONDS", "1.5"))
+STARTUP_MAX_RSS_MB = float(os.getenv("STARTUP_MAX_RSS_MB", "150"))
+
+# Must only be imported on first use (file extraction, provider initialization)
+LAZY_MODULES = [
+    "docx", "openpyxl", "xlrd", "PyPDF2", "PIL", "pytesseract", "magic",
+    "google.generativeai", "openai",
+]
+
+# Runs in a fresh interpreter so nothing is pre-imported
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main  # noqa: F401
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024  # bytes on macOS
+print(json.dumps({
+    "import_seconds": elapsed,
+    "max_rss_mb": rss_kb / 1024,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def measure() -> dict:
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE % (LAZY_MODULES,)],
+        cwd=here, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = [measure() for _ in range(args.runs)]
+    import_s = statistics.median(r["import_seconds"] for r in results)
+    rss_mb = statistics.median(r["max_rss_mb"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    print(f"import time: {import_s:.3f}s (budget {STARTUP_MAX_IMPORT_SECONDS}s)")
+    print(f"max RSS:     {rss_mb:.1f}MB (budget {STARTUP_MAX_RSS_MB}MB)")
+    print(f"eager heavy imports: {', '.join(loaded) or 'none'}")
+
+    failed = False
+    if import_s > STARTUP_MAX_IMPORT_SECONDS:
+        print("FAIL: import time over budget")
+        failed = True
+    if rss_mb > STARTUP_MAX_RSS_MB:
+        print("FAIL: resident memory over budget")
+        failed = True
+    if loaded:
+        print("FAIL: modules expected to load lazily were imported at startup")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
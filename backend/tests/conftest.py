@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Backend modules import each other absolutely (`from redis_client import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings redis_client reads at import time without defaults (normally from .env)
+os.environ.setdefault("REDIS_CHAT_TTL_SECONDS", "3600")
+os.environ.setdefault("CHAT_MAX_HISTORY", "100")
+os.environ.setdefault("REDIS_MAX_CONNECTIONS", "10")
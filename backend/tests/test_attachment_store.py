@@ -0,0 +1,23 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("redis")
+
+from copilot.attachment_store import AttachmentStore
+
+
+def test_only_system_references_are_resolved(tmp_path):
+    store = AttachmentStore(root=str(tmp_path))
+
+    async def run():
+        content_hash = await store.store_text("secret report")
+        reference = store.reference("report.txt", content_hash)
+        assert await store.resolve("system", reference) == "[Attachment: report.txt]\nsecret report"
+        assert await store.resolve("user", reference) == reference
+        assert await store.texts_for([
+            {"role": "system", "content": reference},
+            {"role": "user", "content": reference},
+        ]) == {content_hash: "secret report"}
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+import pytest
+
+from copilot.document_mirror import DocumentMirror, DocumentSyncError
+
+
+def test_total_chars_budget_evicts_least_recently_used():
+    mirror = DocumentMirror(max_docs=10, max_chars=100, max_total_chars=250)
+    mirror.open("u", "a", 1, "a" * 100)
+    mirror.open("u", "b", 1, "b" * 100)
+    mirror.get("u", "a")  # "b" is now the least recently used
+    mirror.open("u", "c", 1, "c" * 100)
+
+    with pytest.raises(DocumentSyncError):
+        mirror.get("u", "b")
+    assert mirror.get("u", "a").text == "a" * 100
+    assert mirror.get_stats()["mirrored_chars"] == 200
+
+
+def test_growing_edit_counts_against_budget():
+    mirror = DocumentMirror(max_docs=10, max_chars=200, max_total_chars=250)
+    mirror.open("u", "a", 1, "a" * 100)
+    mirror.open("u", "b", 1, "b" * 100)
+    mirror.apply_changes("u", "b", 1, 2, [{"text": "b" * 200}])
+
+    with pytest.raises(DocumentSyncError):
+        mirror.get("u", "a")
+    assert mirror.get_stats()["mirrored_chars"] == 200
+
+
+def test_oversized_document_is_not_mirrored():
+    mirror = DocumentMirror(max_chars=10)
+    with pytest.raises(ValueError):
+        mirror.open("u", "a", 1, "x" * 11)
+    assert mirror.get_stats()["mirrored_chars"] == 0
@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+pytest.importorskip("msgpack")
+
+from message_codec import MessageCodec
+
+
+def test_json_size_is_only_measured_on_samples(monkeypatch):
+    codec = MessageCodec(enabled=True, sample_every=3)
+    dumps = []
+    real_dumps = json.dumps
+    monkeypatch.setattr("message_codec.json.dumps", lambda *a, **kw: dumps.append(1) or real_dumps(*a, **kw))
+
+    for i in range(7):
+        data = codec.encode({"role": "user", "content": f"message {i}", "timestamp": None, "user_id": "u"})
+        assert codec.decode(data)["content"] == f"message {i}"
+
+    stats = codec.get_stats()
+    assert len(dumps) == stats["sampled"] == 3  # messages 1, 4 and 7
+    assert stats["encoded"] == 7
+    assert stats["ratio"] is not None and stats["json_bytes_estimate"] > 0
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+import model_nvidia
+from circuit_breaker import CLOSED, CircuitBreaker
+from model_nvidia import AIModelClient, build_fim_prompt
+from model_registry import CALL_CLASSES, ProviderRegistry, RouteStats
+
+
+class FakeCompletions:
+    def __init__(self, text="x + 1", error=None):
+        self.text = text
+        self.error = error
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(choices=[SimpleNamespace(text=self.text)])
+
+
+def make_registry(monkeypatch, completions):
+    monkeypatch.setattr(model_nvidia, "NVIDIA_FIM_ENABLED", True)
+    provider = AIModelClient()
+    provider.is_initialized = True
+    provider.client = SimpleNamespace(completions=completions)
+
+    registry = ProviderRegistry(names=["nvidia"])
+    registry.providers["nvidia"] = provider
+    registry._stats["nvidia"] = {c: RouteStats() for c in CALL_CLASSES}
+    registry.breakers["nvidia"] = CircuitBreaker("nvidia")
+    return registry
+
+
+def test_registry_defines_fim_completion():
+    assert callable(getattr(ProviderRegistry(), "generate_fim_completion", None))
+
+
+def test_fim_prompt_reaches_provider(monkeypatch):
+    completions = FakeCompletions()
+    registry = make_registry(monkeypatch, completions)
+
+    assert registry.supports_fim("inline")
+    text, ok = asyncio.run(registry.generate_fim_completion("def f(x):\n    return ", "\n", "python"))
+
+    assert (text, ok) == ("x + 1", True)
+    assert completions.calls[0]["prompt"] == "<|fim_prefix|>def f(x):\n    return <|fim_suffix|>\n<|fim_middle|>"
+    assert build_fim_prompt("a", "b") == "<|fim_prefix|>a<|fim_suffix|>b<|fim_middle|>"
+
+
+def test_fim_requires_explicit_flag(monkeypatch):
+    registry = make_registry(monkeypatch, FakeCompletions())
+    monkeypatch.setattr(model_nvidia, "NVIDIA_FIM_ENABLED", False)
+
+    assert not registry.supports_fim("inline")
+
+
+def test_fim_errors_do_not_trip_the_chat_breaker(monkeypatch):
+    registry = make_registry(monkeypatch, FakeCompletions(error=RuntimeError("404 model not found")))
+
+    for _ in range(20):
+        assert asyncio.run(registry.generate_fim_completion("a", "b")) == ("", False)
+
+    breaker = registry.breakers["nvidia"]
+    assert breaker.state == CLOSED
+    assert breaker.get_state()["window_calls"] == 0
+    assert registry.available("chat")
+    assert not registry.supports_fim("inline")  # paused after the first failure
+    assert len(registry.providers["nvidia"].client.completions.calls) == 1
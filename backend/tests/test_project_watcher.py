@@ -0,0 +1,28 @@
+import os
+
+from copilot.project_watcher import ProjectContextWatcher
+
+
+def make_watcher(*allowed):
+    return ProjectContextWatcher(on_change=lambda root, paths: None, allowed_roots=allowed)
+
+
+def test_project_root_is_nearest_marker_under_allowed_root(tmp_path):
+    project = tmp_path / "repo"
+    (project / "pkg" / "sub").mkdir(parents=True)
+    (project / "pyproject.toml").write_text("")
+    source = project / "pkg" / "sub" / "mod.py"
+    source.write_text("")
+
+    watcher = make_watcher(str(tmp_path))
+    assert watcher.project_root(str(source)) == os.path.realpath(project)
+    assert watcher.project_root(str(project / "pkg")) == os.path.realpath(project)
+
+
+def test_paths_outside_allowed_roots_or_projects_are_refused(tmp_path):
+    (tmp_path / "loose").mkdir()
+    watcher = make_watcher(str(tmp_path))
+    assert watcher.project_root("/x.py") is None
+    assert watcher.project_root(str(tmp_path / "loose" / "a.py")) is None
+    assert make_watcher().project_root(str(tmp_path)) is None
+    assert watcher.watch("/") is False
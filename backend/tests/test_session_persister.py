@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("redis")
+
+import session_persister
+from redis_client import CachedChat
+from session_persister import SessionPersister
+
+
+class FakeRedis:
+    is_connected = True
+
+    def __init__(self, read_error=None):
+        self.dirty = [("s1", "u1", 1.0), ("s2", "u1", 2.0)]
+        self.read_error = read_error
+        self.acked = []
+
+    async def get_dirty_sessions(self, count):
+        return self.dirty[:count]
+
+    async def get_many_chat_messages(self, sessions, raise_errors=False):
+        if self.read_error:
+            raise self.read_error
+        return [CachedChat(0, [{"role": "user", "content": sid, "seq": 0}], 1) for sid, _ in sessions]
+
+    async def ack_dirty_sessions(self, sessions):
+        self.acked.extend(sessions)
+        return len(sessions)
+
+
+class FakeDb:
+    is_connected = True
+
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.saved = []
+
+    async def save_chat_sessions(self, rows, attachments=None):
+        self.saved.extend(rows)
+        return self.ok
+
+
+def run_tick(monkeypatch, redis, db):
+    monkeypatch.setattr(session_persister, "redis_client", redis)
+    monkeypatch.setattr(session_persister, "db_client", db)
+    return asyncio.run(SessionPersister(batch_size=10, enabled=False).flush_once())
+
+
+def test_sessions_are_acked_after_save(monkeypatch):
+    redis, db = FakeRedis(), FakeDb()
+    assert run_tick(monkeypatch, redis, db) == 2
+    assert redis.acked == [("s1", "u1", 1), ("s2", "u1", 1)]
+
+
+def test_failed_read_leaves_sessions_dirty(monkeypatch):
+    redis, db = FakeRedis(read_error=ConnectionError("boom")), FakeDb()
+    with pytest.raises(ConnectionError):
+        run_tick(monkeypatch, redis, db)
+    assert redis.acked == [] and db.saved == []
+
+
+def test_failed_save_leaves_sessions_dirty(monkeypatch):
+    redis, db = FakeRedis(), FakeDb(ok=False)
+    assert run_tick(monkeypatch, redis, db) == 0
+    assert redis.acked == []
@@ -0,0 +1,53 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+pytest.importorskip("redis")
+
+from copilot import workspace_store as module
+from copilot.workspace_store import WorkspaceStore
+
+
+class FakeRedis:
+    is_connected = True
+
+    def __init__(self, manifests):
+        self.manifests = manifests
+
+    async def scan_keys(self, pattern):
+        return list(self.manifests) + ["workspace:u:w:version"]
+
+    async def hash_values_many(self, keys):
+        return [list(self.manifests.get(k, {}).values()) for k in keys]
+
+
+def put(store, content):
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    assert store.put_blob(content_hash, content)
+    os.utime(store._blob_path(content_hash), (0, 0))  # old enough for the sweep
+    return content_hash
+
+
+def test_gc_deletes_only_unreferenced_blobs(tmp_path, monkeypatch):
+    store = WorkspaceStore(blob_dir=str(tmp_path), gc_grace=60)
+    live, dead = put(store, "live"), put(store, "dead")
+    fresh = hashlib.sha256(b"fresh").hexdigest()
+    store.put_blob(fresh, "fresh")
+    monkeypatch.setattr(module, "redis_client", FakeRedis({"workspace:u:w": {"a.py": live}}))
+
+    assert asyncio.run(store.gc_blobs()) == 1
+    assert store.has_blob(live) and store.has_blob(fresh)
+    assert not store.has_blob(dead)
+
+
+def test_gc_does_nothing_without_redis(tmp_path, monkeypatch):
+    store = WorkspaceStore(blob_dir=str(tmp_path), gc_grace=0)
+    blob = put(store, "orphan")
+    redis = FakeRedis({})
+    redis.is_connected = False
+    monkeypatch.setattr(module, "redis_client", redis)
+
+    assert asyncio.run(store.gc_blobs()) == 0
+    assert store.has_blob(blob)
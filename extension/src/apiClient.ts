@@ -1,5 +1,7 @@
 import axios, { AxiosInstance, AxiosError } from "axios";
+import { StringDecoder } from "string_decoder";
 import { config } from "./config";
+import { CompletionSocket, SocketRequestError } from "./completionSocket";
 
 export type UploadFilePart = { 
   name: string; 
@@ -17,8 +19,82 @@ export interface CodeCompletionResponse {
   completion: string; 
 }
 
+export interface TextDocumentChange {
+  range?: {
+    start: { line: number; character: number };
+    end: { line: number; character: number };
+  };
+  text: string;
+}
+
+export interface DocumentSyncResponse {
+  document_id: string;
+  version: number;
+  length: number;
+}
+
+export interface WorkspaceFileEntry {
+  path: string;
+  hash: string;
+}
+
+export interface WorkspaceSyncResponse {
+  workspace_id: string;
+  missing: string[];
+  file_count: number;
+}
+
+export interface WorkspaceBlobUploadResponse {
+  workspace_id: string;
+  stored: number;
+  rejected: string[];
+}
+
+/** The caller aborted the request (e.g. VS Code cancelled the completion); not a failure. */
+export class RequestCancelledError extends Error {
+  constructor() {
+    super("Request cancelled");
+  }
+}
+
+/** Parse the /chat/stream SSE body: token events, then one done (or error) event. */
+async function readChatEvents(
+  stream: AsyncIterable<Buffer | string>,
+  onToken: (text: string) => void
+): Promise<ChatResponse> {
+  const decoder = new StringDecoder("utf8"); // keeps multi-byte characters split across chunks intact
+  let buffer = "";
+  for await (const chunk of stream) {
+    buffer += typeof chunk === "string" ? chunk : decoder.write(chunk);
+    let boundary: number;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      const data: string[] = [];
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trimStart());
+      }
+      if (!data.length) continue;
+
+      const payload = JSON.parse(data.join("\n"));
+      if (event === "token") {
+        onToken(payload.text || "");
+      } else if (event === "done") {
+        return payload as ChatResponse;
+      } else if (event === "error") {
+        throw new Error(payload.detail || "Chat stream failed");
+      }
+    }
+  }
+  throw new Error("Chat stream ended before the response was complete");
+}
+
 class ApiClient {
   private http: AxiosInstance;
+  private readonly socket = new CompletionSocket();
 
   constructor() {
     this.http = axios.create({
@@ -76,6 +152,9 @@ class ApiClient {
           } else {
             throw new Error('Request validation failed. Please check the data format.');
           }
+        } else if (error.response?.status === 429) {
+          const retryAfter = error.response.headers?.['retry-after'];
+          throw new Error(`Rate limit reached. Please wait ${retryAfter ?? 'a few'} seconds and try again.`);
         } else if (error.response?.status === 500) {
           throw new Error('Server error occurred. Please try again later.');
         }
@@ -85,33 +164,36 @@ class ApiClient {
     );
   }
 
+  private buildChatForm(text: string, files: UploadFilePart[], sessionId?: string): FormData {
+    // Always use form data to handle session_id consistently
+    const formData = new FormData();
+    formData.append("text", text || "");
+    formData.append("user_id", "sharif_200");
+    
+    // Add session_id if provided
+    if (sessionId) {
+      formData.append("session_id", sessionId);
+    }
+
+    // Add files to form data
+    if (files && files.length > 0) {
+      for (const file of files) {
+        const blob = new Blob([file.data], { 
+          type: file.type || "application/octet-stream" 
+        });
+        formData.append("files", blob, file.name);
+      }
+    }
+    return formData;
+  }
+
   async sendChatForm(text: string, files: UploadFilePart[] = [], sessionId?: string): Promise<ChatResponse> {
     try {
       const url = config.toUrl(config.chatPath);
       console.log(`[RaaS] Sending chat request to: ${url}`);
       console.log(`[RaaS] Session ID: ${sessionId}`);
-      
-      // Always use form data to handle session_id consistently
-      const formData = new FormData();
-      formData.append("text", text || "");
-      formData.append("user_id", "sharif_200");
-      
-      // Add session_id if provided
-      if (sessionId) {
-        formData.append("session_id", sessionId);
-      }
-
-      // Add files to form data
-      if (files && files.length > 0) {
-        for (const file of files) {
-          const blob = new Blob([file.data], { 
-            type: file.type || "application/octet-stream" 
-          });
-          formData.append("files", blob, file.name);
-        }
-      }
 
-      const { data } = await this.http.post<ChatResponse>(url, formData, {
+      const { data } = await this.http.post<ChatResponse>(url, this.buildChatForm(text, files, sessionId), {
         headers: {
           'Content-Type': 'multipart/form-data',
         }
@@ -123,8 +205,36 @@ class ApiClient {
     }
   }
 
+  /**
+   * Chat over the Server-Sent Events endpoint: `onToken` receives the response
+   * as it is generated; resolves with the final response once the turn is stored.
+   */
+  async streamChatForm(
+    text: string,
+    files: UploadFilePart[],
+    sessionId: string | undefined,
+    onToken: (text: string) => void
+  ): Promise<ChatResponse> {
+    try {
+      const url = config.toUrl(config.chatStreamPath);
+      console.log(`[RaaS] Streaming chat request to: ${url}`);
+
+      const res = await this.http.post(url, this.buildChatForm(text, files, sessionId), {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+          'Accept': 'text/event-stream',
+        },
+        responseType: "stream"
+      });
+      return await readChatEvents(res.data, onToken);
+    } catch (error: any) {
+      console.error('[RaaS] Chat stream failed:', error);
+      throw this.handleError(error);
+    }
+  }
+
   async completeCode(payload: {
-    text: string;
+    text?: string;
     language?: string;
     context?: { 
       before?: string; 
@@ -134,7 +244,12 @@ class ApiClient {
     };
     user_id?: string;
     file_path?: string;
-  }): Promise<CodeCompletionResponse> {
+    workspace_id?: string;
+    document_id?: string;
+    document_version?: number;
+    cursor_position?: { line: number; character: number };
+  }, options: { signal?: AbortSignal } = {}): Promise<CodeCompletionResponse> {
+    const { signal } = options;
     try {
       const url = config.toUrl(config.completionPath);
       console.log(`[RaaS] Sending completion request to: ${url}`);
@@ -146,19 +261,29 @@ class ApiClient {
       });
       
       // Build the request payload matching your backend schema
+      // With a mirrored document the server builds the code context itself
       const completionPayload = {
-        text: payload.text || "",
+        text: payload.document_id ? payload.text : (payload.text || ""),
         language: payload.language || "python",
         user_id: payload.user_id || "sharif_200",
         file_path: payload.file_path,
+        workspace_id: payload.workspace_id,
+        document_id: payload.document_id,
+        document_version: payload.document_version,
+        cursor_position: payload.cursor_position,
         context: payload.context || {}
       };
       
-      const { data } = await this.http.post<CodeCompletionResponse>(url, completionPayload, {
-        headers: {
-          'Content-Type': 'application/json',
-        }
-      });
+      const data = await this.viaSocket<CodeCompletionResponse>("complete", completionPayload, async () => {
+        // Aborting closes the connection; the server then cancels the model call
+        const res = await this.http.post<CodeCompletionResponse>(url, completionPayload, {
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          signal
+        });
+        return res.data;
+      }, signal);
 
       console.log(`[RaaS] Completion response:`, {
         completion_length: data.completion?.length || 0,
@@ -167,6 +292,9 @@ class ApiClient {
 
       return data;
     } catch (error: any) {
+      if (signal?.aborted || axios.isCancel(error)) {
+        throw new RequestCancelledError();
+      }
       console.error('[RaaS] Completion request failed:', error);
       console.error('[RaaS] Error details:', {
         status: error.response?.status,
@@ -177,6 +305,118 @@ class ApiClient {
     }
   }
 
+  async openDocument(payload: {
+    document_id: string;
+    version: number;
+    text: string;
+    language?: string;
+    file_path?: string;
+    workspace_id?: string;
+    user_id?: string;
+  }): Promise<DocumentSyncResponse> {
+    const body = { ...payload, user_id: payload.user_id || "sharif_111" };
+    return this.viaSocket<DocumentSyncResponse>("document.open", body, async () => {
+      const { data } = await this.http.post<DocumentSyncResponse>(config.toUrl(config.documentsPath + "/open"), body);
+      return data;
+    });
+  }
+
+  async changeDocument(payload: {
+    document_id: string;
+    base_version: number;
+    version: number;
+    changes: TextDocumentChange[];
+    user_id?: string;
+  }): Promise<DocumentSyncResponse> {
+    const body = { ...payload, user_id: payload.user_id || "sharif_111" };
+    return this.viaSocket<DocumentSyncResponse>("document.change", body, async () => {
+      const { data } = await this.http.post<DocumentSyncResponse>(config.toUrl(config.documentsPath + "/change"), body);
+      return data;
+    });
+  }
+
+  async closeDocument(documentId: string, userId: string = "sharif_111"): Promise<void> {
+    const body = { document_id: documentId, user_id: userId };
+    await this.viaSocket("document.close", body, () =>
+      this.http.post(config.toUrl(config.documentsPath + "/close"), body)
+    );
+  }
+
+  async syncWorkspace(payload: {
+    workspace_id: string;
+    files: WorkspaceFileEntry[];
+    removed?: string[];
+    full_snapshot?: boolean;
+    user_id?: string;
+  }): Promise<WorkspaceSyncResponse> {
+    try {
+      const { data } = await this.http.post<WorkspaceSyncResponse>(
+        config.toUrl(config.workspaceSyncPath),
+        {
+          user_id: payload.user_id || "sharif_111",
+          workspace_id: payload.workspace_id,
+          files: payload.files,
+          removed: payload.removed || [],
+          full_snapshot: !!payload.full_snapshot
+        }
+      );
+      return data;
+    } catch (error: any) {
+      console.error('[RaaS] Workspace sync failed:', error);
+      throw this.handleError(error);
+    }
+  }
+
+  async uploadWorkspaceBlobs(payload: {
+    workspace_id: string;
+    blobs: { hash: string; content: string }[];
+    user_id?: string;
+  }): Promise<WorkspaceBlobUploadResponse> {
+    try {
+      const { data } = await this.http.post<WorkspaceBlobUploadResponse>(
+        config.toUrl(config.workspaceBlobsPath),
+        {
+          user_id: payload.user_id || "sharif_111",
+          workspace_id: payload.workspace_id,
+          blobs: payload.blobs
+        }
+      );
+      return data;
+    } catch (error: any) {
+      console.error('[RaaS] Blob upload failed:', error);
+      throw this.handleError(error);
+    }
+  }
+
+  /**
+   * Send a frame over the persistent completion socket, falling back to HTTP
+   * when the socket cannot be used. Errors answered by the server are not retried.
+   */
+  private async viaSocket<T>(
+    type: string,
+    payload: Record<string, any>,
+    http: () => Promise<T>,
+    signal?: AbortSignal
+  ): Promise<T> {
+    if (this.socket.available) {
+      try {
+        const { result } = await this.socket.request(type, payload, { signal });
+        const { type: _type, id: _id, ...body } = await result;
+        return body as T;
+      } catch (error) {
+        if (error instanceof SocketRequestError && error.status) {
+          throw error;
+        }
+        // Connection-level failure: retry this request over HTTP
+      }
+    }
+    return http();
+  }
+
+  dispose(): void {
+    this.socket.dispose();
+  }
+
   private handleError(error: any): Error {
     if (error.response?.data?.message) {
       return new Error(error.response.data.message);
@@ -1,6 +1,7 @@
 import * as vscode from "vscode";
 import * as fs from "fs";
 import { apiClient, UploadFilePart, ChatResponse } from "../apiClient";
+import { config } from "../config";
 
 export class RaasChatViewProvider implements vscode.WebviewViewProvider {
   public static readonly viewType = "raasChatView";
@@ -44,12 +45,16 @@ export class RaasChatViewProvider implements vscode.WebviewViewProvider {
 
         console.log(`[RaaS] Processing: text=${!!message.text}, files=${files.length}, session=${sessionId}`);
 
-        // Pass session ID to API client
-        const res: ChatResponse = await apiClient.sendChatForm(
-          message.text || "", 
-          files, 
-          sessionId
-        );
+        // Pass session ID to API client; when streaming, tokens are rendered as they arrive
+        const res: ChatResponse = config.streamChat
+          ? await apiClient.streamChatForm(message.text || "", files, sessionId, text =>
+              webview.postMessage({ type: "token", text })
+            )
+          : await apiClient.sendChatForm(
+              message.text || "", 
+              files, 
+              sessionId
+            );
 
         // Update our session ID if the server returned one
         if (res.session_id) {
@@ -1,10 +1,18 @@
 import * as vscode from "vscode";
-import { apiClient } from "../apiClient";
+import { RequestCancelledError } from "../apiClient";
 import { config } from "../config";
+import { WorkspaceSync } from "../workspace/workspaceSync";
+import { DocumentSync } from "./documentSync";
+import { requestCompletion } from "./completionRequest";
 
 export class RaaSCompletionProvider implements vscode.CompletionItemProvider {
   private lastRequest = 0;
 
+  constructor(
+    private readonly workspaceSync?: WorkspaceSync,
+    private readonly documentSync?: DocumentSync
+  ) {}
+
   async provideCompletionItems(
     document: vscode.TextDocument, 
     position: vscode.Position,
@@ -25,34 +33,16 @@ export class RaaSCompletionProvider implements vscode.CompletionItemProvider {
     }
 
     try {
-      // Get surrounding context (more context for better completions)
-      const beforeRange = new vscode.Range(
-        new vscode.Position(Math.max(0, position.line - 10), 0), 
-        position
-      );
-      const afterRange = new vscode.Range(
-        position, 
-        new vscode.Position(Math.min(document.lineCount - 1, position.line + 5), 0)
-      );
-
-      const beforeText = document.getText(beforeRange);
-      const afterText = document.getText(afterRange);
-      const fullText = beforeText + afterText;
-
       console.log(`[RaaS Completion] Language: ${document.languageId}, Position: ${position.line}:${position.character}`);
 
-      // Call completion API with proper payload
-      const response = await apiClient.completeCode({
-        text: fullText,
-        language: document.languageId,
-        context: {
-          before: beforeText,
-          after: afterText,
-          line: position.line,
-          mode: "completion" // Indicate this is standard completion
-        },
-        user_id: "sharif_111", // Add user_id if required by your API
-        file_path: document.uri.fsPath // Add file path for project context
+      // Call completion API (more context for better completions)
+      const response = await requestCompletion(document, position, {
+        mode: "completion", // Indicate this is standard completion
+        linesBefore: 10,
+        linesAfter: 5,
+        documentSync: this.documentSync,
+        workspaceSync: this.workspaceSync,
+        token
       });
 
       const completionText = (response.completion || "").trim();
@@ -81,6 +71,9 @@ export class RaaSCompletionProvider implements vscode.CompletionItemProvider {
       return [item];
 
     } catch (error) {
+      if (error instanceof RequestCancelledError) {
+        return [];
+      }
       console.error(`[RaaS Completion] Error:`, error);
       // Return empty array instead of throwing
       return [];
@@ -0,0 +1,96 @@
+import * as vscode from "vscode";
+import { apiClient, CodeCompletionResponse, RequestCancelledError } from "../apiClient";
+import { DocumentSync } from "./documentSync";
+import { WorkspaceSync } from "../workspace/workspaceSync";
+
+export interface CompletionRequestOptions {
+  mode: string;
+  linesBefore: number;
+  linesAfter: number;
+  documentSync?: DocumentSync;
+  workspaceSync?: WorkspaceSync;
+  token?: vscode.CancellationToken;
+}
+
+/**
+ * Request a completion at `position`.
+ * Uses the server-side document mirror when it is in sync (only version +
+ * cursor are sent); otherwise, or when the mirrored request fails, sends the
+ * surrounding lines as before.
+ * Cancelling `token` aborts the request, which also stops the server-side
+ * model call; the promise then rejects with RequestCancelledError.
+ */
+export async function requestCompletion(
+  document: vscode.TextDocument,
+  position: vscode.Position,
+  options: CompletionRequestOptions
+): Promise<CodeCompletionResponse> {
+  const fileInfo = options.workspaceSync?.describe(document) ?? { file_path: document.uri.fsPath };
+  const controller = new AbortController();
+  const subscription = options.token?.onCancellationRequested(() => controller.abort());
+  try {
+    return await send(document, position, options, fileInfo, controller.signal);
+  } finally {
+    subscription?.dispose();
+  }
+}
+
+async function send(
+  document: vscode.TextDocument,
+  position: vscode.Position,
+  options: CompletionRequestOptions,
+  fileInfo: { file_path: string; workspace_id?: string },
+  signal: AbortSignal
+): Promise<CodeCompletionResponse> {
+  if (options.token?.isCancellationRequested) {
+    throw new RequestCancelledError();
+  }
+
+  if (options.documentSync && await options.documentSync.ensureSynced(document)) {
+    try {
+      return await apiClient.completeCode({
+        language: document.languageId,
+        document_id: document.uri.toString(),
+        document_version: document.version,
+        cursor_position: { line: position.line, character: position.character },
+        context: {
+          line: position.line,
+          mode: options.mode
+        },
+        user_id: "sharif_111",
+        ...fileInfo
+      }, { signal });
+    } catch (error) {
+      if (error instanceof RequestCancelledError) throw error;
+      // Mirror may be gone (eviction, server restart, another worker): re-open on the
+      // next request and answer this one from the surrounding lines below
+      options.documentSync.invalidate(document);
+      console.warn("[RaaS] Mirrored completion failed, retrying with full context:", error);
+    }
+  }
+
+  const beforeRange = new vscode.Range(
+    new vscode.Position(Math.max(0, position.line - options.linesBefore), 0),
+    position
+  );
+  const afterRange = new vscode.Range(
+    position,
+    new vscode.Position(Math.min(document.lineCount - 1, position.line + options.linesAfter), 0)
+  );
+
+  const beforeText = document.getText(beforeRange);
+  const afterText = document.getText(afterRange);
+
+  return apiClient.completeCode({
+    text: beforeText + afterText,
+    language: document.languageId,
+    context: {
+      before: beforeText,
+      after: afterText,
+      line: position.line,
+      mode: options.mode
+    },
+    user_id: "sharif_111",
+    ...fileInfo
+  }, { signal });
+}
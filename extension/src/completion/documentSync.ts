@@ -0,0 +1,110 @@
+import * as vscode from "vscode";
+import { apiClient, TextDocumentChange } from "../apiClient";
+import { config } from "../config";
+import { WorkspaceSync } from "../workspace/workspaceSync";
+
+interface MirrorState {
+  version: number;                // version the server has
+  pending: TextDocumentChange[];  // edits not sent yet, based on `version`
+  pendingVersion: number;         // document version after the pending edits
+}
+
+/**
+ * Keeps a server-side mirror of documents that completions are requested in.
+ *
+ * A document is opened on the server (full text) the first time it needs a
+ * completion; after that only incremental edits are sent, batched up until
+ * the next completion request. Completion requests then carry just the
+ * document id, version and cursor position.
+ */
+export class DocumentSync implements vscode.Disposable {
+  private readonly mirrored = new Map<string, MirrorState>();
+  private readonly queue = new Map<string, Promise<boolean>>();
+  private readonly disposables: vscode.Disposable[] = [];
+
+  constructor(private readonly workspaceSync?: WorkspaceSync) {
+    this.disposables.push(
+      vscode.workspace.onDidChangeTextDocument(e => this.onChange(e)),
+      vscode.workspace.onDidCloseTextDocument(doc => this.onClose(doc))
+    );
+  }
+
+  /** Bring the server mirror up to `document.version`; false means send the full context instead. */
+  ensureSynced(document: vscode.TextDocument): Promise<boolean> {
+    if (!config.documentSync) return Promise.resolve(false);
+    const key = document.uri.toString();
+    // One sync at a time per document so edits reach the server in order
+    const previous = this.queue.get(key) ?? Promise.resolve(true);
+    const next = previous.then(() => this.sync(document), () => this.sync(document));
+    this.queue.set(key, next);
+    return next;
+  }
+
+  /** Forget the mirror (e.g. after the server rejected it); the next completion re-opens it. */
+  invalidate(document: vscode.TextDocument): void {
+    this.mirrored.delete(document.uri.toString());
+  }
+
+  dispose(): void {
+    this.disposables.forEach(d => d.dispose());
+  }
+
+  private onChange(e: vscode.TextDocumentChangeEvent): void {
+    const state = this.mirrored.get(e.document.uri.toString());
+    if (!state || !e.contentChanges.length) return;
+    for (const c of e.contentChanges) {
+      state.pending.push({
+        range: {
+          start: { line: c.range.start.line, character: c.range.start.character },
+          end: { line: c.range.end.line, character: c.range.end.character }
+        },
+        text: c.text
+      });
+    }
+    state.pendingVersion = e.document.version;
+  }
+
+  private onClose(document: vscode.TextDocument): void {
+    const key = document.uri.toString();
+    this.queue.delete(key);
+    if (this.mirrored.delete(key)) {
+      apiClient.closeDocument(key).catch(() => { /* server evicts idle documents anyway */ });
+    }
+  }
+
+  private async sync(document: vscode.TextDocument): Promise<boolean> {
+    const key = document.uri.toString();
+    let state = this.mirrored.get(key);
+    try {
+      if (!state) {
+        // Register before awaiting so edits made meanwhile queue up as pending
+        const text = document.getText();
+        state = { version: document.version, pending: [], pendingVersion: document.version };
+        this.mirrored.set(key, state);
+        await apiClient.openDocument({
+          document_id: key,
+          version: state.version,
+          text,
+          language: document.languageId,
+          ...(this.workspaceSync?.describe(document) ?? { file_path: document.uri.fsPath })
+        });
+      } else if (state.pending.length) {
+        const changes = state.pending;
+        const version = state.pendingVersion;
+        state.pending = [];
+        await apiClient.changeDocument({
+          document_id: key,
+          base_version: state.version,
+          version,
+          changes
+        });
+        state.version = version;
+      }
+      return state.version === document.version && !state.pending.length;
+    } catch (err) {
+      console.warn(`[RaaS DocumentSync] Sync failed for ${key}, falling back to full context:`, err);
+      this.mirrored.delete(key);
+      return false;
+    }
+  }
+}
@@ -1,11 +1,19 @@
 import * as vscode from "vscode";
-import { apiClient } from "../apiClient";
+import { RequestCancelledError } from "../apiClient";
 import { config } from "../config";
+import { WorkspaceSync } from "../workspace/workspaceSync";
+import { DocumentSync } from "./documentSync";
+import { requestCompletion } from "./completionRequest";
 
 export class RaaSInlineCompletionProvider implements vscode.InlineCompletionItemProvider {
   private lastRequest = 0;
   private readonly minTriggerLength = 3; // Don't suggest on very short input
 
+  constructor(
+    private readonly workspaceSync?: WorkspaceSync,
+    private readonly documentSync?: DocumentSync
+  ) {}
+
   async provideInlineCompletionItems(
     document: vscode.TextDocument,
     position: vscode.Position,
@@ -34,34 +42,16 @@ export class RaaSInlineCompletionProvider implements vscode.InlineCompletionItem
     }
 
     try {
-      // Get more context for inline completions
-      const beforeRange = new vscode.Range(
-        new vscode.Position(Math.max(0, position.line - 15), 0),
-        position
-      );
-      const afterRange = new vscode.Range(
-        position,
-        new vscode.Position(Math.min(document.lineCount - 1, position.line + 3), 0)
-      );
-
-      const beforeText = document.getText(beforeRange);
-      const afterText = document.getText(afterRange);
-      const fullText = beforeText + afterText;
-
       console.log(`[RaaS Inline] Language: ${document.languageId}, Trigger: "${beforeCursor.slice(-10)}"`);
 
-      // Call completion API
-      const response = await apiClient.completeCode({
-        text: fullText,
-        language: document.languageId,
-        context: {
-          before: beforeText,
-          after: afterText,
-          line: position.line,
-          mode: "inline" // Indicate this is inline completion
-        },
-        user_id: "sharif_111",
-        file_path: document.uri.fsPath
+      // Call completion API (more context for inline completions)
+      const response = await requestCompletion(document, position, {
+        mode: "inline", // Indicate this is inline completion
+        linesBefore: 15,
+        linesAfter: 3,
+        documentSync: this.documentSync,
+        workspaceSync: this.workspaceSync,
+        token
       });
 
       const completionText = (response.completion || "").trim();
@@ -82,6 +72,9 @@ export class RaaSInlineCompletionProvider implements vscode.InlineCompletionItem
       return { items: [item] };
 
     } catch (error) {
+      if (error instanceof RequestCancelledError) {
+        return { items: [] };
+      }
       console.error(`[RaaS Inline] Error:`, error);
       return { items: [] };
     }
@@ -0,0 +1,142 @@
+import WebSocket from "ws";
+import { config } from "./config";
+
+type Frame = { type: string; id?: string | null; [key: string]: any };
+
+interface PendingRequest {
+  resolve: (frame: Frame) => void;
+  reject: (error: Error) => void;
+  timer: NodeJS.Timeout;
+  cleanup?: () => void;
+}
+
+export class SocketRequestError extends Error {
+  constructor(message: string, readonly status?: number) {
+    super(message);
+  }
+}
+
+const RECONNECT_BACKOFF_MS = 30000;
+
+/**
+ * One long-lived WebSocket to the backend, multiplexing completion requests,
+ * cancellations and document-mirror updates by request id.
+ * Connects lazily; after a failed connect it stays down for a while and
+ * callers fall back to HTTP.
+ */
+export class CompletionSocket {
+  private ws?: WebSocket;
+  private connecting?: Promise<WebSocket>;
+  private readonly pending = new Map<string, PendingRequest>();
+  private nextId = 0;
+  private downUntil = 0;
+
+  get available(): boolean {
+    return config.useWebSocket && Date.now() >= this.downUntil;
+  }
+
+  /** Send a frame and resolve with its result/ack frame. */
+  async request(
+    type: string,
+    payload: Record<string, any>,
+    options: { timeoutMs?: number; signal?: AbortSignal } = {}
+  ): Promise<{ id: string; result: Promise<Frame> }> {
+    const { signal } = options;
+    const ws = await this.connect();
+    if (signal?.aborted) {
+      throw new SocketRequestError("Request cancelled", 499);
+    }
+    const id = `${Date.now().toString(36)}-${(this.nextId++).toString(36)}`;
+
+    const result = new Promise<Frame>((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.cancel(id);
+        this.settle(id, undefined, new SocketRequestError("Request timed out", 408));
+      }, options.timeoutMs ?? config.timeout);
+      const onAbort = () => this.cancel(id);
+      signal?.addEventListener("abort", onAbort, { once: true });
+      this.pending.set(id, {
+        resolve,
+        reject,
+        timer,
+        cleanup: signal ? () => signal.removeEventListener("abort", onAbort) : undefined
+      });
+    });
+
+    ws.send(JSON.stringify({ type, id, payload }));
+    return { id, result };
+  }
+
+  /** Ask the server to stop working on a request; its promise rejects with status 499. */
+  cancel(id: string): void {
+    if (this.ws?.readyState === WebSocket.OPEN && this.pending.has(id)) {
+      this.ws.send(JSON.stringify({ type: "cancel", id }));
+    }
+    this.settle(id, undefined, new SocketRequestError("Request cancelled", 499));
+  }
+
+  dispose(): void {
+    this.ws?.close();
+    this.ws = undefined;
+  }
+
+  private connect(): Promise<WebSocket> {
+    if (this.ws?.readyState === WebSocket.OPEN) return Promise.resolve(this.ws);
+    if (this.connecting) return this.connecting;
+
+    const url = config.toUrl(config.completionSocketPath).replace(/^http/i, "ws");
+    this.connecting = new Promise<WebSocket>((resolve, reject) => {
+      const ws = new WebSocket(url, { headers: { "User-Agent": "VSCode-RaaS-Extension/1.0.0" } });
+      ws.once("open", () => {
+        console.log(`[RaaS] Completion socket connected: ${url}`);
+        this.ws = ws;
+        resolve(ws);
+      });
+      ws.on("error", err => {
+        // Also fires after a dropped connection; "close" follows and fails pending requests
+        console.warn(`[RaaS] Completion socket error, using HTTP: ${err.message}`);
+        this.downUntil = Date.now() + RECONNECT_BACKOFF_MS;
+        reject(err);
+      });
+      ws.on("message", data => this.onMessage(String(data)));
+      ws.on("close", () => {
+        if (this.ws === ws) this.ws = undefined;
+        for (const id of Array.from(this.pending.keys())) {
+          this.settle(id, undefined, new SocketRequestError("Completion socket closed"));
+        }
+      });
+    }).finally(() => {
+      this.connecting = undefined;
+    });
+    return this.connecting;
+  }
+
+  private onMessage(raw: string): void {
+    let frame: Frame;
+    try {
+      frame = JSON.parse(raw);
+    } catch {
+      return;
+    }
+    if (!frame.id) return; // pong / connection-level errors
+
+    if (frame.type === "error") {
+      const detail = typeof frame.detail === "string" ? frame.detail : JSON.stringify(frame.detail);
+      this.settle(frame.id, undefined, new SocketRequestError(detail, frame.status));
+    } else if (frame.type === "cancelled") {
+      this.settle(frame.id, undefined, new SocketRequestError("Request cancelled", 499));
+    } else {
+      this.settle(frame.id, frame);
+    }
+  }
+
+  private settle(id: string, frame?: Frame, error?: Error): void {
+    const entry = this.pending.get(id);
+    if (!entry) return;
+    this.pending.delete(id);
+    clearTimeout(entry.timer);
+    entry.cleanup?.();
+    if (error) entry.reject(error);
+    else entry.resolve(frame!);
+  }
+}
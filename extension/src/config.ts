@@ -13,6 +13,14 @@ export const config = {
     return vscode.workspace.getConfiguration("raas")
       .get<string>("chatPath", "/api/v1/chat/form");
   },
+  get streamChat(): boolean {
+    return vscode.workspace.getConfiguration("raas")
+      .get<boolean>("streamChat", true);
+  },
+  get chatStreamPath(): string {
+    return vscode.workspace.getConfiguration("raas")
+      .get<string>("chatStreamPath", "/api/v1/chat/stream");
+  },
   get completionPath(): string {
     return vscode.workspace.getConfiguration("raas")
       .get<string>("completionPath", "/api/v1/code-completion");
@@ -21,6 +29,34 @@ export const config = {
     return vscode.workspace.getConfiguration("raas")
       .get<number>("timeout", 100000);
   },
+  get useWebSocket(): boolean {
+    return vscode.workspace.getConfiguration("raas")
+      .get<boolean>("useWebSocket", true);
+  },
+  get completionSocketPath(): string {
+    return vscode.workspace.getConfiguration("raas")
+      .get<string>("completionSocketPath", "/api/v1/ws/completions");
+  },
+  get documentsPath(): string {
+    return vscode.workspace.getConfiguration("raas")
+      .get<string>("documentsPath", "/api/v1/documents");
+  },
+  get documentSync(): boolean {
+    return vscode.workspace.getConfiguration("raas")
+      .get<boolean>("documentSync", true);
+  },
+  get workspaceSync(): boolean {
+    return vscode.workspace.getConfiguration("raas")
+      .get<boolean>("workspaceSync", true);
+  },
+  get workspaceSyncPath(): string {
+    return vscode.workspace.getConfiguration("raas")
+      .get<string>("workspaceSyncPath", "/api/v1/workspace/sync");
+  },
+  get workspaceBlobsPath(): string {
+    return vscode.workspace.getConfiguration("raas")
+      .get<string>("workspaceBlobsPath", "/api/v1/workspace/blobs");
+  },
   get debounceMs(): number {
     return vscode.workspace.getConfiguration("raas")
       .get<number>("debounceMs", 300);
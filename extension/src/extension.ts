@@ -3,6 +3,8 @@ import { RaasChatViewProvider } from "./chat/chatViewProviders";
 import { RaaSCompletionProvider } from "./completion/completionProvider";
 import { RaaSInlineCompletionProvider } from "./completion/inlineProvider";
 import { apiClient } from "./apiClient";
+import { WorkspaceSync } from "./workspace/workspaceSync";
+import { DocumentSync } from "./completion/documentSync";
 
 export function activate(context: vscode.ExtensionContext) {
   console.log("[RaaS] Extension activating...");
@@ -33,9 +35,18 @@ export function activate(context: vscode.ExtensionContext) {
   // ---- Trigger characters
   const triggers = [".", " ", "=", ":", "(", "[", "{", ",", "'", "\"", ">", "<", "/"];
 
+  // ---- Workspace snapshot sync (project context for remote servers)
+  const workspaceSync = new WorkspaceSync();
+  context.subscriptions.push(workspaceSync);
+  workspaceSync.start();
+
+  // ---- Server-side document mirror (incremental edits instead of full context)
+  const documentSync = new DocumentSync(workspaceSync);
+  context.subscriptions.push(documentSync);
+
   // ---- Register providers
-  const completionProvider = new RaaSCompletionProvider();
-  const inlineProvider = new RaaSInlineCompletionProvider();
+  const completionProvider = new RaaSCompletionProvider(workspaceSync, documentSync);
+  const inlineProvider = new RaaSInlineCompletionProvider(workspaceSync, documentSync);
 
   context.subscriptions.push(
     vscode.languages.registerCompletionItemProvider(
@@ -141,5 +152,6 @@ export function activate(context: vscode.ExtensionContext) {
 }
 
 export function deactivate() {
+  apiClient.dispose();
   console.log("[RaaS] Extension deactivated");
 }
\ No newline at end of file
@@ -0,0 +1,187 @@
+import * as vscode from "vscode";
+import * as crypto from "crypto";
+import { apiClient, WorkspaceFileEntry } from "../apiClient";
+import { config } from "../config";
+
+const INCLUDE_GLOB = "**/*.{py,js,jsx,mjs,cjs,ts,tsx,java,cpp,cc,cxx,hpp,hh,hxx,c,h,cs,go,rs,php,rb,sql,swift,scala,html,css,kt,kts,dart,json,yaml,yml,md}";
+const EXCLUDE_GLOB = "**/{node_modules,.git,out,dist,build,__pycache__,.venv,venv}/**";
+const MAX_FILES = 5000;
+const MAX_FILE_BYTES = 1024 * 1024;
+const BLOB_BATCH_BYTES = 2 * 1024 * 1024;
+const DELTA_DEBOUNCE_MS = 1000;
+
+/**
+ * Pushes a content-addressed snapshot of the workspace to the server.
+ *
+ * The first sync sends the full (path, sha256) manifest; the server answers
+ * with the hashes it lacks and only those blobs are uploaded. After that,
+ * saves/creates/deletes are batched into delta syncs.
+ */
+export class WorkspaceSync implements vscode.Disposable {
+  private readonly hashes = new Map<string, string>(); // relative path -> sha256
+  private readonly dirty = new Set<string>();
+  private readonly removed = new Set<string>();
+  private readonly disposables: vscode.Disposable[] = [];
+  private deltaTimer?: NodeJS.Timeout;
+  private ready = false;
+  private syncing: Promise<void> = Promise.resolve();
+
+  readonly workspaceId?: string;
+  private readonly root?: vscode.Uri;
+
+  constructor() {
+    const folder = vscode.workspace.workspaceFolders?.[0];
+    if (folder) {
+      this.root = folder.uri;
+      this.workspaceId = crypto.createHash("sha256")
+        .update(folder.uri.toString())
+        .digest("hex")
+        .slice(0, 16);
+    }
+  }
+
+  start(): void {
+    if (!config.workspaceSync || !this.root || !this.workspaceId) return;
+
+    const watcher = vscode.workspace.createFileSystemWatcher(INCLUDE_GLOB);
+    this.disposables.push(
+      watcher,
+      watcher.onDidChange(uri => this.markDirty(uri)),
+      watcher.onDidCreate(uri => this.markDirty(uri)),
+      watcher.onDidDelete(uri => this.markRemoved(uri))
+    );
+
+    this.syncing = this.fullSync().catch(err => {
+      console.error("[RaaS Workspace] Full sync failed:", err);
+    });
+  }
+
+  /** Completion request fields: workspace-relative path once the snapshot is on the server. */
+  describe(document: vscode.TextDocument): { file_path: string; workspace_id?: string } {
+    const rel = this.relativePath(document.uri);
+    if (this.ready && rel && this.workspaceId) {
+      return { file_path: rel, workspace_id: this.workspaceId };
+    }
+    return { file_path: document.uri.fsPath };
+  }
+
+  dispose(): void {
+    if (this.deltaTimer) clearTimeout(this.deltaTimer);
+    this.disposables.forEach(d => d.dispose());
+  }
+
+  private relativePath(uri: vscode.Uri): string | undefined {
+    if (!this.root || uri.scheme !== "file") return undefined;
+    const rel = vscode.workspace.asRelativePath(uri, false);
+    return rel === uri.fsPath ? undefined : rel.replace(/\\/g, "/");
+  }
+
+  private async readFile(uri: vscode.Uri): Promise<{ content: string; hash: string } | undefined> {
+    try {
+      const bytes = await vscode.workspace.fs.readFile(uri);
+      if (bytes.byteLength > MAX_FILE_BYTES) return undefined;
+      const content = Buffer.from(bytes).toString("utf-8");
+      // Hash the re-encoded text so it matches what the server verifies
+      const hash = crypto.createHash("sha256").update(content, "utf-8").digest("hex");
+      return { content, hash };
+    } catch {
+      return undefined;
+    }
+  }
+
+  private async fullSync(): Promise<void> {
+    const uris = await vscode.workspace.findFiles(INCLUDE_GLOB, EXCLUDE_GLOB, MAX_FILES);
+    const files: WorkspaceFileEntry[] = [];
+    for (const uri of uris) {
+      const rel = this.relativePath(uri);
+      const file = rel ? await this.readFile(uri) : undefined;
+      if (!rel || !file) continue;
+      this.hashes.set(rel, file.hash);
+      files.push({ path: rel, hash: file.hash });
+    }
+
+    const res = await apiClient.syncWorkspace({
+      workspace_id: this.workspaceId!,
+      files,
+      full_snapshot: true
+    });
+    await this.uploadMissing(res.missing);
+    this.ready = true;
+    console.log(`[RaaS Workspace] Full sync: ${res.file_count} files, uploaded ${res.missing.length} blobs`);
+  }
+
+  private markDirty(uri: vscode.Uri): void {
+    const rel = this.relativePath(uri);
+    if (!rel) return;
+    this.removed.delete(rel);
+    this.dirty.add(rel);
+    this.scheduleDelta();
+  }
+
+  private markRemoved(uri: vscode.Uri): void {
+    const rel = this.relativePath(uri);
+    if (!rel) return;
+    this.dirty.delete(rel);
+    if (this.hashes.delete(rel)) {
+      this.removed.add(rel);
+      this.scheduleDelta();
+    }
+  }
+
+  private scheduleDelta(): void {
+    if (this.deltaTimer) clearTimeout(this.deltaTimer);
+    this.deltaTimer = setTimeout(() => {
+      this.syncing = this.syncing
+        .then(() => this.deltaSync())
+        .catch(err => console.error("[RaaS Workspace] Delta sync failed:", err));
+    }, DELTA_DEBOUNCE_MS);
+  }
+
+  private async deltaSync(): Promise<void> {
+    const changed = Array.from(this.dirty);
+    const removed = Array.from(this.removed);
+    this.dirty.clear();
+    this.removed.clear();
+
+    const files: WorkspaceFileEntry[] = [];
+    for (const rel of changed) {
+      const file = await this.readFile(vscode.Uri.joinPath(this.root!, rel));
+      if (!file || this.hashes.get(rel) === file.hash) continue; // unchanged content
+      this.hashes.set(rel, file.hash);
+      files.push({ path: rel, hash: file.hash });
+    }
+    if (!files.length && !removed.length) return;
+
+    const res = await apiClient.syncWorkspace({
+      workspace_id: this.workspaceId!,
+      files,
+      removed
+    });
+    await this.uploadMissing(res.missing);
+    console.log(`[RaaS Workspace] Delta sync: ${files.length} changed, ${removed.length} removed`);
+  }
+
+  private async uploadMissing(missing: string[]): Promise<void> {
+    if (!missing.length) return;
+    const wanted = new Set(missing);
+
+    let batch: { hash: string; content: string }[] = [];
+    let batchBytes = 0;
+    const flush = async () => {
+      if (!batch.length) return;
+      await apiClient.uploadWorkspaceBlobs({ workspace_id: this.workspaceId!, blobs: batch });
+      batch = [];
+      batchBytes = 0;
+    };
+
+    for (const [rel, hash] of this.hashes) {
+      if (!wanted.delete(hash)) continue;
+      const file = await this.readFile(vscode.Uri.joinPath(this.root!, rel));
+      if (!file || file.hash !== hash) continue; // changed since; next delta covers it
+      batch.push({ hash, content: file.content });
+      batchBytes += file.content.length;
+      if (batchBytes >= BLOB_BATCH_BYTES) await flush();
+    }
+    await flush();
+  }
+}